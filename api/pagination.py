@@ -0,0 +1,17 @@
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Seek on the view's `ordering` instead of OFFSET, and skip the COUNT(*)
+    that page number pagination runs for every page.
+    """
+
+    ordering = "-pk"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        # Each viewset declares the indexed columns its pages seek on.
+        self.ordering = getattr(view, "ordering", self.ordering)
+        return super().get_ordering(request, queryset, view)
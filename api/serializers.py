@@ -1,21 +1,85 @@
+from typing import Optional, Set
+
 from rest_framework import serializers
 
 from base.models import Classroom, Topic, User
 
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
+def requested_fields(request) -> Optional[Set[str]]:
+    """
+    The `?fields=a,b` sparse fieldset of the request, or `None` for all.
+    """
+    if request is None or not request.query_params.get("fields"):
+        return None
+    return {name.strip() for name in request.query_params["fields"].split(",")}
+
+
+class SparseFieldsetMixin:
+    """
+    Drop every field the client didn't ask for with `?fields=`, so neither
+    the serializer nor the queryset does work for them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get("request"))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class TemplatedIdentityField(serializers.HyperlinkedIdentityField):
+    """
+    Reverse the detail route once per serializer and fill in each pk,
+    instead of resolving the URLconf for every row.
+    """
+
+    placeholder = "__pk__"
+
+    def get_url(self, obj, view_name, request, format):
+        if obj.pk is None:
+            return None
+        templates = self.__dict__.setdefault("_templates", {})
+        if format not in templates:
+            templates[format] = self.reverse(
+                view_name,
+                kwargs={self.lookup_url_kwarg: self.placeholder},
+                request=request,
+                format=format,
+            )
+        return templates[format].replace(self.placeholder, str(obj.pk))
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.HyperlinkedModelSerializer):
+    serializer_url_field = TemplatedIdentityField
+    classroom_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = User
-        fields = ["url", "username", "bio", "avatar"]
+        fields = ["url", "username", "bio", "avatar", "classroom_count"]
 
 
-class TopicSerializer(serializers.HyperlinkedModelSerializer):
+class TopicSerializer(SparseFieldsetMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Topic
-        fields = ["name"]
+        fields = ["name", "classroom_count"]
+
 
+class ClassroomSerializer(SparseFieldsetMixin, serializers.HyperlinkedModelSerializer):
+    host = serializers.CharField(
+        source="host.username", read_only=True, allow_null=True
+    )
+    topic = serializers.CharField(source="topic.name", read_only=True, allow_null=True)
 
-class ClassroomSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Classroom
-        fields = ["name", "description", "created", "updated"]
+        fields = [
+            "name",
+            "description",
+            "host",
+            "topic",
+            "student_count",
+            "message_count",
+            "created",
+            "updated",
+        ]
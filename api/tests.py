@@ -1,3 +1,125 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from base.models import Classroom, Topic, User
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reader", email="r@jazbahana.invalid")
+        self.client.force_login(self.user)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def pages(self, url, **params):
+        page = self.get(url, **params)
+        results = list(page["results"])
+        while page["next"]:
+            page = self.get(page["next"])
+            results += page["results"]
+        return results
+
+
+class CursorPaginationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        topic = Topic.objects.create(name="paging")
+        Classroom.objects.bulk_create(
+            Classroom(host=self.user, topic=topic, name=f"classroom-{i:02}")
+            for i in range(25)
+        )
+        # Several rows share a timestamp, so pages must break ties on pk.
+        now = timezone.now()
+        for i, pk in enumerate(Classroom.objects.values_list("pk", flat=True)):
+            Classroom.objects.filter(pk=pk).update(
+                updated=now - timedelta(minutes=i // 4), created=now
+            )
+
+    def test_pages_have_no_count_and_link_the_next(self):
+        page = self.get("/api/v1/classrooms/", page_size=10)
+        self.assertNotIn("count", page)
+        self.assertEqual(len(page["results"]), 10)
+        self.assertIsNone(page["previous"])
+        self.assertIn("cursor=", page["next"])
+
+    def test_pages_cover_every_row_once_in_order(self):
+        names = [row["name"] for row in self.pages("/api/v1/classrooms/", page_size=10)]
+        expected = list(
+            Classroom.objects.order_by("-updated", "-created", "-pk").values_list(
+                "name", flat=True
+            )
+        )
+        self.assertEqual(names, expected)
+
+    def test_rows_inserted_between_pages_do_not_shift_them(self):
+        first = self.get("/api/v1/classrooms/", page_size=10)
+        Classroom.objects.create(host=self.user, name="newest")
+        names = [row["name"] for row in first["results"]]
+        page = first
+        while page["next"]:
+            page = self.get(page["next"])
+            names += [row["name"] for row in page["results"]]
+        self.assertEqual(len(names), 25)
+        self.assertEqual(len(set(names)), 25)
+        self.assertNotIn("newest", names)
+
+
+class SparseFieldsetTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.topic = Topic.objects.create(name="shapes")
+        self.classroom = Classroom.objects.create(
+            host=self.user, topic=self.topic, name="shaped", description="rows"
+        )
+        Classroom.objects.create(host=None, topic=None, name="orphan")
+
+    def test_classroom_shape(self):
+        rows = {row["name"]: row for row in self.pages("/api/v1/classrooms/")}
+        self.assertEqual(
+            set(rows["shaped"]),
+            {
+                "name",
+                "description",
+                "host",
+                "topic",
+                "student_count",
+                "message_count",
+                "created",
+                "updated",
+            },
+        )
+        self.assertEqual(rows["shaped"]["host"], "reader")
+        self.assertEqual(rows["shaped"]["topic"], "shapes")
+        self.assertIsNone(rows["orphan"]["host"])
+        self.assertIsNone(rows["orphan"]["topic"])
+
+    def test_fields_filter_and_ignore_unknown_names(self):
+        rows = self.pages("/api/v1/classrooms/", fields="name, host,unknown")
+        self.assertEqual(
+            sorted(rows, key=lambda row: row["name"]),
+            [{"name": "orphan", "host": None}, {"name": "shaped", "host": "reader"}],
+        )
+        rows = self.pages("/api/v1/classrooms/", fields="unknown")
+        self.assertEqual(rows, [{}, {}])
+
+    def test_user_classroom_count_is_annotated_on_request(self):
+        (row,) = self.pages("/api/v1/users/")
+        self.assertEqual(row["username"], "reader")
+        self.assertEqual(row["classroom_count"], 1)
+        self.assertTrue(row["url"].endswith(f"/api/v1/users/{self.user.pk}/"))
+
+        with self.assertNumQueries(3):
+            rows = self.pages("/api/v1/users/", fields="username")
+        self.assertEqual(rows, [{"username": "reader"}])
 
-# Create your tests here.
+    def test_topics_are_public_and_carry_their_count(self):
+        self.client.logout()
+        self.assertEqual(
+            self.pages("/api/v1/topics/"),
+            [{"name": "shapes", "classroom_count": 1}],
+        )
@@ -1,21 +1,80 @@
+from typing import Optional, Tuple
+
+from django.db.models import Count
 from rest_framework import permissions, viewsets
 
+from base.caching import scope
+from base.conditional import collection_validators, conditional_response
 from base.models import Classroom, Topic, User
 
-from .serializers import ClassroomSerializer, TopicSerializer, UserSerializer
+from .serializers import (
+    ClassroomSerializer,
+    TopicSerializer,
+    UserSerializer,
+    requested_fields,
+)
+
 
+def wants(request, field: str) -> bool:
+    fields = requested_fields(request)
+    return fields is None or field in fields
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class ConditionalMixin:
+    """
+    Answer `list` and `retrieve` with 304 while the rows behind them are
+    unchanged, before querying or serializing the page.
+    """
+
+    timestamp_field: Optional[str] = None
+    validator_scopes: Tuple[str, ...] = ()
+
+    def get_validators(self, queryset):
+        sources = [(queryset, self.timestamp_field)] if self.timestamp_field else []
+        return collection_validators(
+            self.request,
+            sources,
+            self.validator_scopes,
+            [self.request.accepted_renderer.format],
+        )
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            lambda: self.get_validators(self.filter_queryset(self.get_queryset())),
+            lambda: super(ConditionalMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        return conditional_response(
+            request,
+            lambda: self.get_validators(self.get_queryset().filter(**lookup)),
+            lambda: super(ConditionalMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+
+class UserViewSet(ConditionalMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
 
-    queryset = User.objects.all().order_by("-date_joined")
+    queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ("-date_joined", "-pk")
+    # Users have no modification time; every user save bumps "feed".
+    validator_scopes = (scope("feed"),)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if wants(self.request, "classroom_count"):
+            # Counted in the page query rather than once per row.
+            queryset = queryset.annotate(classroom_count=Count("classroom"))
+        return queryset
 
 
-class TopicViewSet(viewsets.ModelViewSet):
+class TopicViewSet(ConditionalMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows to see all topics application has.
     """
@@ -23,9 +82,11 @@ class TopicViewSet(viewsets.ModelViewSet):
     queryset = Topic.objects.all()
     serializer_class = TopicSerializer
     permission_classes = []
+    ordering = ("name", "pk")
+    validator_scopes = (scope("topics"),)
 
 
-class ClassroomViewSet(viewsets.ModelViewSet):
+class ClassroomViewSet(ConditionalMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows to see all classrooms application has.
     """
@@ -33,3 +94,14 @@ class ClassroomViewSet(viewsets.ModelViewSet):
     queryset = Classroom.objects.all()
     serializer_class = ClassroomSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ("-updated", "-created", "-pk")
+    timestamp_field = "updated"
+    # Deletes, students joining and new messages don't touch `updated`.
+    validator_scopes = (scope("feed"), scope("activity"))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        related = [name for name in ("host", "topic") if wants(self.request, name)]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
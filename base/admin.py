@@ -1,9 +1,35 @@
 from django.contrib import admin
 
-from .models import Classroom, Conspect, Message, Topic, User
+from .models import (
+    Blob,
+    Classroom,
+    Conspect,
+    Message,
+    Purchase,
+    Task,
+    Topic,
+    Upload,
+    User,
+)
 
-admin.site.register(User)
-admin.site.register(Topic)
-admin.site.register(Classroom)
+
+class ManagedFieldsAdmin(admin.ModelAdmin):
+    """
+    Shows a model's `managed_fields` read-only: ordinary saves leave them
+    out (see `ManagedFieldsMixin`), so an edit here would be dropped.
+    Balances are moved through `base.ledger`.
+    """
+
+    def get_readonly_fields(self, request, obj=None):
+        return (*super().get_readonly_fields(request, obj), *self.model.managed_fields)
+
+
+admin.site.register(User, ManagedFieldsAdmin)
+admin.site.register(Topic, ManagedFieldsAdmin)
+admin.site.register(Classroom, ManagedFieldsAdmin)
 admin.site.register(Message)
 admin.site.register(Conspect)
+admin.site.register(Purchase)
+admin.site.register(Task)
+admin.site.register(Upload)
+admin.site.register(Blob)
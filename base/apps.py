@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "base"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        # Signal receivers and the modules that register tasks.
+        from . import emails, signals, thumbnails, uploads  # noqa: F401
+        from .metrics import install_query_wrapper
+        from .pages import markdown_pages
+        from .querydebug import install_debug_wrapper
+
+        connection_created.connect(install_query_wrapper)
+        connection_created.connect(install_debug_wrapper)
+
+        markdown_pages.load()
@@ -0,0 +1,69 @@
+from asgiref.sync import sync_to_async
+from django.shortcuts import get_object_or_404, render
+
+from . import views
+from .activity import recent_activity
+from .concurrency import gather
+from .conditional import condition_on
+from .models import Classroom, Topic
+
+# Coroutine versions of the read-heavy pages, routed instead of the ones in
+# `base.views` when ASYNC_VIEWS is on (under jazbahana.asgi only).
+# They build the same context from the same helpers, but start the
+# independent queries of a page together, so a page waits for its slowest
+# query instead of the sum of them and the event loop serves other requests
+# meanwhile.
+
+
+async def load_user(request) -> None:
+    # `request.user` is loaded lazily from the session; do it once, here,
+    # instead of in whichever thread renders first.
+    await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+async def render_async(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@condition_on(views.home_validators)
+async def home(request):
+    await load_user(request)
+    parts = views.home_context(request)
+    values = await gather(*parts.values())
+    return await render_async(request, "base/home.html", dict(zip(parts, values)))
+
+
+@condition_on(views.topics_validators)
+async def topics(request):
+    q = request.GET.get("q") or ""
+    await load_user(request)
+    (topics,) = await gather(lambda: list(Topic.objects.filter(name__icontains=q)))
+    return await render_async(request, "base/topics.html", {"topics": topics})
+
+
+@condition_on(views.activities_validators)
+async def activities(request):
+    await load_user(request)
+    (activity,) = await gather(recent_activity)
+    return await render_async(request, "base/activities.html", {"activity": activity})
+
+
+@condition_on(views.classroom_validators)
+async def classroom_page(request, pk):
+    await load_user(request)
+    (classroom,) = await gather(
+        lambda: get_object_or_404(
+            Classroom.objects.select_related("host", "topic"), id=pk
+        )
+    )
+    parts = views.classroom_context(classroom)
+    values = await gather(*parts.values())
+    context = {"classroom": classroom, **dict(zip(parts, values))}
+    return await render_async(request, "base/classroom.html", context)
+
+
+async def classroom(request, pk):
+    if request.method in ("GET", "HEAD"):
+        return await classroom_page(request, pk)
+    # Posting a message stays on the sync view and its transaction handling.
+    return await sync_to_async(views.classroom)(request, pk)
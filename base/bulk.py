@@ -0,0 +1,366 @@
+import csv
+import json
+from typing import Dict, Iterable, Iterator, List
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_datetime
+
+from .activity import clear_activity
+from .caching import bump, scope
+from .counters import reconcile
+from .models import Classroom, Message, Topic, User
+from .rendering import render_markdown
+from .search import index_new_classrooms
+
+BATCH_SIZE = 5000
+
+# Exported columns per kind, in dependency order: each kind only refers to
+# the ones before it, by username, topic name or classroom id.
+KINDS = {
+    "users": {
+        "model": User,
+        "fields": {
+            "id": "id",
+            "username": "username",
+            "email": "email",
+            "name": "name",
+            "bio": "bio",
+            "avatar": "avatar",
+            "password": "password",
+            "date_joined": "date_joined",
+        },
+    },
+    "topics": {"model": Topic, "fields": {"id": "id", "name": "name"}},
+    "classrooms": {
+        "model": Classroom,
+        "fields": {
+            "id": "id",
+            "name": "name",
+            "description": "description",
+            "host": "host__username",
+            "topic": "topic__name",
+            "created": "created",
+            "updated": "updated",
+        },
+    },
+    "students": {
+        "model": Classroom.students.through,
+        "fields": {"classroom": "classroom_id", "user": "user__username"},
+    },
+    "messages": {
+        "model": Message,
+        "fields": {
+            "id": "id",
+            "classroom": "classroom_id",
+            "author": "author__username",
+            "body": "body",
+            "created": "created",
+            "updated": "updated",
+        },
+    },
+}
+
+
+def export_rows(kind: str, chunk_size: int = BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Stream the rows of `kind` in primary key order, `chunk_size` at a time.
+    """
+    fields = KINDS[kind]["fields"]
+    rows = (
+        KINDS[kind]["model"]
+        .objects.order_by("pk")
+        .values_list(*fields.values())
+        .iterator(chunk_size=chunk_size)
+    )
+    for values in rows:
+        yield {
+            name: value.isoformat() if hasattr(value, "isoformat") else value
+            for name, value in zip(fields, values)
+        }
+
+
+def read_rows(stream, file_format: str) -> Iterator[Dict]:
+    if file_format == "csv":
+        # CSV has no null; empty cells are read back as missing values.
+        for row in csv.DictReader(stream):
+            yield {key: value for key, value in row.items() if value != ""}
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_rows(stream, file_format: str, kind: str, rows: Iterable[Dict]):
+    if file_format == "csv":
+        writer = csv.DictWriter(stream, fieldnames=list(KINDS[kind]["fields"]))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield row
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+            yield row
+
+
+def batched(rows: Iterable[Dict], size: int = BATCH_SIZE) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _create_keeping_timestamps(model, objs: List, timestamps: List[Dict]) -> None:
+    """
+    `bulk_create` the new `objs`, then give them back the `timestamps`
+    (their `created` and `updated`, in order) that the insert replaced with
+    the time of the import.
+    """
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    # One UPDATE per row, sent together; `bulk_update` builds a CASE over
+    # the whole batch, which is several times slower here.
+    fields = [model._meta.get_field(name) for name in ("created", "updated")]
+    qn = connection.ops.quote_name
+    assignments = ", ".join(f"{qn(field.column)} = %s" for field in fields)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {qn(model._meta.db_table)} SET {assignments} WHERE {qn('id')} = %s",
+            [
+                [
+                    *(
+                        field.get_db_prep_value(values[field.name], connection)
+                        for field in fields
+                    ),
+                    obj.pk,
+                ]
+                for obj, values in zip(objs, timestamps)
+            ],
+        )
+    for obj, values in zip(objs, timestamps):
+        for name, value in values.items():
+            setattr(obj, name, value)
+
+
+def _unique(rows: Iterable[Dict], key) -> List[Dict]:
+    """
+    The `rows` whose `key` is not None and not repeated, first one kept.
+    """
+    seen = set()
+    unique = []
+    for row in rows:
+        value = key(row)
+        if value is not None and value not in seen:
+            seen.add(value)
+            unique.append(row)
+    return unique
+
+
+def _new_rows(model, rows: List[Dict]) -> List[Dict]:
+    """
+    The `rows` without an explicit id that's already taken.
+    """
+    ids = {int(row["id"]) for row in rows if row.get("id") is not None}
+    taken = set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+    rows = [row for row in rows if row.get("id") is None or int(row["id"]) not in taken]
+    explicit = _unique(rows, lambda row: row.get("id") and int(row["id"]))
+    return explicit + [row for row in rows if row.get("id") is None]
+
+
+def _timestamp(row: Dict, name: str, default):
+    value = row.get(name)
+    return parse_datetime(value) if value else default
+
+
+def _timestamps(rows: List[Dict], now) -> List[Dict]:
+    return [
+        {name: _timestamp(row, name, now) for name in ("created", "updated")}
+        for row in rows
+    ]
+
+
+def _lowered(model, field: str, values: Iterable[str]):
+    """
+    The rows whose `field` matches one of `values` ignoring case, as
+    (lowered value, pk) pairs.
+    """
+    return (
+        model.objects.annotate(lowered=Lower(field))
+        .filter(lowered__in={value.lower() for value in values})
+        .values_list("lowered", "pk")
+    )
+
+
+def _user_ids(usernames: Iterable[str]) -> Dict[str, int]:
+    # Usernames are unique ignoring case (`unique_username_ci`).
+    usernames = set(usernames)
+    ids = dict(_lowered(User, "username", usernames))
+    return {
+        username: ids[username.lower()]
+        for username in usernames
+        if username.lower() in ids
+    }
+
+
+def _topic_ids(names: Iterable[str]) -> Dict[str, int]:
+    names = set(names)
+    ids = {}
+    for pk, name in Topic.objects.filter(name__in=names).values_list("pk", "name"):
+        ids.setdefault(name, pk)
+    missing = [Topic(name=name) for name in names - set(ids)]
+    if missing:
+        Topic.objects.bulk_create(missing)
+        ids.update(_topic_ids(topic.name for topic in missing))
+    return ids
+
+
+def import_users(batch: List[Dict], now) -> int:
+    """
+    Rows whose username or email another user has, ignoring case, are
+    skipped like those whose id is taken.
+    """
+    batch = _unique(_new_rows(User, batch), lambda row: row["username"].lower())
+    emails = [row["email"] for row in batch if row.get("email")]
+    taken_emails = {email for email, _ in _lowered(User, "email", emails)}
+    seen = set()
+    rows = []
+    for row in batch:
+        email = row.get("email") and row["email"].lower()
+        if email and (email in taken_emails or email in seen):
+            continue
+        seen.add(email)
+        rows.append(row)
+    taken = set(_user_ids(row["username"] for row in rows))
+    users = [
+        User(
+            id=row.get("id"),
+            username=row["username"],
+            email=row.get("email"),
+            name=row.get("name"),
+            bio=row.get("bio"),
+            bio_html=render_markdown(row.get("bio")),
+            avatar=row.get("avatar") or User._meta.get_field("avatar").default,
+            password=row.get("password") or make_password(None),
+            date_joined=_timestamp(row, "date_joined", now),
+        )
+        for row in rows
+        if row["username"] not in taken
+    ]
+    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    return len(users)
+
+
+def import_topics(batch: List[Dict], now) -> int:
+    names = {row["name"] for row in batch}
+    existing = Topic.objects.filter(name__in=names).values("name").distinct().count()
+    _topic_ids(names)
+    return len(names) - existing
+
+
+def import_classrooms(batch: List[Dict], now) -> int:
+    batch = _new_rows(Classroom, batch)
+    hosts = _user_ids(row["host"] for row in batch if row.get("host"))
+    topics = _topic_ids(row["topic"] for row in batch if row.get("topic"))
+    classrooms = [
+        Classroom(
+            id=row.get("id"),
+            name=row["name"],
+            description=row.get("description"),
+            host_id=hosts.get(row.get("host")),
+            topic_id=topics.get(row.get("topic")),
+        )
+        for row in batch
+    ]
+    _create_keeping_timestamps(Classroom, classrooms, _timestamps(batch, now))
+    index_new_classrooms(
+        Classroom.objects.filter(pk__in=[classroom.pk for classroom in classrooms])
+    )
+    return len(classrooms)
+
+
+def _existing_classrooms(batch: List[Dict]) -> set:
+    ids = {int(row["classroom"]) for row in batch}
+    return set(Classroom.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+
+def import_students(batch: List[Dict], now) -> int:
+    users = _user_ids(row["user"] for row in batch)
+    classrooms = _existing_classrooms(batch)
+    Through = Classroom.students.through
+    pairs = {
+        (int(row["classroom"]), users[row["user"]])
+        for row in batch
+        if row["user"] in users and int(row["classroom"]) in classrooms
+    }
+    joined = Through.objects.filter(
+        classroom_id__in={classroom for classroom, _ in pairs},
+        user_id__in={user for _, user in pairs},
+    ).values_list("classroom_id", "user_id")
+    links = [
+        Through(classroom_id=classroom, user_id=user)
+        for classroom, user in sorted(pairs - set(joined))
+    ]
+    Through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    return len(links)
+
+
+def import_messages(batch: List[Dict], now) -> int:
+    authors = _user_ids(row["author"] for row in batch)
+    classrooms = _existing_classrooms(batch)
+    batch = [
+        row
+        for row in _new_rows(Message, batch)
+        if row["author"] in authors and int(row["classroom"]) in classrooms
+    ]
+    messages = [
+        Message(
+            id=row.get("id"),
+            classroom_id=int(row["classroom"]),
+            author_id=authors[row["author"]],
+            body=row["body"],
+            body_html=render_markdown(row["body"]),
+        )
+        for row in batch
+    ]
+    _create_keeping_timestamps(Message, messages, _timestamps(batch, now))
+    return len(messages)
+
+
+IMPORTERS = {
+    "users": import_users,
+    "topics": import_topics,
+    "classrooms": import_classrooms,
+    "students": import_students,
+    "messages": import_messages,
+}
+
+
+def reset_sequences(kind: str) -> None:
+    """
+    Move the id sequence past imported explicit ids (PostgreSQL only; SQLite
+    already continues from the highest rowid).
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), [KINDS[kind]["model"]])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def repair(kinds: Iterable[str]) -> None:
+    """
+    Do what the signals `bulk_create` skips would have done for `kinds`.
+    """
+    kinds = set(kinds)
+    for kind in kinds - {"students"}:
+        reset_sequences(kind)
+    if kinds & {"classrooms", "students", "messages"}:
+        with transaction.atomic():
+            reconcile()
+    clear_activity()
+    bump(scope("feed"), scope("topics"), scope("activity"))
@@ -0,0 +1,121 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.translation import get_language
+
+from .metrics import record_cache
+
+# Fragments show `timesince` text, which counts in minutes: a minute keeps it
+# from falling behind the clock by more than one.
+FRAGMENT_TIMEOUT = 60
+
+# Fragment hits and misses seen by this process, keyed by (name, outcome).
+stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def scope(kind: str, pk: Optional[int] = None) -> str:
+    """
+    A versioned scope: "feed", "topics" and "activity" are global, while
+    "topic", "classroom" and "user" are per row.
+    """
+    return kind if pk is None else f"{kind}:{pk}"
+
+
+def _version_key(name: str) -> str:
+    return f"cache-version:{name}"
+
+
+def get_versions(scopes: Iterable[str]) -> Dict[str, int]:
+    scopes = list(scopes)
+    found = cache.get_many([_version_key(name) for name in scopes])
+    versions = {}
+    missing = {}
+    for name in scopes:
+        version = found.get(_version_key(name))
+        if version is None:
+            # Start from the clock, so a version that was evicted can never
+            # come back with a number old fragments were stored under.
+            version = missing[_version_key(name)] = time.time_ns()
+        versions[name] = version
+    if missing:
+        cache.set_many(missing, None)
+    return versions
+
+
+def bump(*scopes: str) -> None:
+    for name in set(scopes):
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.set(_version_key(name), time.time_ns(), None)
+
+
+def _record(name: str, outcome: str) -> None:
+    with _stats_lock:
+        stats[(name, outcome)] += 1
+    record_cache(outcome)
+
+
+def fragment_key(name: str, scopes: Iterable[str] = (), vary_on: Iterable = ()) -> str:
+    versions = get_versions(scopes)
+    parts = [f"{key}={value}" for key, value in sorted(versions.items())]
+    parts += [get_language() or ""] + [str(value) for value in vary_on]
+    # Hashed, since `vary_on` may hold search terms memcached won't accept.
+    return f"fragment:{name}:{hashlib.sha1(':'.join(parts).encode()).hexdigest()}"
+
+
+def get_fragment(name: str, key: str) -> Optional[Any]:
+    html = cache.get(key)
+    _record(name, "miss" if html is None else "hit")
+    return html
+
+
+def set_fragment(key: str, value: Any) -> None:
+    cache.set(key, value, FRAGMENT_TIMEOUT)
+
+
+def cached_value(
+    name: str,
+    compute: Callable[[], Any],
+    scopes: Iterable[str] = (),
+    vary_on: Iterable = (),
+) -> Any:
+    """
+    `compute()` once per combination of scope versions, language and
+    `vary_on` values, like a fragment. `compute` must not return None.
+    """
+    key = fragment_key(name, scopes, vary_on)
+    value = get_fragment(name, key)
+    if value is None:
+        value = compute()
+        set_fragment(key, value)
+    return value
+
+
+def render_fragment(
+    request,
+    name: str,
+    template: str,
+    context: Union[dict, Callable[[], dict]],
+    scopes: Iterable[str] = (),
+    vary_on: Iterable = (),
+) -> str:
+    """
+    Render `template` once per combination of scope versions, language and
+    `vary_on` values; later calls are served from the cache. `context` may be
+    a callable so nothing is queried on a hit.
+    """
+    return cached_value(
+        name,
+        lambda: render_to_string(
+            template, context() if callable(context) else context, request
+        ),
+        scopes,
+        vary_on,
+    )
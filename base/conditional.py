@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+from functools import partial, wraps
+from typing import Iterable, NamedTuple, Sequence, Tuple
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.db.models import Max, QuerySet
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
+
+from .caching import get_versions
+from .concurrency import run_concurrently
+
+
+class Validators(NamedTuple):
+    etag: str
+
+
+def _latest(queryset: QuerySet, field: str):
+    return queryset.order_by().aggregate(latest=Max(field))["latest"]
+
+
+def collection_validators(
+    request,
+    sources: Sequence[Tuple[QuerySet, str]],
+    scopes: Iterable[str] = (),
+    vary_on: Iterable = (),
+) -> Validators:
+    """
+    Validators for a page built from `sources`, pairs of a queryset and its
+    timestamp column, without rendering anything.
+
+    Each source costs one MAX() that the ordering indexes answer without a
+    scan, and they run concurrently. Deletes, counter updates and edits to
+    rows without a timestamp (topics, users) don't move any MAX(), so the
+    versions of the cache `scopes` the signals bump for those are part of
+    the ETag as well. For the same reason there is no Last-Modified: a
+    client revalidating with If-Modified-Since alone would be told a page
+    is current after a delete or a login change.
+    """
+    latest = run_concurrently(
+        *(partial(_latest, queryset, field) for queryset, field in sources)
+    )
+
+    parts = [value.isoformat() if value else "-" for value in latest]
+    parts += [f"{name}={version}" for name, version in get_versions(scopes).items()]
+    parts += [get_language() or "", str(request.user.pk or 0)]
+    parts += [str(value) for value in vary_on]
+    return Validators(quote_etag(hashlib.sha1(":".join(parts).encode()).hexdigest()))
+
+
+def _skip_conditional(request) -> bool:
+    # A pending flash message must be rendered, so it always gets a full page.
+    return request.method not in ("GET", "HEAD") or bool(
+        len(messages.get_messages(request))
+    )
+
+
+def _attach_validators(response, validators: Validators):
+    if response.status_code in (200, 304):
+        response.headers["ETag"] = validators.etag
+        patch_vary_headers(response, ["Cookie", "Accept-Language"])
+    return response
+
+
+def conditional_response(request, validators_func, view_func):
+    """
+    Answer a GET or HEAD with 304 when the client's copy is still current,
+    otherwise call `view_func` and attach the validators to its response.
+    """
+    if _skip_conditional(request):
+        return view_func()
+
+    validators = validators_func()
+    response = get_conditional_response(request, etag=validators.etag)
+    if response is None:
+        response = view_func()
+    return _attach_validators(response, validators)
+
+
+async def aconditional_response(request, validators_func, view_func):
+    """
+    `conditional_response` for coroutine views; the validators still query
+    synchronously, so they run in a worker thread.
+    """
+    validators = await sync_to_async(
+        lambda: None if _skip_conditional(request) else validators_func()
+    )()
+    if validators is None:
+        return await view_func()
+
+    response = get_conditional_response(request, etag=validators.etag)
+    if response is None:
+        response = await view_func()
+    return _attach_validators(response, validators)
+
+
+def condition_on(validators_func):
+    """
+    View decorator for `conditional_response`; `validators_func` receives
+    the view's arguments and returns `Validators`. Works on coroutine views
+    as well.
+    """
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_inner(request, *args, **kwargs):
+                return await aconditional_response(
+                    request,
+                    lambda: validators_func(request, *args, **kwargs),
+                    lambda: view(request, *args, **kwargs),
+                )
+
+            return async_inner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            return conditional_response(
+                request,
+                lambda: validators_func(request, *args, **kwargs),
+                lambda: view(request, *args, **kwargs),
+            )
+
+        return inner
+
+    return decorator
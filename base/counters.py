@@ -0,0 +1,78 @@
+from typing import Dict, Iterable
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Classroom, Message, Topic
+
+
+def _count_of(queryset, field: str):
+    counted = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def actual_classroom_count():
+    return _count_of(Classroom.objects.all(), "topic")
+
+
+def actual_student_count():
+    return _count_of(Classroom.students.through.objects.all(), "classroom")
+
+
+def actual_message_count():
+    return _count_of(Message.objects.all(), "classroom")
+
+
+def increment(queryset, field: str, delta: int) -> None:
+    if delta < 0:
+        # Never let a counter that has drifted wrap below zero.
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def refresh_student_counts(classroom_ids: Iterable[int]) -> None:
+    Classroom.objects.filter(id__in=list(classroom_ids)).update(
+        student_count=actual_student_count()
+    )
+
+
+def refresh_message_counts(classroom_ids: Iterable[int]) -> None:
+    Classroom.objects.filter(id__in=list(classroom_ids)).update(
+        message_count=actual_message_count()
+    )
+
+
+RECONCILE_BATCH_SIZE = 500
+
+COUNTERS = {
+    "Topic.classroom_count": (Topic, "classroom_count", actual_classroom_count),
+    "Classroom.student_count": (Classroom, "student_count", actual_student_count),
+    "Classroom.message_count": (Classroom, "message_count", actual_message_count),
+}
+
+
+def reconcile(fix: bool = True) -> Dict[str, int]:
+    """
+    Compare every counter column with a fresh COUNT(*) and, unless `fix` is
+    False, overwrite the ones that drifted. Returns drifted rows per counter.
+    """
+    drift = {}
+    for label, (model, field, actual) in COUNTERS.items():
+        drifted = (
+            model.objects.annotate(actual=actual())
+            .exclude(**{field: F("actual")})
+            .values_list("pk", flat=True)
+        )
+        ids = list(drifted)
+        drift[label] = len(ids)
+        if fix:
+            for start in range(0, len(ids), RECONCILE_BATCH_SIZE):
+                end = start + RECONCILE_BATCH_SIZE
+                model.objects.filter(pk__in=ids[start:end]).update(**{field: actual()})
+    return drift
@@ -0,0 +1,167 @@
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import escape_uri_path
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .storage import content_hash
+
+CHUNK_SIZE = 64 * 1024
+
+# A blob's name changes with its contents, so it may be cached for good.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_digest(path: str, stat: os.stat_result) -> str:
+    """
+    SHA-256 of the file, cached until its size or mtime changes.
+    """
+    key = f"file-digest:{hashlib.sha1(path.encode()).hexdigest()}"
+    version = f"{stat.st_size}:{stat.st_mtime_ns}"
+    cached = cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    cache.set(key, (version, digest.hexdigest()), None)
+    return digest.hexdigest()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Return the inclusive byte span of a single-range header, `None` when the
+    header should be ignored, or raise `ValueError` if it is unsatisfiable.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_span(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload(response: HttpResponse, fieldfile) -> bool:
+    mode = getattr(settings, "FILE_DOWNLOAD_OFFLOAD", None)
+    if mode == "x-accel-redirect":
+        prefix = getattr(settings, "FILE_DOWNLOAD_ACCEL_PREFIX", "/protected/")
+        response["X-Accel-Redirect"] = escape_uri_path(prefix + fieldfile.name)
+        return True
+    if mode == "x-sendfile":
+        response["X-Sendfile"] = fieldfile.path
+        return True
+    return False
+
+
+def serve_file(request, fieldfile, filename: Optional[str] = None):
+    """
+    Send `fieldfile` as an attachment with strong validators and support for
+    single byte ranges (`Range`/`If-Range`), so interrupted downloads resume.
+    """
+    path = fieldfile.path
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = quote_etag(content_hash(fieldfile.name) or file_digest(path, stat))
+    last_modified = int(stat.st_mtime)
+    filename = filename or os.path.basename(fieldfile.name)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    # A POST (e.g. a purchase) always gets the whole file.
+    safe = request.method in ("GET", "HEAD")
+    if safe:
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            response["ETag"] = etag
+            return response
+
+    span = None
+    range_header = request.META.get("HTTP_RANGE")
+    if safe and range_header and _if_range_matches(request, etag, last_modified):
+        try:
+            span = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    offloaded = HttpResponse(content_type=content_type)
+    if _offload(offloaded, fieldfile):
+        # The proxy serves the bytes and handles Range itself.
+        response = offloaded
+    elif span is not None:
+        start, end = span
+        response = StreamingHttpResponse(
+            _read_span(path, start, end), status=206, content_type=content_type
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Content-Disposition"] = (
+        f"attachment; filename*=utf-8''{escape_uri_path(filename)}"
+    )
+    return response
+
+
+def _if_range_matches(request, etag: str, last_modified: int) -> bool:
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_blob(request, storage, name: str):
+    """
+    Send a public file of the content-addressed storage (avatars and their
+    thumbnails) with headers that let clients and proxies keep it forever.
+    """
+    if not storage.is_public(name) or not storage.exists(name):
+        raise Http404(name)
+    etag = quote_etag(os.path.basename(name))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        response = FileResponse(storage.open(name, "rb"), content_type=content_type)
+    response["ETag"] = etag
+    response["Cache-Control"] = IMMUTABLE
+    return response
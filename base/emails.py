@@ -0,0 +1,21 @@
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.safestring import mark_safe
+from django.utils.translation import gettext as _
+
+from .models import User
+from .tasks import task
+
+
+@task(max_attempts=5, retry_delay=60)
+def send_welcome_email(user_id: int, language: str) -> None:
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.email:
+        return
+    with translation.override(language):
+        # A plain-text mail: nothing in it is interpreted as HTML.
+        body = render_to_string(
+            "base/email_template.html", {"name": mark_safe(user.name or user.username)}
+        )
+        send_mail(_("Welcome to JazbaHana"), body, None, [user.email])
@@ -0,0 +1,51 @@
+from typing import Dict, Tuple
+
+from django.urls import reverse
+
+from .models import Classroom, Message, Topic, User
+
+# The read-heavy pages whose query counts are guarded by the test suite
+# (`QueryBudgetTests`) and explained by `explain_queries`, with the most
+# queries a single render of each may cost, whatever the number of rows.
+QUERY_BUDGETS = {
+    "home": 12,
+    "user-profile": 12,
+    "activities": 6,
+    "topics": 6,
+    "classroom": 12,
+}
+
+
+def seed_pages(rows: int, prefix: str) -> Tuple[User, Classroom]:
+    """
+    `rows` users, each hosting a classroom that all of them joined and
+    posted to, so every list on the pages has `rows` entries.
+    """
+    users = [
+        User.objects.create(
+            username=f"{prefix}-budget-{i}",
+            email=f"{prefix}-budget-{i}@jazbahana.invalid",
+        )
+        for i in range(rows)
+    ]
+    topic = Topic.objects.create(name=f"{prefix}-budget")
+    for i, user in enumerate(users):
+        classroom = Classroom.objects.create(
+            host=user, topic=topic, name=f"{prefix} classroom {i}"
+        )
+        classroom.students.add(*users)
+        Message.objects.bulk_create(
+            Message(author=author, classroom=classroom, body="budget")
+            for author in users
+        )
+    return users[0], classroom
+
+
+def page_urls(user: User, classroom: Classroom) -> Dict[str, str]:
+    return {
+        "home": reverse("home"),
+        "user-profile": reverse("user-profile", args=[user.username]),
+        "activities": reverse("activities"),
+        "topics": reverse("topics"),
+        "classroom": reverse("classroom", args=[classroom.id]),
+    }
@@ -1,16 +1,31 @@
 from django.contrib.auth.forms import UserCreationForm
-from django.forms import ModelForm
+from django.forms import ModelForm, ValidationError
+from django.utils.translation import gettext_lazy as _
 
 from .models import Classroom, Conspect, User
 
 
-class CustomUserCreationForm(UserCreationForm):
+class UniqueUsernameMixin:
+    """
+    Report usernames that differ only in case as taken, instead of letting
+    the `unique_username_ci` constraint fail on save.
+    """
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        others = User.objects.with_username(username).exclude(pk=self.instance.pk)
+        if others.exists():
+            raise ValidationError(_("A user with that username already exists."))
+        return username
+
+
+class CustomUserCreationForm(UniqueUsernameMixin, UserCreationForm):
     class Meta:
         model = User
         fields = ["name", "username", "email", "password1", "password2"]
 
 
-class UserForm(ModelForm):
+class UserForm(UniqueUsernameMixin, ModelForm):
     class Meta:
         model = User
         fields = ["avatar", "name", "username", "email", "bio"]
@@ -0,0 +1,48 @@
+from typing import Tuple
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Conspect, Purchase, User
+
+CONSPECT_PRICE = 100
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def has_purchased(user, conspect: Conspect) -> bool:
+    return Purchase.objects.filter(buyer=user, conspect=conspect).exists()
+
+
+def purchase_conspect(buyer, conspect: Conspect) -> Tuple[Purchase, bool]:
+    """
+    Move `CONSPECT_PRICE` from the buyer to the author exactly once.
+
+    Both balance rows are locked in primary-key order (so two opposite
+    purchases cannot deadlock) and moved with F() expressions, and the
+    already-purchased check runs under the buyer's lock, so concurrent
+    requests neither lose updates nor charge twice. Returns the purchase and
+    whether it was created by this call.
+    """
+    seller_id = conspect.author_id
+    with transaction.atomic():
+        balances = dict(
+            User.objects.select_for_update()
+            .filter(pk__in={buyer.pk, seller_id})
+            .order_by("pk")
+            .values_list("pk", "balance")
+        )
+        existing = Purchase.objects.filter(buyer=buyer, conspect=conspect).first()
+        if existing is not None:
+            return existing, False
+        if balances[buyer.pk] < CONSPECT_PRICE:
+            raise InsufficientBalance
+
+        User.objects.filter(pk=buyer.pk).update(balance=F("balance") - CONSPECT_PRICE)
+        User.objects.filter(pk=seller_id).update(balance=F("balance") + CONSPECT_PRICE)
+        purchase = Purchase.objects.create(
+            buyer=buyer, seller_id=seller_id, conspect=conspect, price=CONSPECT_PRICE
+        )
+    return purchase, True
@@ -0,0 +1,186 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from base.metrics import registry
+from base.models import Classroom, User
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"
+
+# How far a result may move past its baseline before it counts as a
+# regression: a fraction of the baseline, plus a fixed slack so that small
+# numbers don't trip on noise (a few KB of interned strings, a GC pause).
+TOLERANCE = {
+    "queries": (0, 0),
+    "memory_kb": (0.25, 32),
+    "p50_ms": (0.5, 2),
+    "p99_ms": (1.0, 5),
+}
+# Latency depends on the machine, so it only fails the comparison when asked.
+LATENCY = ("p50_ms", "p99_ms")
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the main pages and the API through the test client against "
+        "the current database (see generate_data) and report p50/p99 "
+        "latency, queries and allocated memory per request, optionally "
+        "comparing them with a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the cache before every request.",
+        )
+        parser.add_argument("--only", nargs="*", help="Run these scenarios only.")
+        parser.add_argument(
+            "--save-baseline",
+            nargs="?",
+            const=str(DEFAULT_BASELINE),
+            help="Store the results as the new baseline.",
+        )
+        parser.add_argument(
+            "--compare",
+            nargs="?",
+            const=str(DEFAULT_BASELINE),
+            help="Fail if any scenario regressed against the baseline.",
+        )
+        parser.add_argument(
+            "--gate-latency",
+            action="store_true",
+            help="Let latency regressions fail --compare too, not just warn; "
+            "only meaningful against a baseline from the same machine.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        if options["only"]:
+            scenarios = {name: scenarios[name] for name in options["only"]}
+
+        client = Client()
+        client.force_login(self.user)
+        results = {}
+        self.stdout.write(
+            f"{'scenario':<22} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} "
+            f"{'memory KB':>10}"
+        )
+        for name, url in scenarios.items():
+            results[name] = self.measure(client, url, options)
+            result = results[name]
+            self.stdout.write(
+                f"{name:<22} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['queries']:>8} {result['memory_kb']:>10.0f}"
+            )
+
+        if options["save_baseline"]:
+            path = Path(options["save_baseline"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"Baseline written to {path}")
+        if options["compare"]:
+            self.compare(results, Path(options["compare"]), options["gate_latency"])
+
+    def scenarios(self):
+        self.user = (
+            User.objects.annotate(hosted=Count("classroom")).order_by("-hosted").first()
+        )
+        classroom = Classroom.objects.order_by("-message_count").first()
+        if self.user is None or classroom is None:
+            raise CommandError("No data to benchmark; run generate_data first")
+        search = str(classroom.topic or classroom.name)
+        return {
+            "home": reverse("home"),
+            "home-search": reverse("home") + "?" + urlencode({"q": search}),
+            "classroom": reverse("classroom", args=[classroom.id]),
+            "user-profile": reverse("user-profile", args=[self.user.username]),
+            "activities": reverse("activities"),
+            "topics": reverse("topics"),
+            "api-users": "/api/v1/users/",
+            "api-topics": "/api/v1/topics/",
+            "api-classrooms": "/api/v1/classrooms/",
+            "api-classrooms-sparse": "/api/v1/classrooms/?fields=name,host",
+        }
+
+    def request(self, client, url, cold):
+        if cold:
+            cache.clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+        return response
+
+    def measure(self, client, url, options):
+        cold = options["cold"]
+        # Warm up imports, template loading and (unless --cold) the caches.
+        self.request(client, url, cold)
+
+        # Queries come from PerformanceMiddleware's per-request metrics, which
+        # also count those a page runs on the `run_concurrently` pool threads.
+        registry.reset()
+        latencies = []
+        for _ in range(options["iterations"]):
+            if cold:
+                cache.clear()
+            start = time.perf_counter()
+            self.request(client, url, False)
+            latencies.append((time.perf_counter() - start) * 1000)
+        with registry.lock:
+            queries = sum(stats.queries for stats in registry.views.values())
+
+        # Measured in a separate request, since tracing slows everything down.
+        tracemalloc.start()
+        try:
+            self.request(client, url, cold)
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p99_ms": round(
+                latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2
+            ),
+            "queries": queries // options["iterations"],
+            "memory_kb": round(peak / 1024),
+        }
+
+    def compare(self, results, path, gate_latency):
+        if not path.exists():
+            raise CommandError(f"No baseline at {path}; run with --save-baseline")
+        baseline = json.loads(path.read_text())
+        regressions, warnings = [], []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            for metric, (relative, slack) in TOLERANCE.items():
+                limit = baseline[name][metric] * (1 + relative) + slack
+                if result[metric] > limit:
+                    line = (
+                        f"{name} {metric}: {result[metric]} "
+                        f"(baseline {baseline[name][metric]})"
+                    )
+                    if metric in LATENCY and not gate_latency:
+                        warnings.append(line)
+                    else:
+                        regressions.append(line)
+        if warnings:
+            self.stdout.write(
+                self.style.WARNING("Slower than the baseline:\n" + "\n".join(warnings))
+            )
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
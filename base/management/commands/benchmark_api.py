@@ -0,0 +1,192 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework import pagination, serializers, viewsets
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import ClassroomViewSet, TopicViewSet, UserViewSet
+from base.activity import clear_activity
+from base.models import Classroom, Message, Topic, User
+
+PAGE_SIZE = 1000
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    # Unlike CaptureQueriesContext, not capped by the 9,000 entry query log.
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# The endpoints as they were before cursor pagination, sparse fieldsets and
+# annotated counts, producing the same fields the straightforward way.
+class LegacyPagination(pagination.PageNumberPagination):
+    page_size = PAGE_SIZE
+
+
+class LegacyUserSerializer(serializers.HyperlinkedModelSerializer):
+    classroom_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ["url", "username", "bio", "avatar", "classroom_count"]
+
+    def get_classroom_count(self, user):
+        return user.classroom_set.count()
+
+
+class LegacyTopicSerializer(serializers.HyperlinkedModelSerializer):
+    classroom_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Topic
+        fields = ["name", "classroom_count"]
+
+    def get_classroom_count(self, topic):
+        return topic.classroom_set.count()
+
+
+class LegacyClassroomSerializer(serializers.HyperlinkedModelSerializer):
+    host = serializers.CharField(source="host.username", allow_null=True)
+    topic = serializers.CharField(source="topic.name", allow_null=True)
+    student_count = serializers.SerializerMethodField()
+    message_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Classroom
+        fields = [
+            "name",
+            "description",
+            "host",
+            "topic",
+            "student_count",
+            "message_count",
+            "created",
+            "updated",
+        ]
+
+    def get_student_count(self, classroom):
+        return classroom.students.count()
+
+    def get_message_count(self, classroom):
+        return classroom.message_set.count()
+
+
+def legacy_viewset(model, serializer, ordering):
+    return type(
+        f"Legacy{model.__name__}ViewSet",
+        (viewsets.ReadOnlyModelViewSet,),
+        {
+            "queryset": model.objects.all().order_by(*ordering),
+            "serializer_class": serializer,
+            "pagination_class": LegacyPagination,
+            "permission_classes": [],
+        },
+    )
+
+
+ENDPOINTS = {
+    "users": (
+        legacy_viewset(User, LegacyUserSerializer, ["-date_joined"]),
+        UserViewSet,
+    ),
+    "topics": (legacy_viewset(Topic, LegacyTopicSerializer, ["name"]), TopicViewSet),
+    "classrooms": (
+        legacy_viewset(Classroom, LegacyClassroomSerializer, ["-updated", "-created"]),
+        ClassroomViewSet,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare API list throughput per 1,000 rows before and after cursor "
+        "pagination, select_related and annotated counts, on rolled back data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument(
+            "--fields", default="", help="A sparse fieldset to request as well."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = self.seed(options["rows"])
+                self.compare(user, options["rows"], options["fields"])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            clear_activity()
+
+    def seed(self, rows):
+        User.objects.bulk_create(
+            User(username=f"api-bench-{i}", email=f"api-bench-{i}@jazbahana.invalid")
+            for i in range(rows)
+        )
+        users = list(User.objects.filter(username__startswith="api-bench-"))
+        Topic.objects.bulk_create(Topic(name=f"bench-{i}") for i in range(rows))
+        topics = list(Topic.objects.filter(name__startswith="bench-"))
+        Classroom.objects.bulk_create(
+            Classroom(host=users[i], topic=topics[i], name=f"bench {i}")
+            for i in range(rows)
+        )
+        classrooms = list(Classroom.objects.filter(name__startswith="bench "))
+        Message.objects.bulk_create(
+            Message(author=users[i], classroom=classroom, body="bench")
+            for i, classroom in enumerate(classrooms)
+        )
+        return users[0]
+
+    def compare(self, user, rows, fields):
+        self.stdout.write(
+            f"{'endpoint':<12} {'before ms/1k':>13} {'queries/1k':>11} "
+            f"{'after ms/1k':>12} {'queries/1k':>11}"
+        )
+        for name, (legacy, current) in ENDPOINTS.items():
+            before = self.walk(legacy, user, f"/api/v1/{name}/")
+            url = f"/api/v1/{name}/?page_size={PAGE_SIZE}"
+            after = self.walk(current, user, url)
+            self.stdout.write(
+                f"{name:<12} {self.format(*before)} {self.format(*after)}"
+            )
+            if fields:
+                sparse = self.walk(current, user, f"{url}&fields={fields}")
+                label = f"  ?fields={fields}"
+                self.stdout.write(f"{label:<38} {self.format(*sparse)}")
+
+    def walk(self, viewset, user, url):
+        """
+        Fetch every page of the list endpoint and return the elapsed seconds,
+        queries and rows.
+        """
+        view = viewset.as_view({"get": "list"})
+        factory = APIRequestFactory()
+        elapsed = queries = count = 0
+        while url:
+            request = factory.get(url)
+            force_authenticate(request, user)
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                elapsed += time.perf_counter() - start
+            queries += counter.count
+            count += len(response.data["results"])
+            url = response.data.get("next")
+        return elapsed, queries, count
+
+    def format(self, elapsed, queries, count):
+        per_thousand = 1000 / max(count, 1)
+        return f"{elapsed * 1000 * per_thousand:>13.1f} {queries * per_thousand:>11.1f}"
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from base.models import Classroom
+
+MODES = ("sync", "async")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of one sync worker (a gunicorn sync worker "
+        "serves one request at a time) with one ASGI worker running the "
+        "coroutine views, each in its own process, so both get the memory "
+        "of a single worker. --db-latency adds a round-trip delay to every "
+        "query, as a database on another host would."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=20,
+            help="Requests in flight at once on the ASGI worker.",
+        )
+        parser.add_argument(
+            "--db-latency",
+            type=float,
+            default=2.0,
+            help="Milliseconds added to every query.",
+        )
+        parser.add_argument("--mode", choices=MODES, help="Run one side only.")
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            result = self.run_mode(options)
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(
+            f"{'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max RSS MB':>11}"
+        )
+        results = {}
+        for mode in MODES:
+            results[mode] = result = self.spawn(mode, options)
+            self.stdout.write(
+                f"{mode:<6} {result['throughput']:>8.1f} {result['p50_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['max_rss_mb']:>11.1f}"
+            )
+        speedup = results["async"]["throughput"] / results["sync"]["throughput"]
+        self.stdout.write(f"async/sync throughput: {speedup:.2f}x")
+
+    def spawn(self, mode, options):
+        # Each side gets a fresh process: the URLconf picks the views at
+        # import time, and the peak RSS should only count that side.
+        command = [
+            sys.executable,
+            "-m",
+            "django",
+            "benchmark_async",
+            f"--mode={mode}",
+            f"--requests={options['requests']}",
+            f"--concurrency={options['concurrency']}",
+            f"--db-latency={options['db_latency']}",
+        ]
+        env = dict(os.environ, ASYNC_VIEWS="1" if mode == "async" else "0")
+        env.setdefault("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE)
+        process = subprocess.run(
+            command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if process.returncode:
+            raise CommandError(f"{mode} run failed:\n{process.stderr}")
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def urls(self):
+        classroom = Classroom.objects.order_by("-message_count").first()
+        if classroom is None:
+            raise CommandError("No data to benchmark; run generate_data first")
+        return [
+            reverse("home"),
+            reverse("topics"),
+            reverse("activities"),
+            reverse("classroom", args=[classroom.id]),
+        ]
+
+    def add_latency(self, seconds):
+        def delay(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        connection_created.connect(install, weak=False)
+        for connection in connections.all():
+            connection.execute_wrappers.append(delay)
+
+    def run_mode(self, options):
+        if settings.ASYNC_VIEWS != (options["mode"] == "async"):
+            raise CommandError("Run without --mode, or set ASYNC_VIEWS to match it")
+        urls = self.urls()
+        self.add_latency(options["db_latency"] / 1000)
+        schedule = [urls[i % len(urls)] for i in range(options["requests"])]
+
+        if options["mode"] == "sync":
+            client = Client()
+            for url in urls:
+                self.ensure_ok(client.get(url), url)
+            start = time.perf_counter()
+            latencies = [self.timed_sync(client, url) for url in schedule]
+        else:
+            start, latencies = asyncio.run(
+                self.run_async(urls, schedule, options["concurrency"])
+            )
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {
+            "throughput": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies),
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            # Linux reports kilobytes, macOS bytes.
+            "max_rss_mb": max_rss / (2**20 if sys.platform == "darwin" else 2**10),
+        }
+
+    def ensure_ok(self, response, url):
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+    def timed_sync(self, client, url):
+        start = time.perf_counter()
+        self.ensure_ok(client.get(url), url)
+        return (time.perf_counter() - start) * 1000
+
+    async def run_async(self, urls, schedule, concurrency):
+        from jazbahana.asgi import application
+
+        for url in urls:
+            await self.asgi_get(application, url)
+
+        queue = list(reversed(schedule))
+        latencies = []
+
+        async def worker():
+            while queue:
+                url = queue.pop()
+                request_start = time.perf_counter()
+                await self.asgi_get(application, url)
+                latencies.append((time.perf_counter() - request_start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return start, latencies
+
+    async def asgi_get(self, application, url):
+        # Through the real ASGI entry point, as uvicorn would call it; unlike
+        # AsyncClient it gives every request its own sync thread context.
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": url,
+            "raw_path": url.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"localhost")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("localhost", 80),
+        }
+        communicator = ApplicationCommunicator(application, scope)
+        await communicator.send_input({"type": "http.request", "body": b""})
+        start = await communicator.receive_output(60)
+        if start["status"] != 200:
+            raise CommandError(f"{url} returned {start['status']}")
+        while (await communicator.receive_output(60)).get("more_body"):
+            pass
+        await communicator.wait()
@@ -0,0 +1,105 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from base.models import Classroom, SearchDocument, Topic, User
+from base.search import build_document, search_classrooms
+from base.views import HOME_PAGE_SIZE
+
+TOPICS = (
+    "algebra calculus geometry physics chemistry biology history literature "
+    "grammar kazakh english programming python django databases networks "
+    "statistics economics philosophy music drawing exam homework lecture"
+).split()
+
+SYLLABLES = "ba ka la ma na ra sa ta za de ge ke le me ne re se te".split()
+
+# Roughly 5800 distinct words, so a query matches a realistic slice of rows.
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the legacy icontains scan against the search index on "
+        "synthetic classrooms. All generated rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+        )
+        parser.add_argument("--queries", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        self.queries = [random.choice(WORDS) for _ in range(options["queries"])]
+        try:
+            with transaction.atomic():
+                self.run(options["sizes"], options["batch_size"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, batch_size):
+        host = User.objects.create(
+            username="benchmark-host", email="benchmark@jazbahana.invalid"
+        )
+        topics = Topic.objects.bulk_create(Topic(name=name) for name in TOPICS)
+
+        self.stdout.write(f"{'rows':>10} {'icontains p50':>15} {'index p50':>12}")
+        created = 0
+        for size in sorted(sizes):
+            while created < size:
+                count = min(batch_size, size - created)
+                classrooms = Classroom.objects.bulk_create(
+                    self.make_classroom(host, topics) for _ in range(count)
+                )
+                SearchDocument.objects.bulk_create(
+                    SearchDocument(
+                        classroom=classroom, document=build_document(classroom)
+                    )
+                    for classroom in classrooms
+                )
+                created += count
+
+            legacy = self.measure(self.legacy_search)
+            indexed = self.measure(lambda q: self.first_page(search_classrooms(q)))
+            self.stdout.write(f"{size:>10} {legacy:>13.2f}ms {indexed:>10.2f}ms")
+
+    def make_classroom(self, host, topics):
+        return Classroom(
+            host=host,
+            topic=random.choice(topics),
+            name=" ".join(random.sample(WORDS, 3)),
+            description=" ".join(random.sample(WORDS, 8)),
+        )
+
+    def legacy_search(self, q):
+        # What HomeView used to filter on.
+        matches = Q(topic__name__icontains=q) | Q(name__icontains=q)
+        return self.first_page(
+            Classroom.objects.filter(matches | Q(description__icontains=q))
+        )
+
+    def first_page(self, classrooms):
+        # What the home feed runs for either: a COUNT for the paginator plus
+        # the first page, in its order.
+        classrooms.count()
+        return list(classrooms.values_list("id", flat=True)[:HOME_PAGE_SIZE])
+
+    def measure(self, search):
+        timings = []
+        for q in self.queries:
+            start = time.perf_counter()
+            search(q)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.models import Upload
+from base.uploads import abandon_upload
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads (and their partial files) that stopped coming."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=24,
+            help="Hours since the last chunk arrived.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["older_than"])
+        count = 0
+        for upload in Upload.objects.filter(updated__lt=cutoff).iterator():
+            abandon_upload(upload)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} stale uploads"))
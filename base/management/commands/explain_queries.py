@@ -0,0 +1,86 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from base.activity import clear_activity
+from base.fixtures import page_urls, seed_pages
+from base.querydebug import explain
+
+# Plan lines that mean a whole table is read or sorted row by row.
+SCAN_PATTERNS = {
+    "sqlite": re.compile(
+        r"^SCAN (?!.*\bUSING (?:COVERING )?INDEX\b)|USE TEMP B-TREE FOR ORDER BY"
+    ),
+    "postgresql": re.compile(r"Seq Scan on|Sort\b"),
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the read-heavy pages, EXPLAIN every query they run and report "
+        "the ones that scan or sort a whole table instead of using an index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=50)
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Exit with an error if any sequential scan is found.",
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in SCAN_PATTERNS:
+            raise CommandError(f"EXPLAIN output of {vendor} is not supported")
+
+        findings = []
+        try:
+            with transaction.atomic():
+                if vendor == "postgresql":
+                    # The seeded tables are tiny; make the planner show whether
+                    # an index could be used at all.
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET LOCAL enable_seqscan = off")
+                seeded = seed_pages(options["rows"], "explain")
+                for name, url in page_urls(*seeded).items():
+                    findings += self.explain(name, url)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            clear_activity()
+
+        for name, sql, lines in findings:
+            self.stdout.write(self.style.WARNING(f"{name}: {sql}"))
+            for line in lines:
+                self.stdout.write(f"    {line}")
+        if findings and options["strict"]:
+            raise CommandError(f"{len(findings)} queries scan a whole table")
+        if not findings:
+            self.stdout.write(self.style.SUCCESS("No sequential scans found"))
+
+    def explain(self, name, url):
+        with CaptureQueriesContext(connection) as context:
+            response = Client().get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+        pattern = SCAN_PATTERNS[connection.vendor]
+        findings = []
+        for query in context.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            plan = explain(connection, sql)
+            lines = [line for line in plan if pattern.search(line.strip())]
+            if lines:
+                findings.append((name, sql, lines))
+        return findings
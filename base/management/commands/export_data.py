@@ -0,0 +1,45 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.bulk import BATCH_SIZE, KINDS, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream users, topics, classrooms, students or messages out as JSONL "
+        "or CSV, a chunk at a time so memory stays flat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(KINDS))
+        parser.add_argument("--output", default="-", help="File name, or - for stdout.")
+        parser.add_argument("--format", choices=["jsonl", "csv"])
+        parser.add_argument("--chunk-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        kind, output = options["kind"], options["output"]
+        file_format = options["format"] or (
+            "csv" if output.endswith(".csv") else "jsonl"
+        )
+
+        stream = sys.stdout if output == "-" else open(output, "w", newline="")
+        start = time.perf_counter()
+        count = 0
+        try:
+            rows = export_rows(kind, options["chunk_size"])
+            for count, _row in enumerate(
+                write_rows(stream, file_format, kind, rows), 1
+            ):
+                if count % options["chunk_size"] == 0:
+                    self.progress(kind, count, start)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.progress(kind, count, start)
+        self.stderr.write("")
+
+    def progress(self, kind, count, start):
+        rate = count / max(time.perf_counter() - start, 1e-9)
+        self.stderr.write(f"\r{kind}: {count} rows ({rate:.0f}/s)", ending="")
@@ -0,0 +1,165 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from base.bulk import BATCH_SIZE, IMPORTERS, batched, repair
+from base.models import Classroom, Conspect, User
+
+PREFIX = "gen"
+
+WORDS = (
+    "algebra calculus physics history essay lecture notes exam homework "
+    "question answer proof theorem lab report chapter summary deadline "
+    "group project reading seminar quiz formula derivation example"
+).split()
+
+
+def zipf_weights(count: int, exponent: float):
+    """
+    Rank-frequency weights: the first few items get most of the traffic,
+    like the popular classrooms and most active users of a real site.
+    """
+    ranks = range(1, count + 1)
+    return list(itertools.accumulate(1 / rank**exponent for rank in ranks))
+
+
+class Command(BaseCommand):
+    help = (
+        "Populate the database with a reproducible synthetic data set with "
+        "realistic skew, for benchmarks and load tests. Generated usernames "
+        f"start with '{PREFIX}-'; conspect files are not written to disk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--topics", type=int, default=50)
+        parser.add_argument("--classrooms", type=int, default=2000)
+        parser.add_argument("--students", type=int, default=20000)
+        parser.add_argument("--messages", type=int, default=100000)
+        parser.add_argument("--conspects", type=int, default=5000)
+        parser.add_argument("--skew", type=float, default=1.1)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.skew = options["skew"]
+        self.now = timezone.now()
+        start = time.perf_counter()
+
+        usernames = [f"{PREFIX}-{i}" for i in range(options["users"])]
+        self.load("users", self.users(usernames))
+        topics = [f"{self.word()}-{i}" for i in range(options["topics"])]
+        last_id = Classroom.objects.order_by("-pk").values_list("pk", flat=True).first()
+        first_id = (last_id or 0) + 1
+        classroom_ids = list(range(first_id, first_id + options["classrooms"]))
+        self.load("classrooms", self.classrooms(classroom_ids, usernames, topics))
+        self.load(
+            "students", self.students(options["students"], classroom_ids, usernames)
+        )
+        self.load(
+            "messages", self.messages(options["messages"], classroom_ids, usernames)
+        )
+        self.conspects(options["conspects"], classroom_ids, usernames)
+
+        repair(["users", "topics", "classrooms", "students", "messages"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated data in {time.perf_counter() - start:.1f}s")
+        )
+
+    def load(self, kind, rows):
+        count = 0
+        for batch in batched(rows, BATCH_SIZE):
+            with transaction.atomic():
+                count += IMPORTERS[kind](batch, self.now)
+            self.stderr.write(f"\r{kind}: {count} rows", ending="")
+        self.stderr.write("")
+
+    def word(self):
+        return self.random.choice(WORDS)
+
+    def sentence(self, words):
+        return " ".join(self.word() for _ in range(words)).capitalize()
+
+    def pick(self, population, weights, k=1):
+        return self.random.choices(population, cum_weights=weights, k=k)
+
+    def timestamp(self, after=None):
+        oldest = after or self.now - timedelta(days=365)
+        seconds = (self.now - oldest).total_seconds()
+        return oldest + timedelta(seconds=self.random.uniform(0, seconds))
+
+    def users(self, usernames):
+        for username in usernames:
+            yield {
+                "username": username,
+                "email": f"{username}@jazbahana.invalid",
+                "name": self.word()[:16],
+                "bio": self.sentence(self.random.randint(0, 20)),
+                "date_joined": self.timestamp().isoformat(),
+            }
+
+    def classrooms(self, ids, usernames, topics):
+        hosts = zipf_weights(len(usernames), self.skew)
+        topic_weights = zipf_weights(len(topics), self.skew)
+        self.created = {}
+        for pk in ids:
+            created = self.timestamp()
+            self.created[pk] = created
+            yield {
+                "id": pk,
+                "name": self.sentence(3)[:64],
+                "description": self.sentence(8)[:128],
+                "host": self.pick(usernames, hosts)[0],
+                "topic": self.pick(topics, topic_weights)[0],
+                "created": created.isoformat(),
+                "updated": created.isoformat(),
+            }
+
+    def students(self, count, classroom_ids, usernames):
+        classrooms = zipf_weights(len(classroom_ids), self.skew)
+        for _ in range(count):
+            yield {
+                "classroom": self.pick(classroom_ids, classrooms)[0],
+                "user": self.random.choice(usernames),
+            }
+
+    def messages(self, count, classroom_ids, usernames):
+        # Weights are shuffled against the ids, so popularity isn't tied to age.
+        classrooms = zipf_weights(len(classroom_ids), self.skew)
+        popular = self.random.sample(classroom_ids, len(classroom_ids))
+        authors = zipf_weights(len(usernames), self.skew)
+        for _ in range(count):
+            classroom = self.pick(popular, classrooms)[0]
+            created = self.timestamp(self.created[classroom]).isoformat()
+            yield {
+                "classroom": classroom,
+                "author": self.pick(usernames, authors)[0],
+                "body": self.sentence(self.random.randint(3, 40)),
+                "created": created,
+                "updated": created,
+            }
+
+    def conspects(self, count, classroom_ids, usernames):
+        ids = dict(
+            User.objects.filter(username__in=usernames).values_list("username", "pk")
+        )
+        authors = zipf_weights(len(usernames), self.skew)
+        classrooms = zipf_weights(len(classroom_ids), self.skew)
+        conspects = (
+            Conspect(
+                author_id=ids[self.pick(usernames, authors)[0]],
+                classroom_id=self.pick(classroom_ids, classrooms)[0],
+                description=self.sentence(4)[:128],
+                file=f"uploads/{PREFIX}-{i}.pdf",
+                filename=f"{PREFIX}-{i}.pdf",
+            )
+            for i in range(count)
+        )
+        for batch in batched(conspects, BATCH_SIZE):
+            Conspect.objects.bulk_create(batch)
+        self.stderr.write(f"conspects: {count} rows")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from base.models import User
+from base.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate avatar thumbnails for users that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Regenerate existing thumbnails too."
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(avatar="").exclude(avatar=None)
+        if not options["all"]:
+            users = users.exclude(avatar_thumbnails=F("avatar"))
+
+        count = 0
+        for user_id, name in users.values_list("pk", "avatar").iterator():
+            generate_thumbnails(user_id, name)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} avatars"))
@@ -0,0 +1,59 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from base.bulk import BATCH_SIZE, IMPORTERS, KINDS, batched, read_rows, repair
+
+
+class Command(BaseCommand):
+    help = (
+        "Load users, topics, classrooms, students or messages from JSONL or "
+        "CSV with bulk inserts, then repair the counters, the search index "
+        "and the caches the skipped signals would have maintained. Import "
+        "kinds in the order listed; rows that refer to missing users or "
+        "classrooms, or whose id, username or email is taken, are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(KINDS))
+        parser.add_argument("input", help="File name, or - for stdin.")
+        parser.add_argument("--format", choices=["jsonl", "csv"])
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        kind, source = options["kind"], options["input"]
+        file_format = options["format"] or (
+            "csv" if source.endswith(".csv") else "jsonl"
+        )
+        importer = IMPORTERS[kind]
+
+        stream = sys.stdin if source == "-" else open(source, newline="")
+        start = time.perf_counter()
+        read = imported = 0
+        try:
+            rows = read_rows(stream, file_format)
+            for batch in batched(rows, options["batch_size"]):
+                with transaction.atomic():
+                    imported += importer(batch, timezone.now())
+                read += len(batch)
+                rate = read / max(time.perf_counter() - start, 1e-9)
+                self.stderr.write(
+                    f"\r{kind}: {read} rows read, {imported} imported "
+                    f"({rate:.0f}/s)",
+                    ending="",
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stderr.write("")
+
+        repair([kind])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} of {read} {kind} rows, skipped "
+                f"{read - imported}, in {time.perf_counter() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,89 @@
+import asyncio
+import statistics
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.management.base import BaseCommand, CommandError
+
+from base.models import Classroom, Message, User
+
+# Every row the load test creates is named with this, so it never touches
+# (or collides with) real users and classrooms, nor those of another run.
+PREFIX = "loadtest-websockets-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold N concurrent classroom WebSockets against the ASGI application "
+        "in-process and measure how long each new message takes to reach all "
+        "of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=500)
+        parser.add_argument("--messages", type=int, default=20)
+        parser.add_argument("--timeout", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        name = PREFIX + uuid.uuid4().hex[:12]
+        user = User.objects.create(username=name, email=f"{name}@jazbahana.invalid")
+        classroom = Classroom.objects.create(host=user, name=name)
+        try:
+            asyncio.run(
+                self.run(
+                    user,
+                    classroom,
+                    options["connections"],
+                    options["messages"],
+                    options["timeout"],
+                )
+            )
+        finally:
+            # Its messages go with the classroom.
+            Classroom.objects.filter(pk=classroom.pk, name=name).delete()
+            User.objects.filter(pk=user.pk, username=name).delete()
+
+    async def run(self, user, classroom, connections, messages, timeout):
+        from jazbahana.asgi import application
+
+        scope = {
+            "type": "websocket",
+            "path": f"/ws/classroom/{classroom.id}/",
+            "headers": [],
+        }
+        sockets = [
+            ApplicationCommunicator(application, dict(scope))
+            for _ in range(connections)
+        ]
+
+        start = time.perf_counter()
+        for socket in sockets:
+            await socket.send_input({"type": "websocket.connect"})
+        accepted = await asyncio.gather(*(s.receive_output(timeout) for s in sockets))
+        connect_time = time.perf_counter() - start
+        if any(event["type"] != "websocket.accept" for event in accepted):
+            raise CommandError("Some sockets were not accepted")
+
+        create = sync_to_async(Message.objects.create)
+        latencies = []
+        try:
+            for i in range(messages):
+                start = time.perf_counter()
+                await create(author=user, classroom=classroom, body=f"load test {i}")
+                await asyncio.gather(*(s.receive_output(timeout) for s in sockets))
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            for socket in sockets:
+                await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+            for socket in sockets:
+                await socket.wait(timeout)
+
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(f"{connections} sockets accepted in {connect_time:.2f}s")
+        self.stdout.write(
+            f"Fan-out of {messages} messages: "
+            f"p50 {statistics.median(latencies):.2f}ms, p99 {p99:.2f}ms"
+        )
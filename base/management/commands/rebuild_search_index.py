@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base.models import Classroom, SearchDocument
+from base.search import build_document
+
+
+class Command(BaseCommand):
+    help = "Rebuild the classroom search documents from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        classrooms = Classroom.objects.select_related("host", "topic")
+
+        with transaction.atomic():
+            SearchDocument.objects.all().delete()
+            batch = []
+            for classroom in classrooms.iterator(chunk_size=batch_size):
+                batch.append(
+                    SearchDocument(
+                        classroom=classroom, document=build_document(classroom)
+                    )
+                )
+                if len(batch) >= batch_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    batch = []
+            SearchDocument.objects.bulk_create(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {SearchDocument.objects.count()} classrooms")
+        )
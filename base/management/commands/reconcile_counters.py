@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from base.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized counters and repair any that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted rows, do not update them.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile(fix=not options["dry_run"])
+
+        for label, rows in drift.items():
+            self.stdout.write(f"{label}: {rows} drifted rows")
+        verb = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {sum(drift.values())} rows"))
@@ -0,0 +1,167 @@
+import hashlib
+import posixpath
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from base.caching import bump, scope
+from base.models import Blob, Conspect, User
+from base.storage import content_hash
+from base.thumbnails import AVATAR_SIZES, FORMATS, generate_thumbnails, thumbnail_name
+
+
+def reference_counts(name=None) -> Counter:
+    """
+    The rows referring to each stored file, or only to `name`.
+    """
+    counts = Counter()
+    for model, field_name in ((Conspect, "file"), (User, "avatar")):
+        rows = model.objects.order_by()
+        if name is not None:
+            rows = rows.filter(**{field_name: name})
+        for row in rows.values(field_name).annotate(n=Count("pk")):
+            counts[row[field_name]] += row["n"]
+    return counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Move conspects and avatars saved before the content-addressed storage "
+        "into it, then recount the references of every blob."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-originals",
+            action="store_true",
+            help="Leave the old files under MEDIA_ROOT in place.",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Also rehash every blob and report those that don't match their name.",
+        )
+
+    def handle(self, *args, **options):
+        self.keep = options["keep_originals"]
+        conspects = self.migrate(Conspect, "file")
+        avatars = self.migrate(User, "avatar")
+        self.stdout.write(
+            f"Moved {len(conspects)} conspects and {len(avatars)} avatars"
+        )
+
+        if avatars:
+            # Pages cached with the old URLs would point at deleted files.
+            for user_id, name in avatars:
+                generate_thumbnails.enqueue(user_id=user_id, name=name)
+            bump(
+                scope("feed"),
+                scope("activity"),
+                *(scope("user", pk) for pk, _ in avatars),
+            )
+
+        drifted, freed = self.recount()
+        self.stdout.write(
+            f"Recounted references: {drifted} drifted, {freed} unused blobs deleted"
+        )
+        if options["verify"]:
+            self.verify()
+
+    def migrate(self, model, field_name):
+        """
+        Store every file of `field_name` that isn't a blob yet and point its
+        rows at the blob; returns the (pk, new name) of the rows changed.
+        """
+        field = model._meta.get_field(field_name)
+        storage = field.storage
+        names = (
+            model.objects.exclude(**{field_name: ""})
+            .exclude(**{field_name: None})
+            .exclude(**{field_name: field.default})
+            .order_by()
+            .values_list(field_name, flat=True)
+            .distinct()
+        )
+        migrated = []
+        for old in [name for name in names if not storage.owns(name)]:
+            try:
+                with storage.open(old, "rb") as f:
+                    new = storage.save(old, f)
+            except FileNotFoundError:
+                self.stderr.write(f"Missing: {old}")
+                continue
+
+            rows = model.objects.filter(**{field_name: old})
+            migrated += [(pk, new) for pk in rows.values_list("pk", flat=True)]
+            if model is Conspect:
+                rows.filter(filename="").update(filename=posixpath.basename(old))
+                rows.update(file=new, sha256=content_hash(new), size=storage.size(new))
+            else:
+                rows.update(avatar=new, avatar_thumbnails="")
+
+            if not self.keep:
+                storage.legacy.delete(old)
+                if model is User:
+                    for size in AVATAR_SIZES:
+                        for extension in FORMATS:
+                            storage.legacy.delete(thumbnail_name(old, size, extension))
+        return migrated
+
+    def recount(self):
+        """
+        Set every blob's reference count to the rows that refer to it; rows
+        written without the storage (like imports) aren't counted otherwise.
+        """
+        counts = reference_counts()
+        drifted = freed = 0
+        for blob in Blob.objects.iterator():
+            if counts[blob.name] == blob.references:
+                continue
+            # The counts are a snapshot: an upload may have added a reference
+            # since, so recount the blob under its row lock before changing it.
+            actual = self.fix_references(blob.pk)
+            if actual is not None:
+                drifted += 1
+                freed += not actual
+        return drifted, freed
+
+    def fix_references(self, pk):
+        """
+        Recount the references of one blob and fix its row, releasing the
+        file if nothing refers to it; returns the count if it had drifted.
+        """
+        storage = Conspect._meta.get_field("file").storage
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(pk=pk).first()
+            if blob is None:
+                return None
+            actual = reference_counts(blob.name)[blob.name]
+            if actual == blob.references:
+                return None
+            if actual:
+                Blob.objects.filter(pk=pk).update(references=actual)
+            else:
+                Blob.objects.filter(pk=pk).update(references=1)
+                storage.release(blob.name)
+        return actual
+
+    def verify(self):
+        storage = Conspect._meta.get_field("file").storage
+        broken = 0
+        for name in Blob.objects.values_list("name", flat=True).iterator():
+            digest = hashlib.sha256()
+            try:
+                with storage.open(name, "rb") as f:
+                    for chunk in f.chunks():
+                        digest.update(chunk)
+            except FileNotFoundError:
+                self.stderr.write(f"Missing blob: {name}")
+                broken += 1
+                continue
+            if digest.hexdigest() != content_hash(name):
+                self.stderr.write(f"Corrupt blob: {name}")
+                broken += 1
+        style = self.style.ERROR if broken else self.style.SUCCESS
+        self.stdout.write(style(f"Verified blobs, {broken} broken"))
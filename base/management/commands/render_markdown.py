@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from base.models import Message, User
+from base.rendering import backfill
+
+
+class Command(BaseCommand):
+    help = "Pre-render markdown for message bodies and user bios."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every row, not only the ones missing HTML.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        messages = Message.objects.exclude(body="")
+        users = User.objects.exclude(bio=None).exclude(bio="")
+        if not options["all"]:
+            messages = messages.filter(body_html="")
+            users = users.filter(bio_html="")
+
+        batch_size = options["batch_size"]
+        rendered = backfill(messages, "body", "body_html", batch_size)
+        self.stdout.write(f"Rendered {rendered} messages")
+        rendered = backfill(users, "bio", "bio_html", batch_size)
+        self.stdout.write(f"Rendered {rendered} bios")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,102 @@
+import multiprocessing
+import signal
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from base.tasks import claim, execute, has_due, requeue_stale, worker_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks (avatar thumbnails, conspect processing, "
+        "emails) in one or more worker processes until stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when no task is due.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=600,
+            help="Requeue tasks running longer than this many seconds.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once no task is due instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] == 1:
+            self.work(options)
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=self.work, args=(options,), daemon=True)
+            for _ in range(options["workers"])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # The children got the SIGINT too and finish their current task.
+            for process in processes:
+                process.join()
+
+    def work(self, options):
+        self.stopping = False
+
+        def stop(signum, frame):
+            self.stopping = True
+
+        # Finish the running task before exiting.
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        name = worker_name()
+        stale_after = timedelta(seconds=options["stale_after"])
+        self.stdout.write(f"Worker {name} started")
+        done = failed = 0
+        while not self.stopping:
+            close_old_connections()
+            try:
+                task = claim(name)
+            except DatabaseError as error:
+                # E.g. a busy SQLite file or a restarting database server.
+                self.stderr.write(f"Worker {name} could not claim a task: {error}")
+                time.sleep(options["poll"])
+                continue
+            if task is None:
+                if requeue_stale(stale_after):
+                    continue
+                # Due tasks may only be held back by their concurrency limit.
+                if options["burst"] and not has_due():
+                    break
+                time.sleep(options["poll"])
+                continue
+            if execute(task):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(f"Worker {name} stopped: {done} done, {failed} failed")
@@ -0,0 +1,267 @@
+import resource
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from django.template.backends.django import DjangoTemplates, Template
+
+# Upper bounds, in seconds, of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """
+    What one request spent, filled in by the query wrapper, the template
+    backend and the fragment cache while it is the current request.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.memory_peak: Optional[int] = None
+        # Coroutine views run a request's queries on several threads at once.
+        self.lock = threading.Lock()
+
+    def server_timing(self) -> str:
+        entries = [
+            f"total;dur={self.duration * 1000:.1f}",
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"tpl;dur={self.template_time * 1000:.1f}",
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ]
+        if self.memory_peak is not None:
+            entries.append(f'mem;desc="{self.memory_peak // 1024} KB peak"')
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "request_metrics", default=None
+)
+
+
+def begin_request() -> Tuple[RequestMetrics, object]:
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token) -> None:
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every database connection. It only counts
+    while a request is being measured, whichever thread runs the query.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        with metrics.lock:
+            metrics.queries += 1
+            metrics.db_time += elapsed
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache(outcome: str) -> None:
+    metrics = _current.get()
+    if metrics is None:
+        return
+    with metrics.lock:
+        if outcome == "hit":
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing every top-level render (views,
+    `render_to_string` and cached fragments) of the current request.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.count = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.memory_peak = 0
+
+
+class Registry:
+    """
+    Totals per URL name for this process. Every worker process keeps its
+    own, so scrape each of them (or sum them) in Prometheus.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views: Dict[str, ViewStats] = defaultdict(ViewStats)
+
+    def observe(self, view: str, method: str, status: int, metrics: RequestMetrics):
+        with self.lock:
+            stats = self.views[view]
+            stats.requests[(method, str(status))] += 1
+            position = bisect_left(DURATION_BUCKETS, metrics.duration)
+            if position < len(DURATION_BUCKETS):
+                stats.buckets[position] += 1
+            stats.duration += metrics.duration
+            stats.count += 1
+            stats.queries += metrics.queries
+            stats.db_time += metrics.db_time
+            stats.template_time += metrics.template_time
+            stats.cache_hits += metrics.cache_hits
+            stats.cache_misses += metrics.cache_misses
+            if metrics.memory_peak is not None:
+                stats.memory_peak = max(stats.memory_peak, metrics.memory_peak)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.views.clear()
+
+    def exposition(self) -> str:
+        """
+        The Prometheus text format (version 0.0.4).
+        """
+        from .caching import stats as fragment_stats
+
+        lines: List[str] = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP jazbahana_{name} {help_text}")
+            lines.append(f"# TYPE jazbahana_{name} {kind}")
+
+        with self.lock:
+            views = sorted(self.views.items())
+
+            family("requests_total", "counter", "Requests served, by URL name.")
+            for view, stats in views:
+                for (method, status), count in sorted(stats.requests.items()):
+                    labels = f'view="{view}",method="{method}",status="{status}"'
+                    lines.append(f"jazbahana_requests_total{{{labels}}} {count}")
+
+            family("request_duration_seconds", "histogram", "Wall time per request.")
+            for view, stats in views:
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        "jazbahana_request_duration_seconds_bucket"
+                        f'{{view="{view}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    "jazbahana_request_duration_seconds_bucket"
+                    f'{{view="{view}",le="+Inf"}} {stats.count}'
+                )
+                lines.append(
+                    "jazbahana_request_duration_seconds_sum"
+                    f'{{view="{view}"}} {stats.duration:.6f}'
+                )
+                lines.append(
+                    "jazbahana_request_duration_seconds_count"
+                    f'{{view="{view}"}} {stats.count}'
+                )
+
+            totals = [
+                ("db_queries_total", "Database queries run.", "queries", "{}"),
+                (
+                    "db_duration_seconds_total",
+                    "Time in database queries.",
+                    "db_time",
+                    "{:.6f}",
+                ),
+                (
+                    "template_duration_seconds_total",
+                    "Time rendering templates.",
+                    "template_time",
+                    "{:.6f}",
+                ),
+            ]
+            for name, help_text, attribute, pattern in totals:
+                family(name, "counter", help_text)
+                for view, stats in views:
+                    value = pattern.format(getattr(stats, attribute))
+                    lines.append(f'jazbahana_{name}{{view="{view}"}} {value}')
+
+            family("cache_requests_total", "counter", "Fragment cache lookups.")
+            for view, stats in views:
+                for result, value in (
+                    ("hit", stats.cache_hits),
+                    ("miss", stats.cache_misses),
+                ):
+                    lines.append(
+                        f'jazbahana_cache_requests_total{{view="{view}",result="{result}"}} '
+                        f"{value}"
+                    )
+
+            family(
+                "memory_peak_bytes",
+                "gauge",
+                "Highest traced allocation peak of a request.",
+            )
+            for view, stats in views:
+                lines.append(
+                    f'jazbahana_memory_peak_bytes{{view="{view}"}} {stats.memory_peak}'
+                )
+
+        family("fragment_cache_total", "counter", "Lookups per cached fragment.")
+        for (name, result), value in sorted(fragment_stats.items()):
+            lines.append(
+                f'jazbahana_fragment_cache_total{{fragment="{name}",result="{result}"}} {value}'
+            )
+
+        family(
+            "process_max_rss_bytes", "gauge", "Peak resident memory of this process."
+        )
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes.
+        lines.append(
+            f"jazbahana_process_max_rss_bytes {max_rss if sys.platform == 'darwin' else max_rss * 1024}"
+        )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
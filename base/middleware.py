@@ -0,0 +1,125 @@
+import asyncio
+import time
+import tracemalloc
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from .metrics import begin_request, end_request, registry
+from .querydebug import awatch_queries, watch_queries
+
+
+class HybridMiddleware:
+    """
+    Middleware that runs on the event loop when the rest of the stack is
+    async, so Django doesn't adapt the whole stack to sync around it.
+    Subclasses implement `sync_call` and `async_call`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Django only awaits the instance if it reads as a coroutine
+            # function.
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.async_call(request)
+        return self.sync_call(request)
+
+    def sync_call(self, request):
+        raise NotImplementedError
+
+    async def async_call(self, request):
+        raise NotImplementedError
+
+
+class WhiteNoiseMiddleware(HybridMiddleware, BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise, without a thread hop for every request under ASGI: finding
+    a static file is a dictionary lookup.
+    """
+
+    def __init__(self, get_response):
+        BaseWhiteNoiseMiddleware.__init__(self, get_response)
+        HybridMiddleware.__init__(self, get_response)
+
+    def sync_call(self, request):
+        return BaseWhiteNoiseMiddleware.__call__(self, request)
+
+    async def async_call(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+
+class PerformanceMiddleware(HybridMiddleware):
+    """
+    Measure every request that reaches Django: wall time, queries and their
+    time, template rendering, fragment cache lookups and, when enabled,
+    traced memory. Adds a `Server-Timing` header and feeds the per-URL-name
+    totals served at /metrics/.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.server_timing = getattr(settings, "PERFORMANCE_SERVER_TIMING", False)
+        self.trace_memory = getattr(settings, "PERFORMANCE_TRACE_MEMORY", False)
+
+    def sync_call(self, request):
+        metrics, token = self.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, metrics)
+
+    async def async_call(self, request):
+        metrics, token = self.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, metrics)
+
+    def begin(self):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # The peak is process-wide, so concurrent requests share it.
+            tracemalloc.reset_peak()
+        return begin_request()
+
+    def finish(self, request, response, metrics):
+        metrics.duration = time.perf_counter() - metrics.start
+        if self.trace_memory:
+            metrics.memory_peak = tracemalloc.get_traced_memory()[1]
+
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        registry.observe(view, request.method, response.status_code, metrics)
+        if self.server_timing:
+            response["Server-Timing"] = metrics.server_timing()
+        return response
+
+
+class QueryDebugMiddleware(HybridMiddleware):
+    """
+    Development only: report the N+1 statement shapes and the slow queries
+    of every request (see `base.querydebug`).
+    """
+
+    def sync_call(self, request):
+        with watch_queries(f"{request.method} {request.path}"):
+            return self.get_response(request)
+
+    async def async_call(self, request):
+        async with awatch_queries(f"{request.method} {request.path}"):
+            return await self.get_response(request)
@@ -0,0 +1,106 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def build_documents(apps, schema_editor):
+    Classroom = apps.get_model("base", "Classroom")
+    SearchDocument = apps.get_model("base", "SearchDocument")
+    classrooms = Classroom.objects.select_related("host", "topic")
+    documents = []
+    for classroom in classrooms.iterator(chunk_size=BATCH_SIZE):
+        parts = [
+            classroom.name,
+            classroom.description,
+            classroom.topic.name if classroom.topic else None,
+            classroom.host.username if classroom.host else None,
+        ]
+        documents.append(
+            SearchDocument(
+                classroom=classroom,
+                document=" ".join(part for part in parts if part),
+            )
+        )
+        if len(documents) == BATCH_SIZE:
+            SearchDocument.objects.bulk_create(documents, batch_size=BATCH_SIZE)
+            documents = []
+    SearchDocument.objects.bulk_create(documents, batch_size=BATCH_SIZE)
+
+
+def add_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        # An external-content FTS5 table over base_searchdocument, kept in
+        # sync by triggers.
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS base_searchdocument_fts USING fts5("
+            "document, content='base_searchdocument', content_rowid='classroom_id')"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER IF NOT EXISTS base_searchdocument_ai "
+            "AFTER INSERT ON base_searchdocument BEGIN "
+            "INSERT INTO base_searchdocument_fts(rowid, document) "
+            "VALUES (new.classroom_id, new.document); END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER IF NOT EXISTS base_searchdocument_ad "
+            "AFTER DELETE ON base_searchdocument BEGIN "
+            "INSERT INTO base_searchdocument_fts(base_searchdocument_fts, rowid, document) "
+            "VALUES ('delete', old.classroom_id, old.document); END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER IF NOT EXISTS base_searchdocument_au "
+            "AFTER UPDATE ON base_searchdocument BEGIN "
+            "INSERT INTO base_searchdocument_fts(base_searchdocument_fts, rowid, document) "
+            "VALUES ('delete', old.classroom_id, old.document); "
+            "INSERT INTO base_searchdocument_fts(rowid, document) "
+            "VALUES (new.classroom_id, new.document); END"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS base_searchdocument_document_gin "
+            "ON base_searchdocument USING gin (to_tsvector('simple', document))"
+        )
+
+
+def remove_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for trigger in ("ai", "ad", "au"):
+            schema_editor.execute(
+                f"DROP TRIGGER IF EXISTS base_searchdocument_{trigger}"
+            )
+        schema_editor.execute("DROP TABLE IF EXISTS base_searchdocument_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS base_searchdocument_document_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0014_alter_classroom_description_alter_classroom_name_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchDocument",
+            fields=[
+                (
+                    "classroom",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="base.classroom",
+                    ),
+                ),
+                ("document", models.TextField(blank=True, default="")),
+            ],
+        ),
+        migrations.RunPython(add_index, remove_index),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, field):
+    counted = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    Topic = apps.get_model("base", "Topic")
+    Classroom = apps.get_model("base", "Classroom")
+    Message = apps.get_model("base", "Message")
+    Topic.objects.update(classroom_count=count_of(Classroom.objects.all(), "topic"))
+    Classroom.objects.update(
+        student_count=count_of(Classroom.students.through.objects.all(), "classroom"),
+        message_count=count_of(Message.objects.all(), "classroom"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0015_searchdocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="classroom",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="classroom",
+            name="student_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="topic",
+            name="classroom_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:22
+
+import markdown
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill(model, source, target, rows):
+    """
+    Render `source` into `target` for every row, in primary-key batches.
+    A copy of `base.rendering.backfill` as it was, so later changes to it
+    don't change what this migration does.
+    """
+    converter = markdown.Markdown(extensions=["markdown.extensions.fenced_code"])
+    rows = rows.only("pk", source).order_by("pk")
+    last_pk = None
+    while True:
+        page = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        batch = list(page[0:BATCH_SIZE])
+        if not batch:
+            return
+        for instance in batch:
+            text = getattr(instance, source)
+            setattr(instance, target, converter.convert(text) if text else "")
+            converter.reset()
+        model.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+
+
+def render_existing(apps, schema_editor):
+    Message = apps.get_model("base", "Message")
+    User = apps.get_model("base", "User")
+    backfill(Message, "body", "body_html", Message.objects.all())
+    backfill(User, "bio", "bio_html", User.objects.exclude(bio=None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0016_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="body_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="bio_html",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(render_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+# Trigram indexes for the `icontains` lookups the views still run. Django
+# compiles `icontains` to `UPPER(col::text) LIKE UPPER(%s)` on PostgreSQL,
+# so the indexes are built on that exact expression. SQLite can't use an
+# index for a leading-wildcard LIKE, so it gets none of these.
+TRIGRAM_INDEXES = [
+    ("base_topic_name_trgm", "base_topic", "name"),
+    ("base_user_username_trgm", "base_user", "username"),
+    ("base_searchdocument_document_trgm", "base_searchdocument", "document"),
+]
+
+
+def add_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+            f"USING gin (UPPER({column}::text) gin_trgm_ops)"
+        )
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _table, _column in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0019_user_avatar_thumbnails"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="classroom",
+            index=models.Index(
+                fields=["-updated", "-created"], name="classroom_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="classroom",
+            index=models.Index(
+                fields=["host", "-updated"], name="classroom_host_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="classroom",
+            index=models.Index(
+                fields=["topic", "-updated"], name="classroom_topic_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conspect",
+            index=models.Index(
+                fields=["classroom", "-created"], name="conspect_classroom_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["-updated", "-created"], name="message_recent_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["classroom", "-updated", "-created"],
+                name="message_classroom_recent_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["author", "-updated"], name="message_author_recent_idx"
+            ),
+        ),
+        migrations.RunPython(add_trigram_indexes, remove_trigram_indexes),
+    ]
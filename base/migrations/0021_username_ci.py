@@ -0,0 +1,54 @@
+# Generated by Django 4.0.4 on 2026-10-18 06:32
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+import base.models
+
+
+def rename_case_duplicates(apps, schema_editor):
+    # Usernames that only differ in case would violate the new constraint;
+    # the oldest account keeps its name, later ones get a numeric suffix
+    # that no other account has, renamed or not.
+    User = apps.get_model("base", "User")
+    max_length = User._meta.get_field("username").max_length
+    users = list(User.objects.order_by("pk").only("username"))
+    taken = {user.username.lower() for user in users}
+    kept = set()
+    for user in users:
+        if user.username.lower() not in kept:
+            kept.add(user.username.lower())
+            continue
+        suffix = 1
+        username = user.username
+        while username.lower() in taken:
+            suffix += 1
+            username = f"{user.username[0:max_length - len(str(suffix))]}{suffix}"
+        taken.add(username.lower())
+        kept.add(username.lower())
+        user.username = username
+        user.save(update_fields=["username"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0020_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_case_duplicates, migrations.RunPython.noop),
+        migrations.AlterModelManagers(
+            name="user",
+            managers=[
+                ("objects", base.models.CustomUserManager()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="user",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("username"),
+                name="unique_username_ci",
+            ),
+        ),
+    ]
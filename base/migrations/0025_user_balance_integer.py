@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0024_blobs"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="user",
+            name="balance",
+            field=models.PositiveIntegerField(default=300),
+        ),
+    ]
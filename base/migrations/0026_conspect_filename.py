@@ -0,0 +1,20 @@
+# Generated by Django 4.0.4 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0025_user_balance_integer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conspect",
+            name="filename",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:05
+
+import re
+
+import markdown
+from django.db import migrations
+from django.db.models import Q
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+BATCH_SIZE = 500
+
+# A copy of `base.rendering.SafeHtmlExtension` as it was, so later changes
+# to it don't change what this migration does.
+SAFE_SCHEMES = {"http", "https", "mailto"}
+SCHEME = re.compile(r"^([a-z][a-z0-9+.-]*):")
+IGNORED_IN_URL = re.compile(r"[\x00-\x20]")
+
+
+class DropUnsafeUrls(Treeprocessor):
+    def run(self, root):
+        for element in root.iter():
+            for attribute in ("href", "src"):
+                url = IGNORED_IN_URL.sub("", element.get(attribute, "")).lower()
+                match = SCHEME.match(url)
+                if match and match[1] not in SAFE_SCHEMES:
+                    del element.attrib[attribute]
+
+
+class SafeHtmlExtension(Extension):
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister("html_block")
+        md.inlinePatterns.deregister("html")
+        md.treeprocessors.register(DropUnsafeUrls(md), "drop_unsafe_urls", 0)
+
+
+def rerender(model, source, target):
+    """
+    Render again the rows whose `source` may hold raw HTML or a URL scheme;
+    the others come out the same.
+    """
+    converter = markdown.Markdown(
+        extensions=["markdown.extensions.fenced_code", SafeHtmlExtension()]
+    )
+    rows = (
+        model.objects.filter(
+            Q(**{f"{source}__contains": "<"}) | Q(**{f"{source}__contains": ":"})
+        )
+        .only("pk", source)
+        .order_by("pk")
+    )
+    last_pk = None
+    while True:
+        page = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        batch = list(page[0:BATCH_SIZE])
+        if not batch:
+            return
+        for instance in batch:
+            text = getattr(instance, source)
+            setattr(instance, target, converter.convert(text) if text else "")
+            converter.reset()
+        model.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+
+
+def sanitize_existing(apps, schema_editor):
+    rerender(apps.get_model("base", "Message"), "body", "body_html")
+    rerender(apps.get_model("base", "User"), "bio", "bio_html")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0026_conspect_filename"),
+    ]
+
+    operations = [
+        migrations.RunPython(sanitize_existing, migrations.RunPython.noop),
+    ]
@@ -1,68 +1,333 @@
-from django.contrib.auth.models import AbstractUser
+import posixpath
+import uuid
+
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import validate_email
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from .rendering import render_markdown
+
+
+def render_markdown_field(instance, source, target, save_kwargs):
+    """
+    Pre-render `source` into `target` whenever a save writes `source`.
+    """
+    update_fields = save_kwargs.get("update_fields")
+    if update_fields is not None:
+        if source not in update_fields:
+            return
+        save_kwargs["update_fields"] = {*update_fields, target}
+    elif source in instance.get_deferred_fields():
+        # Not loaded, so not changed; saving it would fetch it first.
+        return
+    setattr(instance, target, render_markdown(getattr(instance, source)))
+
+
+class ManagedFieldsMixin:
+    """
+    Keep ordinary saves from overwriting columns that are only moved by
+    atomic F() updates: signal-maintained counters, ledger balances and
+    flags written by background workers.
+    """
+
+    managed_fields = ()
+
+    def save(self, *args, **kwargs):
+        if self.pk and not self._state.adding and kwargs.get("update_fields") is None:
+            # Like Django's own saves of deferred instances, leave out the
+            # fields that were never loaded instead of fetching each one.
+            skipped = {*self.managed_fields, *self.get_deferred_fields()}
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and not {field.name, field.attname} & skipped
+            ]
+        super().save(*args, **kwargs)
+
 
+class UserQuerySet(models.QuerySet):
+    def with_username(self, username):
+        """
+        Case-insensitive exact match, served by the `unique_username_ci` index.
+        """
+        return self.alias(username_lower=Lower("username")).filter(
+            username_lower=Lower(Value(username))
+        )
 
-class User(AbstractUser):
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class User(ManagedFieldsMixin, AbstractUser):
     name = models.CharField(max_length=16, null=True)
     email = models.EmailField(unique=True, null=True, validators=[validate_email])
     bio = models.TextField(max_length=128, null=True)
+    bio_html = models.TextField(blank=True, default="", editable=False)
     avatar = models.ImageField(null=True, default="avatar.svg", upload_to="avatars/")
-    balance = models.PositiveSmallIntegerField(default=300)
+    avatar_thumbnails = models.CharField(
+        max_length=255, blank=True, default="", editable=False
+    )
+    balance = models.PositiveIntegerField(default=300)
+
+    objects = CustomUserManager()
+
+    # `balance` is moved only by `base.ledger`, with F() updates under a row
+    # lock; `avatar_thumbnails` only by the thumbnail workers.
+    managed_fields = ("balance", "avatar_thumbnails")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(Lower("username"), name="unique_username_ci")
+        ]
+
+    def save(self, *args, **kwargs):
+        render_markdown_field(self, "bio", "bio_html", kwargs)
+        # Like `Conspect.save`, for the avatar's blob.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-class Topic(models.Model):
+
+class Topic(ManagedFieldsMixin, models.Model):
     name = models.CharField(max_length=16)
+    classroom_count = models.PositiveIntegerField(default=0, editable=False)
+
+    managed_fields = ("classroom_count",)
 
     def __str__(self):
         return self.name
 
 
-class Classroom(models.Model):
+class ClassroomQuerySet(models.QuerySet):
+    def for_feed(self):
+        """
+        Everything `feed_component.html` touches, fetched in one query.
+        """
+        return self.select_related("host", "topic")
+
+
+class Classroom(ManagedFieldsMixin, models.Model):
     host = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     topic = models.ForeignKey(Topic, on_delete=models.SET_NULL, null=True)
     name = models.CharField(max_length=64)
     description = models.CharField(max_length=128, null=True, blank=True)
     students = models.ManyToManyField(User, related_name="students", blank=True)
+    student_count = models.PositiveIntegerField(default=0, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ClassroomQuerySet.as_manager()
+
+    managed_fields = ("student_count", "message_count")
+
     class Meta:
         ordering = ["-updated", "-created"]
+        indexes = [
+            models.Index(fields=["-updated", "-created"], name="classroom_recent_idx"),
+            models.Index(fields=["host", "-updated"], name="classroom_host_recent_idx"),
+            models.Index(
+                fields=["topic", "-updated"], name="classroom_topic_recent_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Like `Message.save`, for the topics' `classroom_count`.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class MessageQuerySet(models.QuerySet):
+    def for_activity(self):
+        return self.select_related("author", "classroom")
+
 
 class Message(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE)
     body = models.TextField()
+    body_html = models.TextField(blank=True, default="", editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ["-updated", "-created"]
+        indexes = [
+            models.Index(fields=["-updated", "-created"], name="message_recent_idx"),
+            models.Index(
+                fields=["classroom", "-updated", "-created"],
+                name="message_classroom_recent_idx",
+            ),
+            models.Index(
+                fields=["author", "-updated"], name="message_author_recent_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.body[0:32]} ..."
 
+    def save(self, *args, **kwargs):
+        render_markdown_field(self, "body", "body_html", kwargs)
+        # The classroom's `message_count` moves in `post_save`, and has to
+        # commit or roll back along with the row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class Conspect(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE)
     description = models.CharField(max_length=128, null=True)
     file = models.FileField(upload_to="uploads/")
+    # The name the file was uploaded with; `file` is named after its contents.
+    filename = models.CharField(max_length=255, blank=True, default="", editable=False)
+    # Filled in by the `process_conspect` task after the upload.
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            models.Index(
+                fields=["classroom", "-created"], name="conspect_classroom_recent_idx"
+            ),
+        ]
 
     def __str__(self):
         if self.description:
-            file_extension = self.file.name.split(".")[-1]
+            file_extension = self.display_name.split(".")[-1]
             return f"[.{file_extension}] {self.description}"
-        return f"images/{self.file.name}"
+        return self.display_name
+
+    @property
+    def display_name(self) -> str:
+        return self.filename or posixpath.basename(self.file.name)
+
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed and not self.filename:
+            # Saving the file renames it after its contents.
+            self.filename = posixpath.basename(self.file.name)[0:255]
+        # The blob's new reference commits with the row that holds it, so
+        # `rehash_media` never finds one without the other.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Blob(models.Model):
+    """
+    A file of the content-addressed storage (`base.storage.BlobStorage`) and
+    the number of rows referring to it; the file goes with the last one.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+
+class Upload(models.Model):
+    """
+    A conspect file being uploaded in chunks (see `base.uploads`). Chunks
+    are written in order into `file`, a file on the blob storage's
+    filesystem that is moved to its content address once complete.
+    """
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE)
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE)
+    description = models.CharField(max_length=128, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    file = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class SearchDocument(models.Model):
+    classroom = models.OneToOneField(
+        Classroom,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+    )
+    document = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return self.document[0:32]
+
+
+class Purchase(models.Model):
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="purchases")
+    seller = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, related_name="sales"
+    )
+    conspect = models.ForeignKey(Conspect, on_delete=models.SET_NULL, null=True)
+    price = models.PositiveSmallIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["buyer", "conspect"], name="unique_purchase_per_buyer"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.buyer} -> {self.conspect} ({self.price})"
+
+
+class Task(models.Model):
+    """
+    A queued call of a function registered with `base.tasks.task`, run by
+    the `run_tasks` workers.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=128)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField()
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=64, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The workers' polling query: due tasks, oldest first.
+            models.Index(fields=["status", "run_after"], name="task_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name}({self.kwargs}) [{self.status}]"
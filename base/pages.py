@@ -0,0 +1,63 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .rendering import render_markdown
+
+
+class MarkdownPage:
+    def __init__(self, path: Path):
+        self.path = path
+        self.name = path.stem
+        self.mtime = 0.0
+        self.html = ""
+        self.etag = ""
+
+    def refresh(self) -> "MarkdownPage":
+        """
+        Re-render the page when the file on disk changed since the last load.
+        """
+        mtime = os.stat(self.path).st_mtime
+        if mtime != self.mtime:
+            source = self.path.read_text()
+            self.html = render_markdown(source)
+            self.etag = hashlib.sha1(source.encode()).hexdigest()
+            self.mtime = mtime
+        return self
+
+
+class MarkdownPages:
+    """
+    Rendered markdown files from one directory, loaded once at startup.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.pages: Dict[str, MarkdownPage] = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        for path in sorted(self.directory.glob("*.md")):
+            self.get(path.stem)
+
+    def get(self, name: str) -> Optional[MarkdownPage]:
+        page = self.pages.get(name)
+        if page is None:
+            path = self.directory / f"{name}.md"
+            if "/" in name or not path.is_file():
+                return None
+            page = MarkdownPage(path)
+        try:
+            with self.lock:
+                self.pages[name] = page.refresh()
+        except FileNotFoundError:
+            self.pages.pop(name, None)
+            return None
+        return page
+
+
+markdown_pages = MarkdownPages(settings.BASE_DIR / "static/markdown")
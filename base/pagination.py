@@ -0,0 +1,87 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items: List[Any], next_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _field(queryset: QuerySet, ordering: str):
+    name = ordering.lstrip("-")
+    if name == "pk":
+        return queryset.model._meta.pk
+    return queryset.model._meta.get_field(name)
+
+
+def encode_cursor(queryset: QuerySet, ordering: Sequence[str], instance) -> str:
+    values = [_field(queryset, key).value_to_string(instance) for key in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(queryset: QuerySet, ordering: Sequence[str], cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(ordering):
+            raise InvalidCursor(cursor)
+        return [
+            _field(queryset, key).to_python(value)
+            for key, value in zip(ordering, values)
+        ]
+    except (ValueError, TypeError, ValidationError) as error:
+        raise InvalidCursor(cursor) from error
+
+
+def keyset_page(
+    queryset: QuerySet,
+    ordering: Sequence[str],
+    cursor: Optional[str] = None,
+    size: int = 20,
+) -> KeysetPage:
+    """
+    Return the `size` rows that follow `cursor` in `ordering`.
+
+    Unlike OFFSET pagination every page is a single range scan on the
+    ordering columns, so deep pages cost the same as the first one. The
+    last entry of `ordering` must be unique (usually the primary key).
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(queryset, ordering, cursor)
+        after = Q()
+        for position, key in enumerate(ordering):
+            name = key.lstrip("-")
+            lookup = "lt" if key.startswith("-") else "gt"
+            condition = Q(**{f"{name}__{lookup}": values[position]})
+            for previous_key, value in zip(ordering[:position], values):
+                condition &= Q(**{previous_key.lstrip("-"): value})
+            after |= condition
+        queryset = queryset.filter(after)
+
+    # One extra row tells whether another page follows, without a COUNT.
+    limit = size + 1
+    rows = list(queryset[:limit])
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(queryset, ordering, rows[-1])
+    return KeysetPage(rows, next_cursor)
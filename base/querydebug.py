@@ -0,0 +1,212 @@
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template.base import Node
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Identical statement shapes per request before they count as an N+1.
+    "REPEAT_THRESHOLD": 5,
+    # Statements slower than this are logged with their query plan.
+    "SLOW_QUERY_MS": 100,
+    # Raise `RepeatedQueriesError` instead of logging, e.g. under the tests.
+    "RAISE": False,
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+_SPACE = re.compile(r"\s+")
+_IGNORED = re.compile(r"^(?:SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b")
+
+_SOURCE_ROOT = str(Path(settings.BASE_DIR)) + "/"
+# The execute wrappers themselves are never the origin of a query.
+_WRAPPERS = {__file__, metrics.__file__}
+
+
+class RepeatedQueriesError(Exception):
+    pass
+
+
+def get_setting(name: str):
+    return getattr(settings, "QUERY_DEBUG", {}).get(name, DEFAULTS[name])
+
+
+def normalize(sql: str) -> str:
+    """
+    The shape of a statement: literals and parameters become `?` and an
+    `IN (...)` list of any length reads the same.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDERS.sub("(...)", sql)
+    return _SPACE.sub(" ", sql.replace("%s", "?")).strip()
+
+
+def query_origin() -> str:
+    """
+    Where the running query comes from: the innermost template node being
+    rendered, if any, and the innermost frame of this project's own code.
+    """
+    template = code = None
+    frame = sys._getframe(1)
+    while frame is not None and not (template and code):
+        filename = frame.f_code.co_filename
+        if template is None and frame.f_code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            if isinstance(node, Node) and getattr(node, "token", None):
+                name = node.origin.template_name or node.origin.name
+                template = f"{name}:{node.token.lineno}"
+        own = filename.startswith(_SOURCE_ROOT) and "site-packages" not in filename
+        if code is None and own and filename not in _WRAPPERS:
+            path = filename.replace(_SOURCE_ROOT, "", 1)
+            code = f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return " via ".join(part for part in (template, code) if part) or "unknown"
+
+
+class Query(NamedTuple):
+    alias: str
+    sql: str
+    params: Optional[tuple]
+    duration: float
+    origin: str
+
+
+class QueryLog:
+    def __init__(self, label: str):
+        self.label = label
+        self.queries: List[Query] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                Query(
+                    context["connection"].alias,
+                    sql,
+                    None if many else params,
+                    time.perf_counter() - start,
+                    query_origin(),
+                )
+            )
+
+    def repeated(self, threshold: int) -> Dict[str, List[Query]]:
+        shapes = defaultdict(list)
+        for query in self.queries:
+            shape = normalize(query.sql)
+            if not _IGNORED.match(shape):
+                shapes[shape].append(query)
+        return {
+            shape: queries
+            for shape, queries in shapes.items()
+            if len(queries) >= threshold
+        }
+
+    def slow(self, threshold_ms: float) -> List[Query]:
+        return [query for query in self.queries if query.duration * 1000 > threshold_ms]
+
+
+def explain(connection, sql: str, params=None) -> List[str]:
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+_current: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+
+def debug_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every database connection; only records
+    inside `watch_queries`.
+    """
+    log = _current.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    return log(execute, sql, params, many, context)
+
+
+def install_debug_wrapper(sender, connection, **kwargs):
+    if debug_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(debug_query)
+
+
+def report(log: QueryLog, raise_errors: bool) -> None:
+    repeated = log.repeated(get_setting("REPEAT_THRESHOLD"))
+    lines = []
+    for shape, queries in repeated.items():
+        origins = sorted({query.origin for query in queries})
+        lines.append(f"{len(queries)} x {shape}")
+        lines += [f"    from {origin}" for origin in origins]
+    if lines and raise_errors:
+        raise RepeatedQueriesError(
+            f"Repeated queries in {log.label}:\n" + "\n".join(lines)
+        )
+    if lines:
+        logger.warning("Repeated queries in %s:\n%s", log.label, "\n".join(lines))
+
+    for query in log.slow(get_setting("SLOW_QUERY_MS")):
+        try:
+            plan = explain(connections[query.alias], query.sql, query.params)
+        except DatabaseError as error:
+            plan = [f"EXPLAIN failed: {error}"]
+        logger.warning(
+            "Slow query in %s (%.1f ms) from %s:\n%s\n%s",
+            log.label,
+            query.duration * 1000,
+            query.origin,
+            query.sql,
+            "\n".join(f"    {line}" for line in plan),
+        )
+
+
+@contextmanager
+def watch_queries(label: str = "block", raise_errors: Optional[bool] = None):
+    """
+    Record the queries run inside the block, then log the statement shapes
+    repeated at least `REPEAT_THRESHOLD` times (or raise, with
+    `raise_errors`) and EXPLAIN the slow ones.
+    """
+    log = QueryLog(label)
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+    report(log, get_setting("RAISE") if raise_errors is None else raise_errors)
+
+
+@asynccontextmanager
+async def awatch_queries(label: str = "block", raise_errors: Optional[bool] = None):
+    """
+    `watch_queries` for coroutines; the report may EXPLAIN, so it runs in a
+    worker thread.
+    """
+    log = QueryLog(label)
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+    if raise_errors is None:
+        raise_errors = get_setting("RAISE")
+    await sync_to_async(report)(log, raise_errors)
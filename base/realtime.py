@@ -0,0 +1,198 @@
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.request import validate_host
+from django.utils.module_loading import import_string
+
+from .thumbnails import thumbnail_url
+
+CLASSROOM_SOCKET_PATH = re.compile(r"^/ws/classroom/(?P<pk>\d+)/$")
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+def classroom_group(classroom_id) -> str:
+    return f"classroom-{classroom_id}"
+
+
+class Subscription:
+    def __init__(self, group: str):
+        self.group = group
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(
+            SUBSCRIPTION_QUEUE_SIZE
+        )
+
+    def deliver(self, payload: Dict[str, Any]) -> None:
+        # Runs on the subscriber's loop. A client that stopped reading loses
+        # its oldest events instead of growing the queue without bound.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+
+class InMemoryBroker:
+    """
+    Fan-out within a single process. `publish` may be called from any
+    thread, including the sync threads Django runs views and signals in.
+    """
+
+    def __init__(self):
+        self.groups: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, group: str) -> Subscription:
+        subscription = Subscription(group)
+        with self.lock:
+            self.groups[group].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            subscribers = self.groups.get(subscription.group, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.groups.pop(subscription.group, None)
+
+    def publish(self, group: str, payload: Dict[str, Any]) -> None:
+        with self.lock:
+            subscribers = list(self.groups.get(group, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, payload)
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    The broker named by `settings.REALTIME_BROKER`, created on first use.
+    """
+    global _broker
+    if _broker is None:
+        path = getattr(settings, "REALTIME_BROKER", "base.realtime.InMemoryBroker")
+        _broker = import_string(path)()
+    return _broker
+
+
+def message_payload(message) -> Dict[str, Any]:
+    return {
+        "type": "message",
+        "id": message.id,
+        "author": message.author.username,
+        "avatar": thumbnail_url(message.author, "small"),
+        "body_html": message.body_html,
+        "created": message.created.isoformat(),
+    }
+
+
+def publish_message(message) -> None:
+    get_broker().publish(
+        classroom_group(message.classroom_id), message_payload(message)
+    )
+
+
+def _origin_allowed(scope) -> bool:
+    headers = dict(scope.get("headers", []))
+    origin = headers.get(b"origin")
+    if origin is None:
+        return True
+    host = urlparse(origin.decode("latin1")).netloc
+    return validate_host(host.split(":")[0], settings.ALLOWED_HOSTS)
+
+
+def _scope_user(scope):
+    headers = dict(scope.get("headers", []))
+    cookies = SimpleCookie(headers.get(b"cookie", b"").decode("latin1"))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(morsel.value if morsel else None)
+    return get_user(SimpleNamespace(session=session))
+
+
+def _classroom_exists(pk) -> bool:
+    from .models import Classroom
+
+    return Classroom.objects.filter(pk=pk).exists()
+
+
+def _post_message(user, pk, body: str) -> None:
+    from .models import Classroom, Message
+
+    classroom = Classroom.objects.get(pk=pk)
+    Message.objects.create(author=user, classroom=classroom, body=body)
+    classroom.students.add(user)
+
+
+async def classroom_socket(scope, receive, send, pk) -> None:
+    """
+    One WebSocket per open classroom page. New messages in the classroom are
+    pushed as JSON; authenticated clients can post `{"body": "..."}`.
+    """
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+    if not _origin_allowed(scope) or not await sync_to_async(_classroom_exists)(pk):
+        await send({"type": "websocket.close", "code": 4403})
+        return
+
+    user = await sync_to_async(_scope_user)(scope)
+    await send({"type": "websocket.accept"})
+    broker = get_broker()
+    subscription = broker.subscribe(classroom_group(pk))
+
+    async def forward():
+        async for payload in subscription:
+            await send({"type": "websocket.send", "text": json.dumps(payload)})
+
+    async def listen():
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                return
+            body = _incoming_body(event)
+            if body and user.is_authenticated:
+                await sync_to_async(_post_message)(user, pk, body)
+
+    tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(listen())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        broker.unsubscribe(subscription)
+
+
+def _incoming_body(event) -> Optional[str]:
+    try:
+        data = json.loads(event.get("text") or "")
+    except ValueError:
+        return None
+    body = data.get("body") if isinstance(data, dict) else None
+    return body.strip() if isinstance(body, str) else None
+
+
+async def websocket_application(scope, receive, send) -> None:
+    match = CLASSROOM_SOCKET_PATH.match(scope["path"])
+    if match is None:
+        await receive()
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    await classroom_socket(scope, receive, send, int(match["pk"]))
@@ -0,0 +1,144 @@
+import re
+from typing import List
+
+from django.db import connection
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+
+from .models import Classroom, SearchDocument
+
+# Created, along with the triggers that fill it, by migration 0015.
+FTS_TABLE = "base_searchdocument_fts"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_document(classroom: Classroom) -> str:
+    parts = [
+        classroom.name,
+        classroom.description,
+        classroom.topic.name if classroom.topic else None,
+        classroom.host.username if classroom.host else None,
+    ]
+    return " ".join(part for part in parts if part)
+
+
+def tokenize(q: str) -> List[str]:
+    return _TOKEN_RE.findall(q.lower())
+
+
+class IContainsBackend:
+    """
+    Portable fallback: a single LIKE scan over the denormalized documents,
+    newest first.
+    """
+
+    def search(self, classrooms: QuerySet, q: str) -> QuerySet:
+        for token in tokenize(q):
+            classrooms = classrooms.filter(search_document__document__icontains=token)
+        return classrooms
+
+
+class SQLiteBackend:
+    """
+    FTS5 virtual table kept in sync with `SearchDocument` by triggers,
+    ranked by its bm25 `rank` (lower is better).
+    """
+
+    def search(self, classrooms: QuerySet, q: str) -> QuerySet:
+        tokens = tokenize(q)
+        if not tokens:
+            return classrooms.none()
+        match = " ".join(f'"{token}"*' for token in tokens)
+        table = classrooms.model._meta.db_table
+        # A rowid constraint next to MATCH seeks straight to that row's entry.
+        rank = RawSQL(
+            f"SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"AND rowid = {table}.id",
+            [match],
+        )
+        return (
+            classrooms.filter(
+                id__in=RawSQL(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                    [match],
+                )
+            )
+            .alias(search_rank=rank)
+            .order_by("search_rank", "-updated", "-created")
+        )
+
+
+class PostgreSQLBackend:
+    """
+    `tsvector` expression backed by a GIN index, ranked with `ts_rank`.
+    """
+
+    def search(self, classrooms: QuerySet, q: str) -> QuerySet:
+        tokens = tokenize(q)
+        if not tokens:
+            return classrooms.none()
+        query = " & ".join(f"{token}:*" for token in tokens)
+        table = classrooms.model._meta.db_table
+        rank = RawSQL(
+            "SELECT ts_rank(to_tsvector('simple', document), "
+            "to_tsquery('simple', %s)) FROM base_searchdocument "
+            f"WHERE classroom_id = {table}.id",
+            [query],
+        )
+        return (
+            classrooms.filter(
+                id__in=RawSQL(
+                    "SELECT classroom_id FROM base_searchdocument "
+                    "WHERE to_tsvector('simple', document) @@ to_tsquery('simple', %s)",
+                    [query],
+                )
+            )
+            .alias(search_rank=rank)
+            .order_by("-search_rank", "-updated", "-created")
+        )
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "postgresql": PostgreSQLBackend,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, IContainsBackend)()
+
+
+def search_classrooms(q: str) -> QuerySet:
+    """
+    Return all classrooms matching `q`, best matches first. Ranking happens
+    in the database, so the result can be counted and paginated as is.
+    """
+    return get_backend().search(Classroom.objects.all(), q)
+
+
+def index_classroom(classroom: Classroom) -> None:
+    SearchDocument.objects.update_or_create(
+        classroom=classroom, defaults={"document": build_document(classroom)}
+    )
+
+
+def index_classrooms(classrooms) -> None:
+    for classroom in classrooms.select_related("host", "topic"):
+        index_classroom(classroom)
+
+
+def index_new_classrooms(classrooms: QuerySet, batch_size: int = 1000) -> None:
+    """
+    Create the documents of classrooms that have none yet (imported with
+    `bulk_create`, which sends no signals), with bulk inserts.
+    """
+    SearchDocument.objects.bulk_create(
+        (
+            SearchDocument(classroom=classroom, document=build_document(classroom))
+            for classroom in classrooms.filter(search_document=None)
+            .select_related("host", "topic")
+            .iterator(chunk_size=batch_size)
+        ),
+        batch_size=batch_size,
+    )
@@ -0,0 +1,292 @@
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from .activity import record_activity
+from .caching import bump, scope
+from .counters import increment, refresh_message_counts, refresh_student_counts
+from .models import Classroom, Conspect, Message, Topic, User
+from .realtime import publish_message
+from .search import index_classroom, index_classrooms
+
+# The classrooms and users being deleted. Their messages go with them, one
+# post_delete each, so the message receivers skip those and the counters and
+# caches are fixed once, after the classroom or user itself is gone. (Should
+# the delete fail, the entry stays until that row is deleted again; a count
+# it throws off is repaired by `reconcile_counters`.)
+_deleting: ContextVar[frozenset] = ContextVar("deleting", default=frozenset())
+
+
+def _cascading(message) -> bool:
+    deleting = _deleting.get()
+    return ("classroom", message.classroom_id) in deleting or (
+        "user",
+        message.author_id,
+    ) in deleting
+
+
+def _begin_cascade(kind: str, pk) -> None:
+    _deleting.set(_deleting.get() | {(kind, pk)})
+
+
+def _end_cascade(kind: str, pk) -> None:
+    _deleting.set(_deleting.get() - {(kind, pk)})
+
+
+@receiver(post_save, sender=Classroom)
+def classroom_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_classroom(instance)
+
+
+@receiver(post_init, sender=Topic)
+def topic_loaded(sender, instance, **kwargs):
+    instance._loaded_name = instance.__dict__.get("name")
+
+
+@receiver(post_save, sender=Topic)
+def topic_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Every save writes the name, so compare it with the one loaded.
+    name = instance.__dict__.get("name")
+    saved = update_fields is None or "name" in update_fields
+    if saved and not (raw or created) and name != instance._loaded_name:
+        index_classrooms(instance.classroom_set.all())
+        instance._loaded_name = name
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins and profile edits leave the username, the only indexed field.
+    username = instance.__dict__.get("username")
+    saved = update_fields is None or "username" in update_fields
+    if saved and not (raw or created) and username != instance._loaded_username:
+        index_classrooms(instance.classroom_set.all())
+        instance._loaded_username = username
+
+
+@receiver(post_init, sender=Classroom)
+def classroom_loaded(sender, instance, **kwargs):
+    # Remember the topic the row was loaded with, without an extra query.
+    instance._loaded_topic_id = instance.__dict__.get("topic_id")
+
+
+@receiver(post_save, sender=Classroom)
+def classroom_count_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else instance._loaded_topic_id
+    if created or previous != instance.topic_id:
+        if previous:
+            increment(Topic.objects.filter(pk=previous), "classroom_count", -1)
+        if instance.topic_id:
+            increment(Topic.objects.filter(pk=instance.topic_id), "classroom_count", 1)
+    instance._loaded_topic_id = instance.topic_id
+
+
+@receiver(post_delete, sender=Classroom)
+def classroom_count_deleted(sender, instance, **kwargs):
+    if instance.topic_id:
+        increment(Topic.objects.filter(pk=instance.topic_id), "classroom_count", -1)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    # Remember the avatar and username the row was loaded with (absent when
+    # deferred).
+    avatar = instance.__dict__.get("avatar")
+    instance._loaded_avatar = getattr(avatar, "name", avatar)
+    instance._loaded_username = instance.__dict__.get("username")
+
+
+def release_file(storage, name) -> None:
+    """
+    Drop a row's reference to a stored file once the change is committed;
+    the blob storage deletes the file with its last reference.
+    """
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_save, sender=User)
+def user_avatar_saved(sender, instance, created, raw=False, **kwargs):
+    previous = instance._loaded_avatar
+    avatar = instance.__dict__.get("avatar")
+    current = getattr(avatar, "name", avatar)
+    if not (raw or created) and previous and previous != current:
+        release_file(User._meta.get_field("avatar").storage, previous)
+    instance._loaded_avatar = current
+
+
+@receiver(post_delete, sender=User)
+def user_avatar_deleted(sender, instance, **kwargs):
+    release_file(User._meta.get_field("avatar").storage, instance._loaded_avatar)
+
+
+@receiver(post_delete, sender=Conspect)
+def conspect_file_deleted(sender, instance, **kwargs):
+    release_file(instance.file.storage, instance.file.name)
+
+
+@receiver(post_save, sender=Message)
+def message_count_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(
+            Classroom.objects.filter(pk=instance.classroom_id), "message_count", 1
+        )
+
+
+@receiver(post_save, sender=Message)
+def message_broadcast(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: publish_message(instance))
+
+
+@receiver(post_save, sender=Message)
+def message_activity(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: record_activity(instance))
+
+
+@receiver(post_delete, sender=Message)
+def message_count_deleted(sender, instance, **kwargs):
+    if not _cascading(instance):
+        increment(
+            Classroom.objects.filter(pk=instance.classroom_id), "message_count", -1
+        )
+
+
+@receiver(pre_delete, sender=Classroom)
+def classroom_deleting(sender, instance, **kwargs):
+    instance._message_author_ids = set(
+        Message.objects.filter(classroom=instance)
+        .order_by()
+        .values_list("author_id", flat=True)
+        .distinct()
+    )
+    _begin_cascade("classroom", instance.pk)
+
+
+@receiver(post_delete, sender=Classroom)
+def classroom_deleted(sender, instance, **kwargs):
+    _end_cascade("classroom", instance.pk)
+    author_ids = getattr(instance, "_message_author_ids", ())
+    if author_ids:
+        bump(scope("activity"), *(scope("user", pk) for pk in author_ids))
+
+
+@receiver(m2m_changed, sender=Classroom.students.through)
+def students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # The classrooms are gone from the through table by `post_clear`.
+        instance._cleared_classroom_ids = list(
+            instance.students.values_list("pk", flat=True)
+        )
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        classroom_ids = [instance.pk]
+    elif action == "post_clear":
+        classroom_ids = getattr(instance, "_cleared_classroom_ids", [])
+    else:
+        classroom_ids = pk_set
+    refresh_student_counts(classroom_ids)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Deleting a user drops its rows from the through table without
+    # `m2m_changed`, and its messages without their receivers (see
+    # `_deleting`), so recount the classrooms involved afterwards.
+    instance._joined_classroom_ids = set(instance.students.values_list("pk", flat=True))
+    instance._message_classroom_ids = set(
+        Message.objects.filter(author=instance)
+        .order_by()
+        .values_list("classroom_id", flat=True)
+        .distinct()
+    )
+    _begin_cascade("user", instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    _end_cascade("user", instance.pk)
+    joined = getattr(instance, "_joined_classroom_ids", set())
+    posted = getattr(instance, "_message_classroom_ids", set())
+    if joined:
+        refresh_student_counts(joined)
+    if posted:
+        refresh_message_counts(posted)
+    if joined or posted:
+        bump(*(scope("classroom", pk) for pk in joined | posted))
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def topic_changed(sender, instance, **kwargs):
+    bump(scope("topics"), scope("topic", instance.pk), scope("feed"), scope("activity"))
+
+
+@receiver(post_save, sender=Classroom)
+@receiver(post_delete, sender=Classroom)
+def classroom_changed(sender, instance, **kwargs):
+    # Counts and names show up in the feed, the host's profile and the topics.
+    scopes = [scope("classroom", instance.pk), scope("feed"), scope("topics")]
+    scopes += [scope("user", instance.host_id), scope("topic", instance.topic_id)]
+    bump(*scopes)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    if _cascading(instance):
+        return
+    bump(
+        scope("classroom", instance.classroom_id),
+        scope("user", instance.author_id),
+        scope("activity"),
+    )
+
+
+@receiver(post_save, sender=Conspect)
+@receiver(post_delete, sender=Conspect)
+def conspect_changed(sender, instance, **kwargs):
+    bump(scope("classroom", instance.classroom_id), scope("user", instance.author_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    bump(scope("user", instance.pk), scope("feed"), scope("activity"))
+
+
+@receiver(m2m_changed, sender=Classroom.students.through)
+def students_cache_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        classroom_ids = [instance.pk]
+        user_ids = list(pk_set or ())
+    else:
+        classroom_ids = (
+            getattr(instance, "_cleared_classroom_ids", [])
+            if action == "post_clear"
+            else list(pk_set)
+        )
+        user_ids = [instance.pk]
+    host_ids = Classroom.objects.filter(pk__in=classroom_ids).values_list(
+        "host_id", flat=True
+    )
+    scopes = [scope("feed")]
+    scopes += [scope("classroom", pk) for pk in classroom_ids]
+    scopes += [scope("user", pk) for pk in set(user_ids) | set(host_ids)]
+    bump(*scopes)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import Blob
+
+# `<upload_to>/ab/cd/<sha256>.<ext>`, and files derived from such a blob
+# (the avatar thumbnails, see `base.thumbnails.thumbnail_name`) next to it
+# as `thumbs/<sha256>.<variant>.<ext>`.
+BLOB_NAME = re.compile(
+    r"^(?P<prefix>[\w-]+(?:/[\w-]+)*)/[0-9a-f]{2}/[0-9a-f]{2}/"
+    r"(?P<sha256>[0-9a-f]{64})(?P<ext>\.\w{1,16})?$"
+)
+DERIVED_NAME = re.compile(
+    r"^(?P<prefix>[\w-]+(?:/[\w-]+)*)/[0-9a-f]{2}/[0-9a-f]{2}/thumbs/"
+    r"(?P<sha256>[0-9a-f]{64})(?:\.\w+)+$"
+)
+
+# Uploads in progress, outside the content-addressed tree.
+INCOMING_DIR = "incoming"
+
+
+def content_hash(name: Optional[str]) -> Optional[str]:
+    """
+    The SHA-256 a blob's name carries, if `name` is one.
+    """
+    match = BLOB_NAME.match(name or "")
+    return match["sha256"] if match else None
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """
+    Content-addressed storage: a file is kept once, under the SHA-256 of its
+    contents in a tree sharded by its first two bytes, however many rows
+    refer to it. `Blob` rows count the references: `save` adds one and
+    `delete` drops one, removing the file with the last.
+
+    Names from before (and the default avatar) still resolve under
+    MEDIA_ROOT until `rehash_media` moves them over.
+    """
+
+    def __init__(self, location=None, base_url=None, **kwargs):
+        super().__init__(
+            location=settings.BLOB_ROOT if location is None else location,
+            base_url=settings.BLOB_URL if base_url is None else base_url,
+            **kwargs,
+        )
+        self.legacy = FileSystemStorage()
+
+    def owns(self, name: str) -> bool:
+        if name.startswith(INCOMING_DIR + "/"):
+            return True
+        return bool(BLOB_NAME.match(name) or DERIVED_NAME.match(name))
+
+    def is_public(self, name: str) -> bool:
+        match = BLOB_NAME.match(name) or DERIVED_NAME.match(name)
+        return bool(match) and match["prefix"] in settings.BLOB_PUBLIC_PREFIXES
+
+    def path(self, name):
+        if self.owns(name):
+            return super().path(name)
+        return self.legacy.path(name)
+
+    def url(self, name):
+        if self.owns(name):
+            return super().url(name)
+        return self.legacy.url(name)
+
+    def blob_name(self, name: str, sha256: str) -> str:
+        """
+        The content address for a file saved as `name` (`upload_to` and the
+        original file name), keeping its directory and extension.
+        """
+        directory = posixpath.dirname(name) or "files"
+        extension = posixpath.splitext(name)[1].lower()
+        if not re.fullmatch(r"\.\w{1,16}", extension):
+            extension = ""
+        return posixpath.join(directory, sha256[:2], sha256[2:4], sha256 + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # `_save` names the file after its contents.
+        return name
+
+    def create_incoming(self) -> str:
+        """
+        Name of a new, empty file to receive an upload into.
+        """
+        name = posixpath.join(INCOMING_DIR, f"{uuid.uuid4().hex}.part")
+        path = super().path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "xb").close()
+        return name
+
+    def _save(self, name, content):
+        path = super().path(self.create_incoming())
+        digest = hashlib.sha256()
+        try:
+            with open(path, "wb") as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+                    digest.update(chunk)
+            return self.save_hashed(name, path, digest.hexdigest())
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save_hashed(self, name: str, path: str, sha256: str) -> str:
+        """
+        Store the file at `path`, on this storage's filesystem, whose SHA-256
+        the caller computed while writing it: it is moved (not copied) to its
+        content address, or dropped if the blob exists already. Returns the
+        blob's name, with a reference added.
+        """
+        blob = self.blob_name(name, sha256)
+        target = super().path(blob)
+        with transaction.atomic():
+            # The row lock orders this against a `delete` of the last reference.
+            row, _ = Blob.objects.select_for_update().get_or_create(
+                name=blob, defaults={"size": os.path.getsize(path)}
+            )
+            Blob.objects.filter(pk=row.pk).update(references=F("references") + 1)
+            if os.path.exists(target):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+                if self.file_permissions_mode is not None:
+                    os.chmod(target, self.file_permissions_mode)
+        return blob
+
+    def save_derived(self, name: str, content) -> str:
+        """
+        Write a file derived from a blob (a thumbnail) under its fixed name,
+        replacing an earlier version; it is deleted along with the blob.
+        """
+        storage = super() if self.owns(name) else self.legacy
+        storage.delete(name)
+        return storage._save(name, content)
+
+    def delete(self, name):
+        if BLOB_NAME.match(name):
+            self.release(name)
+        elif self.owns(name):
+            super().delete(name)
+        # Files from before aren't counted and may be shared (like the
+        # default avatar), so they stay until `rehash_media` moves them.
+
+    def release(self, name: str) -> None:
+        with transaction.atomic():
+            row = Blob.objects.select_for_update().filter(name=name).first()
+            if row is None:
+                return
+            if row.references > 1:
+                Blob.objects.filter(pk=row.pk).update(references=F("references") - 1)
+                return
+            row.delete()
+            super().delete(name)
+            self.delete_derived(name)
+
+    def delete_derived(self, name: str) -> None:
+        directory = super().path(posixpath.join(posixpath.dirname(name), "thumbs"))
+        if not os.path.isdir(directory):
+            return
+        stem = content_hash(name) + "."
+        for filename in os.listdir(directory):
+            if filename.startswith(stem):
+                os.remove(os.path.join(directory, filename))
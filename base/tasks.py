@@ -0,0 +1,173 @@
+import logging
+import os
+import socket
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+from typing import Callable, Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+class TaskSpec(NamedTuple):
+    func: Callable
+    max_attempts: int
+    # Most tasks of this name running at once, over all workers.
+    concurrency: Optional[int]
+    # Seconds before the first retry; doubled for every further one.
+    retry_delay: int
+
+
+registry: Dict[str, TaskSpec] = {}
+
+
+def task(
+    max_attempts: int = 3, concurrency: Optional[int] = None, retry_delay: int = 30
+):
+    """
+    Register a function as a task. Its arguments must be JSON serializable
+    and passed by keyword; `func.enqueue(**kwargs)` queues a call.
+    """
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__name__}"
+        registry[name] = TaskSpec(func, max_attempts, concurrency, retry_delay)
+        func.enqueue = lambda **kwargs: enqueue(name, **kwargs)
+        return func
+
+    return decorator
+
+
+def enqueue(name: str, /, **kwargs) -> Optional[Task]:
+    """
+    Queue a call of the task `name`. The row is written in the caller's
+    transaction, so the task runs if and only if that commits. With
+    TASKS_RUN_INLINE (for tests) the task runs in this process instead,
+    once that transaction commits.
+    """
+    spec = registry[name]
+    if getattr(settings, "TASKS_RUN_INLINE", False):
+        transaction.on_commit(lambda: spec.func(**kwargs))
+        return None
+    return Task.objects.create(name=name, kwargs=kwargs, run_after=timezone.now())
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+def requeue_stale(timeout: timedelta) -> int:
+    """
+    Put back tasks whose worker died while running them, and fail those
+    that already had their `max_attempts` (each claim counts one), so a
+    task that takes its worker down isn't retried forever. Returns how many
+    were put back.
+    """
+    now = timezone.now()
+    stale = Task.objects.filter(status=Task.RUNNING, started__lt=now - timeout)
+    for name, spec in registry.items():
+        stale.filter(name=name, attempts__gte=spec.max_attempts).update(
+            status=Task.FAILED,
+            finished=now,
+            last_error=f"Its worker gave no result within {timeout}",
+        )
+    return stale.update(status=Task.QUEUED, worker="")
+
+
+def has_due() -> bool:
+    return Task.objects.filter(
+        status=Task.QUEUED, run_after__lte=timezone.now(), name__in=list(registry)
+    ).exists()
+
+
+def _saturated() -> list:
+    limited = {
+        name: spec.concurrency
+        for name, spec in registry.items()
+        if spec.concurrency is not None
+    }
+    if not limited:
+        return []
+    running = (
+        Task.objects.filter(status=Task.RUNNING, name__in=limited)
+        .values("name")
+        .annotate(count=Count("id"))
+    )
+    return [row["name"] for row in running if row["count"] >= limited[row["name"]]]
+
+
+def claim(worker: str) -> Optional[Task]:
+    """
+    Take the oldest due task that isn't over its concurrency limit.
+    """
+    now = timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    # Without row locks (SQLite) a transaction would only make concurrent
+    # workers fail to upgrade their read lock; the status check in the
+    # update alone lets just one of them claim the task.
+    with transaction.atomic() if skip_locked else nullcontext():
+        due = Task.objects.filter(
+            status=Task.QUEUED, run_after__lte=now, name__in=list(registry)
+        ).exclude(name__in=_saturated())
+        if skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        candidate = due.order_by("run_after", "id").first()
+        if candidate is None:
+            return None
+        claimed = Task.objects.filter(pk=candidate.pk, status=Task.QUEUED).update(
+            status=Task.RUNNING,
+            started=now,
+            worker=worker,
+            attempts=candidate.attempts + 1,
+        )
+        if not claimed:
+            return None
+
+    spec = registry[candidate.name]
+    if spec.concurrency is not None:
+        running = Task.objects.filter(status=Task.RUNNING, name=candidate.name).count()
+        if running > spec.concurrency:
+            # Another worker claimed one of the same name at the same time.
+            Task.objects.filter(pk=candidate.pk).update(
+                status=Task.QUEUED, worker="", attempts=candidate.attempts
+            )
+            return None
+    candidate.refresh_from_db()
+    return candidate
+
+
+def execute(task_row: Task) -> bool:
+    """
+    Run a claimed task and record the outcome; failures are retried with
+    exponential backoff until the task's `max_attempts`.
+    """
+    spec = registry[task_row.name]
+    try:
+        spec.func(**task_row.kwargs)
+    except Exception:
+        logger.exception("Task %s failed (attempt %s)", task_row, task_row.attempts)
+        error = traceback.format_exc()
+        if task_row.attempts < spec.max_attempts:
+            delay = spec.retry_delay * 2 ** (task_row.attempts - 1)
+            Task.objects.filter(pk=task_row.pk).update(
+                status=Task.QUEUED,
+                worker="",
+                last_error=error,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            Task.objects.filter(pk=task_row.pk).update(
+                status=Task.FAILED, finished=timezone.now(), last_error=error
+            )
+        return False
+    Task.objects.filter(pk=task_row.pk).update(
+        status=Task.DONE, finished=timezone.now()
+    )
+    return True
@@ -1,6 +1,9 @@
-import markdown
 from django import template
 from django.template.defaultfilters import stringfilter
+from django.utils.html import format_html
+
+from base.rendering import render_markdown_cached
+from base.thumbnails import thumbnail_url, thumbnails_ready
 
 register = template.Library()
 
@@ -8,4 +11,19 @@ register = template.Library()
 @register.filter
 @stringfilter
 def convert_markdown(text):
-    return markdown.markdown(text, extensions=["markdown.extensions.fenced_code"])
+    return render_markdown_cached(text)
+
+
+@register.simple_tag
+def avatar(user, size="small"):
+    """
+    `<img>` for a user's avatar at one of the thumbnail sizes, preferring
+    WebP with a JPEG fallback once the thumbnails have been generated.
+    """
+    if not thumbnails_ready(user):
+        return format_html('<img src="{}" />', thumbnail_url(user, size))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" /><img src="{}" /></picture>',
+        thumbnail_url(user, size, "webp"),
+        thumbnail_url(user, size, "jpg"),
+    )
@@ -1,3 +1,1226 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Sum
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from .activity import ACTIVITY_WINDOW, HEAD_KEY, clear_activity, recent_activity
+from .bulk import import_classrooms, import_messages, import_users
+from .caching import cached_value, get_versions, scope
+from .downloads import serve_file
+from .fixtures import QUERY_BUDGETS, page_urls, seed_pages
+from .ledger import CONSPECT_PRICE, InsufficientBalance, purchase_conspect
+from .management.commands import rehash_media
+from .metrics import begin_request, end_request, record_cache
+from .middleware import PerformanceMiddleware
+from .models import (
+    Blob,
+    Classroom,
+    Conspect,
+    Message,
+    Purchase,
+    Task,
+    Topic,
+    Upload,
+    User,
+)
+from .pagination import keyset_page
+from .querydebug import RepeatedQueriesError, normalize, watch_queries
+from .realtime import websocket_application
+from .search import IContainsBackend, search_classrooms
+from .storage import content_hash
+from .tasks import enqueue, registry, requeue_stale, task
+from .thumbnails import AVATAR_SIZES, FORMATS, generate_thumbnails, thumbnail_name
+from .uploads import UploadConflict, complete_upload, start_upload, write_chunk
+
+
+class QueryBudgetTests(TestCase):
+    """
+    The read-heavy pages stay within their query budgets and don't run more
+    queries as the number of rows they show grows (no N+1).
+    """
+
+    def setUp(self):
+        cache.clear()
+        clear_activity()
+
+    def measure(self, rows, prefix):
+        seeded = seed_pages(rows, prefix)
+        # Every page renders cold, as after an invalidation.
+        cache.clear()
+        counts = {}
+        for name, url in page_urls(*seeded).items():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[name] = len(context.captured_queries)
+        return counts
+
+    def test_pages_within_budget(self):
+        small = self.measure(1, "small")
+        large = self.measure(25, "large")
+        for name, budget in QUERY_BUDGETS.items():
+            with self.subTest(page=name):
+                self.assertLessEqual(small[name], budget)
+                self.assertLessEqual(large[name], budget)
+                self.assertLessEqual(large[name], small[name])
+
+
+@override_settings(QUERY_DEBUG={"REPEAT_THRESHOLD": 3, "RAISE": True})
+class QueryDebugTests(TestCase):
+    def test_raises_on_repeated_statements(self):
+        users = [
+            User.objects.create(username=f"repeat-{i}", email=f"r{i}@jazbahana.invalid")
+            for i in range(3)
+        ]
+        with self.assertRaises(RepeatedQueriesError) as raised:
+            with watch_queries("loop"):
+                for user in users:
+                    User.objects.get(pk=user.pk)
+        self.assertIn("3 x SELECT", str(raised.exception))
+        self.assertIn("from base/tests.py:", str(raised.exception))
+
+        with watch_queries("twice"):
+            for user in users[0:2]:
+                User.objects.get(pk=user.pk)
+
+    def test_in_lists_of_any_length_share_a_shape(self):
+        self.assertEqual(
+            normalize('SELECT * FROM "t" WHERE "id" IN (%s, %s) AND "n" = 1'),
+            normalize('SELECT * FROM "t" WHERE "id" IN (?, ?, ?) AND "n" = \'x\''),
+        )
+
+    def test_logs_instead_when_not_raising(self):
+        with self.assertLogs("base.querydebug", "WARNING") as logs:
+            with watch_queries("loop", raise_errors=False):
+                for _ in range(3):
+                    Topic.objects.count()
+        self.assertIn("Repeated queries in loop", logs.output[0])
+
+    def test_budgeted_pages_repeat_no_statement(self):
+        user, classroom = seed_pages(6, "debug")
+        self.client.force_login(user)
+        for name, url in page_urls(user, classroom).items():
+            with self.subTest(name):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ManagedFieldsAdminTests(TestCase):
+    def test_balance_is_read_only(self):
+        admin = User.objects.create_superuser(
+            username="admin", email="admin@jazbahana.invalid", password="pw"
+        )
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin:base_user_change", args=[admin.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("balance", response.context["adminform"].form.fields)
+        self.assertContains(response, "300")
+
+
+class ManagedFieldsSaveTests(TestCase):
+    def test_saving_deferred_instance_does_not_fetch_fields(self):
+        user = User.objects.create(username="deferred", email="d@jazbahana.invalid")
+        user = User.objects.only("username").get(pk=user.pk)
+        user.username = "renamed"
+        with CaptureQueriesContext(connection) as context:
+            user.save()
+        user_queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if re.match(r'UPDATE "base_user"|SELECT .* FROM "base_user"', query["sql"])
+        ]
+        self.assertEqual(len(user_queries), 1)
+        self.assertTrue(user_queries[0].startswith("UPDATE"))
+        self.assertNotIn('"bio_html"', user_queries[0])
+        self.assertEqual(User.objects.get(pk=user.pk).username, "renamed")
+
+    def test_managed_fields_are_not_overwritten(self):
+        user = User.objects.create(username="stale", email="s@jazbahana.invalid")
+        User.objects.filter(pk=user.pk).update(balance=500)
+        user.name = "Stale"
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).balance, 500)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(
+                username=f"counter-{i}", email=f"c{i}@jazbahana.invalid"
+            )
+            for i in range(3)
+        ]
+        self.topic = Topic.objects.create(name="counters")
+        self.classroom = Classroom.objects.create(
+            host=self.users[0], topic=self.topic, name="counters"
+        )
+
+    def counts(self):
+        self.topic.refresh_from_db()
+        self.classroom.refresh_from_db()
+        return (
+            self.topic.classroom_count,
+            self.classroom.student_count,
+            self.classroom.message_count,
+        )
+
+    def test_message_count(self):
+        messages = [
+            Message.objects.create(author=user, classroom=self.classroom, body="hi")
+            for user in self.users
+        ]
+        self.assertEqual(self.counts()[2], 3)
+        messages[0].delete()
+        self.assertEqual(self.counts()[2], 2)
+        self.users[1].delete()
+        self.assertEqual(self.counts()[2], 1)
+
+    def test_message_count_commits_with_the_message(self):
+        with mock.patch("base.signals.increment", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Message.objects.create(
+                    author=self.users[0], classroom=self.classroom, body="lost"
+                )
+        self.assertFalse(Message.objects.filter(body="lost").exists())
+        self.assertEqual(self.counts()[2], 0)
+
+    def test_deleting_a_user_recounts_their_classrooms(self):
+        other = Classroom.objects.create(host=self.users[1], name="other")
+        for classroom in (self.classroom, other):
+            for user in self.users:
+                Message.objects.create(author=user, classroom=classroom, body="hi")
+        self.users[0].delete()
+        other.refresh_from_db()
+        self.assertEqual((self.counts()[2], other.message_count), (2, 2))
+
+    def test_cascaded_message_deletes_cost_no_query_per_message(self):
+        def delete_classroom(messages):
+            classroom = Classroom.objects.create(host=self.users[0], name="thread")
+            Message.objects.bulk_create(
+                Message(author=self.users[i % 3], classroom=classroom, body="hi")
+                for i in range(messages)
+            )
+            with CaptureQueriesContext(connection) as context:
+                classroom.delete()
+            return len(context.captured_queries)
+
+        # Django itself deletes the collected rows a hundred at a time.
+        self.assertEqual(delete_classroom(5) + 1, delete_classroom(200))
+
+    def test_cascaded_message_deletes_invalidate_their_authors(self):
+        Message.objects.create(author=self.users[1], classroom=self.classroom, body="x")
+        versions = get_versions([scope("user", self.users[1].pk), scope("activity")])
+        self.classroom.delete()
+        after = get_versions(versions)
+        self.assertTrue(all(after[name] != versions[name] for name in versions))
+
+    def test_student_count(self):
+        self.classroom.students.add(*self.users)
+        self.assertEqual(self.counts()[1], 3)
+        self.classroom.students.remove(self.users[0])
+        self.assertEqual(self.counts()[1], 2)
+        self.users[1].students.clear()
+        self.assertEqual(self.counts()[1], 1)
+
+    def test_student_count_after_deleting_a_student(self):
+        self.classroom.students.add(*self.users)
+        self.users[2].delete()
+        self.assertEqual(self.counts()[1], 2)
+
+    def test_classroom_count(self):
+        self.assertEqual(self.counts()[0], 1)
+        other = Topic.objects.create(name="other")
+        self.classroom.topic = other
+        self.classroom.save()
+        other.refresh_from_db()
+        self.assertEqual((self.counts()[0], other.classroom_count), (0, 1))
+        self.classroom.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.classroom_count, 0)
+
+
+class MarkdownRenderingTests(TestCase):
+    unsafe = "<script>alert(1)</script> [link](javascript:alert(1)) **bold**"
+
+    def setUp(self):
+        self.user = User.objects.create(username="writer", email="w@jazbahana.invalid")
+        self.classroom = Classroom.objects.create(host=self.user, name="markdown")
+
+    def assertSafe(self, html):
+        self.assertIn("<strong>bold</strong>", html)
+        self.assertIn("&lt;script&gt;", html)
+        self.assertNotIn("<script", html)
+        self.assertNotIn("javascript:", html)
+
+    def test_messages_render_safely_on_save(self):
+        message = Message.objects.create(
+            author=self.user, classroom=self.classroom, body=self.unsafe
+        )
+        self.assertSafe(Message.objects.get(pk=message.pk).body_html)
+
+        message.body = "[fine](https://example.com) `<b>`"
+        message.save(update_fields=["body"])
+        self.assertEqual(
+            Message.objects.get(pk=message.pk).body_html,
+            '<p><a href="https://example.com">fine</a> <code>&lt;b&gt;</code></p>',
+        )
+
+    def test_bios_render_when_saved_with_the_bio(self):
+        self.user.bio = self.unsafe
+        self.user.save(update_fields=["bio"])
+        self.assertSafe(User.objects.get(pk=self.user.pk).bio_html)
+
+        User.objects.filter(pk=self.user.pk).update(bio_html="stale")
+        self.user.bio = "changed"
+        self.user.save(update_fields=["last_login"])
+        self.assertEqual(User.objects.get(pk=self.user.pk).bio_html, "stale")
+
+    def test_render_markdown_command(self):
+        message = Message.objects.create(
+            author=self.user, classroom=self.classroom, body="*missing*"
+        )
+        other = Message.objects.create(
+            author=self.user, classroom=self.classroom, body="*stale*"
+        )
+        Message.objects.filter(pk=message.pk).update(body_html="")
+        Message.objects.filter(pk=other.pk).update(body_html="stale")
+
+        call_command("render_markdown", stdout=io.StringIO())
+        message.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(message.body_html, "<p><em>missing</em></p>")
+        self.assertEqual(other.body_html, "stale")
+
+        call_command("render_markdown", "--all", stdout=io.StringIO())
+        other.refresh_from_db()
+        self.assertEqual(other.body_html, "<p><em>stale</em></p>")
+
+    def test_migration_sanitizes_stored_html(self):
+        message = Message.objects.create(
+            author=self.user, classroom=self.classroom, body=self.unsafe
+        )
+        Message.objects.filter(pk=message.pk).update(body_html="<script></script>")
+        migration = import_module("base.migrations.0027_sanitize_markdown")
+        migration.sanitize_existing(django_apps, None)
+        self.assertSafe(Message.objects.get(pk=message.pk).body_html)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create(
+            username="seller", email="s@jazbahana.invalid"
+        )
+        self.buyer = User.objects.create(username="buyer", email="b@jazbahana.invalid")
+        classroom = Classroom.objects.create(host=self.seller, name="ledger")
+        self.conspect = Conspect.objects.create(
+            author=self.seller, classroom=classroom, file="uploads/ledger.pdf"
+        )
+
+    def test_seller_balance_beyond_small_integer_range(self):
+        # SQLite doesn't enforce the column ranges PostgreSQL does.
+        field = User._meta.get_field("balance")
+        ranges = BaseDatabaseOperations.integer_field_ranges
+        _low, high = ranges[field.get_internal_type()]
+        self.assertGreater(high, 32700 + CONSPECT_PRICE)
+
+        User.objects.filter(pk=self.seller.pk).update(balance=32700)
+        purchase_conspect(self.buyer, self.conspect)
+        self.assertEqual(
+            User.objects.get(pk=self.seller.pk).balance, 32700 + CONSPECT_PRICE
+        )
+
+
+class ConcurrentPurchaseTests(TransactionTestCase):
+    """
+    Overlapping purchases from many threads neither create nor destroy
+    money and never charge a buyer twice for the same conspect.
+    """
+
+    def setUp(self):
+        self.users = [
+            User.objects.create(
+                username=f"concurrent-{i}", email=f"concurrent-{i}@jazbahana.invalid"
+            )
+            for i in range(6)
+        ]
+        classroom = Classroom.objects.create(host=self.users[0], name="concurrent")
+        self.conspects = [
+            Conspect.objects.create(
+                author=user, classroom=classroom, file=f"uploads/concurrent-{i}.pdf"
+            )
+            for i, user in enumerate(self.users)
+        ]
+
+    def attempt(self, job):
+        buyer, conspect = job
+        try:
+            for _ in range(50):
+                try:
+                    return purchase_conspect(buyer, conspect)[1]
+                except OperationalError:
+                    # SQLite reports lock contention instead of waiting.
+                    time.sleep(0.01)
+            raise AssertionError("Purchase kept failing on lock contention")
+        except InsufficientBalance:
+            return False
+        finally:
+            connections.close_all()
+
+    def test_balances_are_conserved(self):
+        # Few conspects and many attempts, so the same pairs collide often.
+        rng = random.Random(0)
+        jobs = [
+            (rng.choice(self.users), rng.choice(self.conspects)) for _ in range(120)
+        ]
+        jobs = [
+            (buyer, conspect) for buyer, conspect in jobs if buyer != conspect.author
+        ]
+        with ThreadPoolExecutor(6) as pool:
+            list(pool.map(self.attempt, jobs))
+
+        initial = User._meta.get_field("balance").default
+        users = User.objects.all()
+        self.assertEqual(
+            users.aggregate(total=Sum("balance"))["total"], initial * len(self.users)
+        )
+        purchases = Purchase.objects.all()
+        self.assertGreater(purchases.count(), 0)
+        self.assertEqual(
+            purchases.values("buyer", "conspect").distinct().count(),
+            purchases.count(),
+        )
+        for user in users:
+            bought = purchases.filter(buyer=user).count()
+            sold = purchases.filter(seller=user).count()
+            self.assertEqual(user.balance, initial + CONSPECT_PRICE * (sold - bought))
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_activity()
+        self.host = User.objects.create(username="host", email="h@jazbahana.invalid")
+        self.classroom = Classroom.objects.create(host=self.host, name="conditional")
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response.headers)
+        response = self.client.get(
+            reverse("home"), HTTP_IF_NONE_MATCH=response.headers["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_delete_changes_the_validator(self):
+        Classroom.objects.create(host=self.host, name="remaining")
+        first = self.client.get(reverse("home"))
+        self.classroom.delete()
+        response = self.client.get(
+            reverse("home"), HTTP_IF_NONE_MATCH=first.headers["ETag"]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "conditional")
+        response = self.client.get(
+            reverse("home"), HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 3600)
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class MarkdownPageTests(TestCase):
+    def test_validator_varies_with_visitor_and_language(self):
+        response = self.client.get(reverse("about"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response.headers)
+        self.assertIn("Accept-Language", response.headers["Vary"])
+        etag = response.headers["ETag"]
+        self.assertEqual(
+            self.client.get(reverse("about"), HTTP_IF_NONE_MATCH=etag).status_code,
+            304,
+        )
+
+        user = User.objects.create(username="reader", email="r@jazbahana.invalid")
+        self.client.force_login(user)
+        response = self.client.get(reverse("about"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse("about"), HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 3600)
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="pager", email="p@jazbahana.invalid")
+        self.classroom = Classroom.objects.create(host=self.user, name="pages")
+        Message.objects.bulk_create(
+            Message(
+                author=self.user,
+                classroom=self.classroom,
+                body=f"msg-{i:02}",
+                body_html=f"<p>msg-{i:02}</p>",
+            )
+            for i in range(20)
+        )
+        # Every message shares its timestamps, so only the id breaks ties.
+        now = timezone.now()
+        Message.objects.update(created=now, updated=now)
+        self.ordering = ("-updated", "-created", "-id")
+
+    def walk(self, size, between_pages=lambda: None):
+        queryset = Message.objects.filter(classroom=self.classroom)
+        page = keyset_page(queryset, self.ordering, None, size)
+        bodies = [message.body for message in page]
+        while page.has_next:
+            between_pages()
+            page = keyset_page(queryset, self.ordering, page.next_cursor, size)
+            bodies += [message.body for message in page]
+        return bodies
+
+    def test_pages_continue_across_tied_timestamps(self):
+        self.assertEqual(self.walk(7), [f"msg-{i:02}" for i in reversed(range(20))])
+
+    def test_rows_inserted_between_pages_do_not_shift_them(self):
+        def post():
+            Message.objects.create(
+                author=self.user, classroom=self.classroom, body="newer"
+            )
+
+        self.assertEqual(
+            self.walk(6, post), [f"msg-{i:02}" for i in reversed(range(20))]
+        )
+
+    def test_fragments_follow_the_older_link(self):
+        url = reverse("classroom-messages", args=[self.classroom.pk])
+        bodies = []
+        while url:
+            content = self.client.get(url).content.decode()
+            bodies += re.findall(r"msg-\d\d", content)
+            older = re.search(r'href="([^"]*\?before=[^"]*)"', content)
+            url = older and older[1]
+        self.assertEqual(bodies, [f"msg-{i:02}" for i in reversed(range(20))])
+
+    def test_malformed_cursors_are_rejected(self):
+        wrong_length = base64.urlsafe_b64encode(b'["1"]').decode()
+        wrong_type = base64.urlsafe_b64encode(b'["x", "y", "z"]').decode()
+        urls = [
+            reverse(name, args=[self.classroom.pk])
+            for name in ("classroom-messages", "classroom-conspects")
+        ]
+        urls.append(reverse("user-messages", args=[self.user.username]))
+        for url in urls:
+            for cursor in ("not base64!", wrong_length, wrong_type):
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {"before": cursor})
+                    self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse("classroom-students", args=[self.classroom.pk]),
+            {"before": base64.urlsafe_b64encode(b'["a", "b"]').decode()},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ActivityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="active", email="ac@jazbahana.invalid")
+        self.classroom = Classroom.objects.create(host=self.user, name="activity")
+
+    def post(self, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [
+                Message.objects.create(
+                    author=self.user, classroom=self.classroom, body=f"post {i}"
+                )
+                for i in range(count)
+            ]
+
+    def test_rebuilds_from_the_newest_messages(self):
+        messages = self.post(ACTIVITY_WINDOW + 5)
+        clear_activity()
+        window = recent_activity()
+        self.assertFalse(window.reset)
+        self.assertEqual(
+            [message.pk for message in window],
+            [message.pk for message in reversed(messages)][0:ACTIVITY_WINDOW],
+        )
+
+    def test_since_returns_only_newer_messages(self):
+        self.post(3)
+        cursor = recent_activity().cursor
+        newer = self.post(2)
+        window = recent_activity(cursor)
+        self.assertFalse(window.reset)
+        self.assertEqual(window.cursor, cursor + 2)
+        self.assertEqual(list(window), list(reversed(newer)))
+        self.assertEqual(list(recent_activity(window.cursor)), [])
+
+    def test_cursors_reset_once_evicted(self):
+        self.post(2)
+        cursor = recent_activity().cursor
+        self.post(ACTIVITY_WINDOW + 1)
+        window = recent_activity(cursor)
+        self.assertTrue(window.reset)
+        self.assertEqual(len(window), ACTIVITY_WINDOW)
+
+        # The ring itself evicted from the cache: rebuilt, on a new cursor.
+        cursor = window.cursor
+        cache.delete(HEAD_KEY)
+        window = recent_activity(cursor)
+        self.assertTrue(window.reset)
+        self.assertEqual(len(window), ACTIVITY_WINDOW)
+
+    def test_deleted_messages_drop_out(self):
+        kept, deleted = self.post(2)
+        deleted.delete()
+        self.assertEqual(list(recent_activity()), [kept])
+
+    def test_since_endpoint(self):
+        url = reverse("activities-since")
+        cursor = recent_activity().cursor
+        (message,) = self.post()
+        response = self.client.get(url, {"since": cursor, "format": "json"})
+        self.assertEqual(response.json()["cursor"], str(cursor + 1))
+        self.assertEqual(
+            [row["id"] for row in response.json()["messages"]], [message.pk]
+        )
+        self.assertEqual(response["X-Activity-Reset"], "0")
+        self.assertEqual(self.client.get(url, {"since": "x"}).status_code, 400)
+
+
+class ClassroomSocketTests(TransactionTestCase):
+    """
+    The WebSocket chat, driven through the plain ASGI application.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username="chatter", email="c@jazbahana.invalid")
+        self.classroom = Classroom.objects.create(host=self.user, name="chat")
+        self.client.force_login(self.user)
+
+    async def connect(self, path=None, cookie=None):
+        headers = [(b"cookie", cookie.encode())] if cookie else []
+        socket = ApplicationCommunicator(
+            websocket_application,
+            {
+                "type": "websocket",
+                "path": path or f"/ws/classroom/{self.classroom.id}/",
+                "headers": headers,
+            },
+        )
+        await socket.send_input({"type": "websocket.connect"})
+        return socket, await socket.receive_output(2)
+
+    async def disconnect(self, *sockets):
+        for socket in sockets:
+            await socket.send_input({"type": "websocket.disconnect", "code": 1000})
+            await socket.wait(2)
+
+    async def test_unknown_classroom_is_refused(self):
+        _socket, event = await self.connect(path="/ws/classroom/0/")
+        self.assertEqual(event, {"type": "websocket.close", "code": 4403})
+
+    async def test_posted_message_reaches_other_sockets(self):
+        session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        reader, accepted = await self.connect()
+        self.assertEqual(accepted["type"], "websocket.accept")
+        writer, _ = await self.connect(
+            cookie=f"{settings.SESSION_COOKIE_NAME}={session}"
+        )
+        try:
+            await writer.send_input(
+                {"type": "websocket.receive", "text": json.dumps({"body": "hello"})}
+            )
+            event = await reader.receive_output(2)
+        finally:
+            await self.disconnect(reader, writer)
+
+        payload = json.loads(event["text"])
+        self.assertEqual(payload["author"], "chatter")
+        self.assertIn("hello", payload["body_html"])
+        message = await sync_to_async(Message.objects.get)(classroom=self.classroom)
+        self.assertEqual(payload["id"], message.id)
+
+    async def test_anonymous_sockets_cannot_post(self):
+        socket, _ = await self.connect()
+        await socket.send_input(
+            {"type": "websocket.receive", "text": json.dumps({"body": "spam"})}
+        )
+        # Give the socket a chance to handle the event before disconnecting.
+        await asyncio.sleep(0.1)
+        await self.disconnect(socket)
+        count = await sync_to_async(Message.objects.count)()
+        self.assertEqual(count, 0)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create(
+            username="searcher", email="s@jazbahana.invalid"
+        )
+
+    def create(self, name, description=""):
+        return Classroom.objects.create(
+            host=self.host, name=name, description=description
+        )
+
+    def test_best_matches_first(self):
+        weak = self.create("geometry", "homework, exams and more about other things")
+        strong = self.create("geometry", "geometry geometry")
+        self.create("algebra")
+        self.assertEqual(list(search_classrooms("geometry")), [strong, weak])
+        self.assertEqual(list(search_classrooms("geom")), [strong, weak])
+        self.assertEqual(list(search_classrooms("GEOMETRY searcher")), [strong, weak])
+
+    def test_results_are_not_truncated(self):
+        classrooms = Classroom.objects.bulk_create(
+            Classroom(host=self.host, name=f"calculus {i}") for i in range(600)
+        )
+        for classroom in classrooms:
+            Classroom.objects.get(pk=classroom.pk).save()
+        results = search_classrooms("calculus")
+        self.assertEqual(results.count(), 600)
+        self.assertEqual(len(list(results[590:])), 10)
+
+    def test_renamed_classroom_is_reindexed(self):
+        classroom = self.create("physics")
+        classroom.name = "chemistry"
+        classroom.save()
+        self.assertFalse(search_classrooms("physics").exists())
+        self.assertEqual(list(search_classrooms("chemistry")), [classroom])
+
+    def test_user_saves_reindex_only_on_rename(self):
+        classroom = self.create("drawing")
+        user = User.objects.get(pk=self.host.pk)
+        user.name = "Searcher"
+        with CaptureQueriesContext(connection) as context:
+            user.save()
+        self.assertFalse(
+            [q for q in context.captured_queries if "searchdocument" in q["sql"]]
+        )
+
+        user.username = "painter"
+        user.save()
+        self.assertEqual(list(search_classrooms("painter")), [classroom])
+        self.assertFalse(search_classrooms("searcher").exists())
+
+    def test_topic_saves_reindex_only_on_rename(self):
+        topic = Topic.objects.create(name="music")
+        classroom = Classroom.objects.create(host=self.host, topic=topic, name="choir")
+        topic = Topic.objects.get(pk=topic.pk)
+        with CaptureQueriesContext(connection) as context:
+            topic.save()
+        self.assertFalse(
+            [q for q in context.captured_queries if "searchdocument" in q["sql"]]
+        )
+
+        topic.name = "singing"
+        topic.save()
+        self.assertEqual(list(search_classrooms("singing")), [classroom])
+
+    def test_punctuation_only_matches_nothing(self):
+        self.create("biology")
+        self.assertFalse(search_classrooms("?!").exists())
+
+    def test_icontains_fallback(self):
+        classroom = self.create("history", "wars")
+        self.create("literature")
+        found = IContainsBackend().search(Classroom.objects.all(), "HIST wars")
+        self.assertEqual(list(found), [classroom])
+
+
+class TaskTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @task(max_attempts=2)
+        def record(value):
+            self.calls.append(value)
+
+        self.name = f"{record.__module__}.{record.__name__}"
+        self.addCleanup(registry.pop, self.name)
+
+    def stale(self, attempts):
+        return Task.objects.create(
+            name=self.name,
+            status=Task.RUNNING,
+            attempts=attempts,
+            run_after=timezone.now(),
+            started=timezone.now() - timedelta(hours=1),
+        )
+
+    def test_stale_tasks_are_retried_until_max_attempts(self):
+        retried, exhausted = self.stale(1), self.stale(2)
+        self.assertEqual(requeue_stale(timedelta(minutes=10)), 1)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.status, Task.QUEUED)
+        self.assertEqual(exhausted.status, Task.FAILED)
+        self.assertTrue(exhausted.last_error)
+
+    @override_settings(TASKS_RUN_INLINE=True)
+    def test_inline_tasks_run_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue(self.name, value=1)
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [1])
+        self.assertFalse(Task.objects.exists())
+
+
+class TemporaryBlobRootMixin:
+    """
+    Point the blob storage at an empty directory for the test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        # Changing DEFAULT_FILE_STORAGE makes Django build a new default storage.
+        override = override_settings(
+            BLOB_ROOT=Path(root), DEFAULT_FILE_STORAGE="base.storage.BlobStorage"
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.storage = Conspect._meta.get_field("file").storage
+
+
+class DownloadTests(TemporaryBlobRootMixin, TestCase):
+    content = b"0123456789abcdef"
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(
+            username="downloader", email="dl@jazbahana.invalid"
+        )
+        self.conspect = Conspect.objects.create(
+            author=self.author,
+            classroom=Classroom.objects.create(host=self.author, name="downloads"),
+            file=ContentFile(self.content, name="Lecture notes.txt"),
+        )
+        self.file = self.conspect.file
+        self.etag = f'"{content_hash(self.file.name)}"'
+
+    def get(self, **headers):
+        request = RequestFactory().get("/download/", **headers)
+        response = serve_file(request, self.file, self.conspect.display_name)
+        if response.streaming:
+            body = b"".join(response.streaming_content)
+        else:
+            body = response.content
+        response.close()
+        return response, body
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.content))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_keeps_the_uploaded_name(self):
+        self.assertEqual(self.conspect.filename, "Lecture notes.txt")
+        self.assertNotIn("Lecture", self.file.name)
+        self.assertEqual(str(self.conspect), "Lecture notes.txt")
+
+        self.client.force_login(self.author)
+        response = self.client.get(reverse("confirm-payment", args=[self.conspect.pk]))
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        response.close()
+        self.assertEqual(
+            response["Content-Disposition"],
+            "attachment; filename*=utf-8''Lecture%20notes.txt",
+        )
+
+    def test_ranges(self):
+        for header, span, expected in (
+            ("bytes=2-5", "2-5", b"2345"),
+            ("bytes=10-", "10-15", b"abcdef"),
+            ("bytes=-3", "13-15", b"def"),
+            ("bytes=14-99", "14-15", b"ef"),
+        ):
+            response, body = self.get(HTTP_RANGE=header)
+            self.assertEqual((response.status_code, body), (206, expected))
+            self.assertEqual(response["Content-Range"], f"bytes {span}/16")
+            self.assertEqual(response["Content-Length"], str(len(expected)))
+
+    def test_unsatisfiable_range(self):
+        for header in ("bytes=16-", "bytes=5-2", "bytes=-0"):
+            response, _ = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */16")
+
+    def test_malformed_range_sends_the_whole_file(self):
+        response, body = self.get(HTTP_RANGE="bytes=0-1,4-5")
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_if_range(self):
+        response, body = self.get(HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=self.etag)
+        self.assertEqual((response.status_code, body), (206, b"01"))
+        response, body = self.get(HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_if_none_match(self):
+        response, _ = self.get(HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], self.etag)
+
+    @override_settings(FILE_DOWNLOAD_OFFLOAD="x-accel-redirect")
+    def test_offload(self):
+        response, body = self.get(HTTP_RANGE="bytes=2-5")
+        self.assertEqual((response.status_code, body), (200, b""))
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/{self.file.name}")
+
+
+class RehashMediaTests(TemporaryBlobRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="rehash", email="rh@jazbahana.invalid")
+        self.classroom = Classroom.objects.create(host=self.user, name="rehash")
+
+    def recount(self):
+        stdout = io.StringIO()
+        call_command("rehash_media", stdout=stdout)
+        return stdout.getvalue()
+
+    def test_fixes_drifted_counts_and_frees_unused_blobs(self):
+        conspect = Conspect.objects.create(
+            author=self.user,
+            classroom=self.classroom,
+            file=ContentFile(b"kept", name="kept.txt"),
+        )
+        Blob.objects.filter(name=conspect.file.name).update(references=3)
+        unused = self.storage.save("uploads/unused.txt", ContentFile(b"unused"))
+
+        self.assertIn("2 drifted, 1 unused blobs deleted", self.recount())
+        self.assertEqual(Blob.objects.get(name=conspect.file.name).references, 1)
+        self.assertFalse(Blob.objects.filter(name=unused).exists())
+        self.assertFalse(self.storage.exists(unused))
+
+    def test_keeps_blobs_referenced_after_the_snapshot(self):
+        real = rehash_media.reference_counts
+        snapshot = mock.patch.object(
+            rehash_media,
+            "reference_counts",
+            lambda name=None: Counter() if name is None else real(name),
+        )
+        conspect = Conspect.objects.create(
+            author=self.user,
+            classroom=self.classroom,
+            file=ContentFile(b"new", name="new.txt"),
+        )
+        with snapshot:
+            self.assertIn("0 drifted, 0 unused blobs deleted", self.recount())
+        self.assertEqual(Blob.objects.get(name=conspect.file.name).references, 1)
+        self.assertTrue(self.storage.exists(conspect.file.name))
+
+
+class ChunkedUploadTests(TemporaryBlobRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(
+            username="uploader", email="u@jazbahana.invalid"
+        )
+        self.classroom = Classroom.objects.create(host=self.user, name="uploads")
+
+    def upload(self, content, chunk_size=4):
+        upload = start_upload(self.user, self.classroom, "Notes.PDF", len(content))
+        for offset in range(0, len(content), chunk_size):
+            end = offset + chunk_size
+            chunk = content[offset:end]
+            write_chunk(upload, offset, len(chunk), io.BytesIO(chunk))
+        return upload
+
+    def test_chunks_complete_into_a_blob(self):
+        content = b"chunked conspect"
+        upload = self.upload(content)
+        part = self.storage.path(upload.file)
+        conspect = complete_upload(upload)
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        self.assertEqual(conspect.sha256, sha256)
+        self.assertTrue(conspect.file.name.endswith(f"/{sha256}.pdf"))
+        self.assertEqual(conspect.filename, "Notes.PDF")
+        with self.storage.open(conspect.file.name, "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(Blob.objects.get(name=conspect.file.name).references, 1)
+        self.assertFalse(os.path.exists(part))
+        self.assertFalse(Upload.objects.exists())
+
+    def test_repeated_offset_conflicts_without_truncating(self):
+        upload = start_upload(self.user, self.classroom, "notes.pdf", 8)
+        write_chunk(upload, 0, 4, io.BytesIO(b"abcd"))
+        stale = Upload.objects.get(pk=upload.pk)
+        stale.received = 0
+        with self.assertRaises(UploadConflict) as raised:
+            write_chunk(stale, 0, 4, io.BytesIO(b"wxyz"))
+        self.assertEqual(raised.exception.offset, 4)
+        with open(self.storage.path(upload.file), "rb") as f:
+            self.assertEqual(f.read(), b"abcd")
+
+    def test_incomplete_upload_cannot_complete(self):
+        upload = start_upload(self.user, self.classroom, "notes.pdf", 8)
+        write_chunk(upload, 0, 4, io.BytesIO(b"abcd"))
+        with self.assertRaises(UploadConflict):
+            complete_upload(upload)
+
+    def test_identical_files_share_one_blob(self):
+        first = complete_upload(self.upload(b"same contents"))
+        second = complete_upload(self.upload(b"same contents"))
+        name = first.file.name
+        self.assertEqual(second.file.name, name)
+        self.assertEqual(Blob.objects.get(name=name).references, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get(name=name).references, 1)
+        self.assertTrue(self.storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(self.storage.path(name)))
+
+    def test_failed_conspect_releases_the_blob(self):
+        upload = self.upload(b"orphan")
+        sha256 = hashlib.sha256(b"orphan").hexdigest()
+        with mock.patch.object(Conspect.objects, "create", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                complete_upload(upload)
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(Conspect.objects.exists())
+        blobs = [
+            name for _, _, names in os.walk(self.storage.location) for name in names
+        ]
+        self.assertFalse([name for name in blobs if name.startswith(sha256)])
+
+    def test_upload_over_http(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse("uploads", args=[self.classroom.id]),
+            {"filename": "notes.txt", "size": 10},
+        )
+        self.assertEqual(response.status_code, 201)
+        status = response.json()
+
+        for start, chunk in ((0, b"01234"), (5, b"56789")):
+            response = self.client.put(
+                status["url"],
+                chunk,
+                content_type="application/octet-stream",
+                HTTP_CONTENT_RANGE=f"bytes {start}-{start + 4}/10",
+            )
+            self.assertEqual(response.json()["received"], start + 5)
+        response = self.client.put(
+            status["url"],
+            b"01234",
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE="bytes 0-4/10",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["received"], 10)
+
+        response = self.client.post(status["complete_url"])
+        self.assertEqual(response.status_code, 201)
+        conspect = Conspect.objects.get(pk=response.json()["conspect"])
+        with self.storage.open(conspect.file.name, "rb") as f:
+            self.assertEqual(f.read(), b"0123456789")
+        self.assertEqual(self.client.post(status["complete_url"]).status_code, 404)
+
+
+class ThumbnailTests(TemporaryBlobRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="avatar", email="a@jazbahana.invalid")
+
+    def save_avatar(self, content):
+        name = self.storage.save("avatars/me.png", ContentFile(content))
+        User.objects.filter(pk=self.user.pk).update(avatar=name)
+        return name
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (300, 200), "teal").save(buffer, "PNG")
+        return buffer.getvalue()
+
+    def test_generates_every_size_and_format(self):
+        name = self.save_avatar(self.png())
+        generate_thumbnails(user_id=self.user.pk, name=name)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_thumbnails, name)
+        for size in AVATAR_SIZES:
+            for extension in FORMATS:
+                self.assertTrue(
+                    self.storage.exists(thumbnail_name(name, size, extension))
+                )
+
+    def test_unreadable_images_keep_the_original(self):
+        for content in (b"not an image", self.png()):
+            name = self.save_avatar(content)
+            with mock.patch("PIL.Image.MAX_IMAGE_PIXELS", 100):
+                generate_thumbnails(user_id=self.user.pk, name=name)
+            self.user.refresh_from_db()
+            self.assertEqual(self.user.avatar_thumbnails, "")
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.host = User.objects.create(
+            username="existing", email="e@jazbahana.invalid"
+        )
+
+    def test_counts_only_inserted_users(self):
+        rows = [
+            {"username": "existing"},
+            {"username": "fresh"},
+            {"username": "fresh"},
+            {"username": "other"},
+        ]
+        self.assertEqual(import_users(rows, self.now), 2)
+        self.assertEqual(import_users(rows, self.now), 0)
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_skips_usernames_taken_in_another_case(self):
+        rows = [{"username": "EXISTING"}, {"username": "new"}, {"username": "NEW"}]
+        self.assertEqual(import_users(rows, self.now), 1)
+        self.assertEqual(
+            sorted(User.objects.values_list("username", flat=True)),
+            ["existing", "new"],
+        )
+
+    def test_skips_emails_taken_in_another_case(self):
+        rows = [
+            {"username": "a", "email": "E@JAZBAHANA.invalid"},
+            {"username": "b", "email": "b@jazbahana.invalid"},
+            {"username": "c", "email": "B@jazbahana.invalid"},
+            {"username": "d"},
+            {"username": "e"},
+        ]
+        self.assertEqual(import_users(rows, self.now), 3)
+        self.assertEqual(
+            sorted(User.objects.values_list("username", flat=True)),
+            ["b", "d", "e", "existing"],
+        )
+
+    def test_keeps_timestamps_and_indexes_classrooms(self):
+        created = "2020-01-02T03:04:05+00:00"
+        rows = [
+            {"id": 900, "name": "imported", "host": "existing", "created": created},
+            {"id": 900, "name": "repeated", "host": "existing"},
+        ]
+        self.assertEqual(import_classrooms(rows, self.now), 1)
+        classroom = Classroom.objects.get(pk=900)
+        self.assertEqual(classroom.created.isoformat(), created)
+        self.assertEqual(classroom.updated, self.now)
+        self.assertEqual(list(search_classrooms("imported")), [classroom])
+
+        message = {
+            "classroom": 900,
+            "author": "existing",
+            "body": "old",
+            "created": created,
+            "updated": created,
+        }
+        self.assertEqual(
+            import_messages([message, dict(message, author="x")], self.now), 1
+        )
+        self.assertEqual(Message.objects.get().updated.isoformat(), created)
+
+        # Ordinary saves still stamp the time.
+        self.assertTrue(Message._meta.get_field("updated").auto_now)
+        classroom.name = "renamed"
+        classroom.save()
+        classroom.refresh_from_db()
+        self.assertGreater(classroom.updated, self.now)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def test_server_timing_is_opt_in(self):
+        with override_settings(PERFORMANCE_SERVER_TIMING=True):
+            response = self.client.get(reverse("topics"))
+        self.assertIn("db;dur=", response.headers["Server-Timing"])
+        with override_settings(PERFORMANCE_SERVER_TIMING=False):
+            response = self.client_class().get(reverse("topics"))
+        self.assertNotIn("Server-Timing", response.headers)
+
+    def test_runs_as_a_coroutine_under_asgi(self):
+        async def get_response(request):
+            pass
+
+        self.assertTrue(
+            asyncio.iscoroutinefunction(PerformanceMiddleware(get_response))
+        )
+        self.assertFalse(asyncio.iscoroutinefunction(PerformanceMiddleware(print)))
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fragments_expire_while_their_relative_times_hold(self):
+        compute = mock.Mock(return_value="fragment")
+        cached_value("test-fragment", compute)
+        cached_value("test-fragment", compute)
+        self.assertEqual(compute.call_count, 1)
+
+        later = time.time() + 61
+        with mock.patch("django.core.cache.backends.locmem.time.time") as now:
+            now.return_value = later
+            cached_value("test-fragment", compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_counts_hits_from_every_thread_of_a_request(self):
+        metrics, token = begin_request()
+        self.addCleanup(end_request, token)
+
+        def hits(context):
+            for _ in range(1000):
+                context.run(record_cache, "hit")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(hits, [copy_context() for _ in range(8)]))
+        self.assertEqual(metrics.cache_hits, 8000)
+
+    def test_profile_lists_every_topic_and_home_five(self):
+        user = User.objects.create(username="topics", email="t@jazbahana.invalid")
+        Topic.objects.bulk_create(Topic(name=f"topic-{i}") for i in range(7))
+        home = self.client.get(reverse("home")).content.decode()
+        profile = self.client.get(
+            reverse("user-profile", args=[user.username])
+        ).content.decode()
+        self.assertEqual(home.count("?q=topic-"), 5)
+        self.assertEqual(profile.count("?q=topic-"), 7)
@@ -0,0 +1,81 @@
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .caching import bump, scope
+from .tasks import task
+
+# Twice the rendered size of `.avatar--small`, `--medium` and `--large`, so
+# thumbnails stay sharp on high-density screens.
+AVATAR_SIZES = {
+    "small": 96,
+    "medium": 128,
+    "large": 256,
+}
+
+FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def thumbnail_name(name: str, size: str, extension: str) -> str:
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, "thumbs", f"{stem}.{size}.{extension}")
+
+
+def thumbnails_ready(user) -> bool:
+    return bool(user and user.avatar and user.avatar_thumbnails == user.avatar.name)
+
+
+def thumbnail_url(user, size: str, extension: str = "webp") -> str:
+    """
+    URL of a ready thumbnail, falling back to the original upload.
+    """
+    avatar = user.avatar if user else None
+    if not avatar:
+        return ""
+    if not thumbnails_ready(user):
+        return avatar.url
+    return avatar.storage.url(thumbnail_name(avatar.name, size, extension))
+
+
+# Resizing is CPU-bound; leave the other workers for the quick tasks.
+@task(concurrency=2)
+def generate_thumbnails(user_id: int, name: str) -> None:
+    from .models import User
+
+    storage = User._meta.get_field("avatar").storage
+    try:
+        with storage.open(name, "rb") as f:
+            image = ImageOps.exif_transpose(Image.open(f))
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, Image.DecompressionBombError):
+        # SVGs (like the default avatar), missing files and images too large
+        # to decode keep the original; retrying wouldn't change that.
+        return
+
+    image = image.convert("RGB")
+    for size, pixels in AVATAR_SIZES.items():
+        thumbnail = ImageOps.fit(image, (pixels, pixels), Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            buffer = BytesIO()
+            thumbnail.save(buffer, **options)
+            target = thumbnail_name(name, size, extension)
+            storage.save_derived(target, ContentFile(buffer.getvalue()))
+
+    # Only flag the avatar as ready if the user hasn't replaced it meanwhile.
+    if User.objects.filter(pk=user_id, avatar=name).update(avatar_thumbnails=name):
+        # Cached fragments still point at the original upload.
+        bump(scope("user", user_id), scope("feed"), scope("activity"))
+
+
+def schedule_thumbnails(user) -> None:
+    """
+    Generate the avatar thumbnails in a task worker once the upload is
+    committed.
+    """
+    generate_thumbnails.enqueue(user_id=user.pk, name=user.avatar.name)
@@ -0,0 +1,223 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Conspect, Upload
+from .storage import content_hash
+from .tasks import task
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# What the upload script sends per request, and the most it may.
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+
+# Read from the request and written to the file this much at a time.
+STREAM_BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+class UploadConflict(Exception):
+    """
+    A chunk that doesn't start where the upload stands; the client should
+    resume from `offset`.
+    """
+
+    def __init__(self, offset: int):
+        super().__init__(f"Expected a chunk at offset {offset}")
+        self.offset = offset
+
+
+def _storage():
+    return Conspect._meta.get_field("file").storage
+
+
+def _sha256(f, length: Optional[int] = None):
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining is None or remaining > 0:
+        block = f.read(
+            HASH_CHUNK_SIZE if remaining is None else min(HASH_CHUNK_SIZE, remaining)
+        )
+        if not block:
+            break
+        digest.update(block)
+        if remaining is not None:
+            remaining -= len(block)
+    return digest
+
+
+@task()
+def process_conspect(conspect_id: int) -> None:
+    """
+    Record the size and SHA-256 of an uploaded conspect file.
+    """
+    conspect = Conspect.objects.filter(pk=conspect_id).first()
+    if conspect is None or not conspect.file:
+        return
+    # Blobs are named after their hash; only older files need reading.
+    sha256 = content_hash(conspect.file.name)
+    if sha256 is None:
+        with conspect.file.open("rb") as f:
+            sha256 = _sha256(f).hexdigest()
+    Conspect.objects.filter(pk=conspect_id, file=conspect.file.name).update(
+        size=conspect.file.size, sha256=sha256
+    )
+
+
+class HasherCache:
+    """
+    The running SHA-256 of the uploads this process is receiving, keyed by
+    token and paired with the offset it has hashed up to. A chunk that lands
+    on another process (or after a restart) rebuilds it from the file once.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.lock = threading.Lock()
+        self.hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = OrderedDict()
+
+    def take(self, upload: Upload):
+        with self.lock:
+            offset, hasher = self.hashers.pop(str(upload.token), (None, None))
+        if offset == upload.received:
+            return hasher
+        with _storage().open(upload.file, "rb") as f:
+            return _sha256(f, upload.received)
+
+    def put(self, upload: Upload, offset: int, hasher) -> None:
+        with self.lock:
+            self.hashers[str(upload.token)] = (offset, hasher)
+            while len(self.hashers) > self.size:
+                self.hashers.popitem(last=False)
+
+
+hashers = HasherCache()
+
+
+def parse_content_range(header: str, upload: Upload) -> Tuple[int, int]:
+    """
+    The offset and length of a chunk from its `Content-Range` header.
+    """
+    match = CONTENT_RANGE.match(header or "")
+    if not match:
+        raise InvalidUpload("Expected a Content-Range: bytes start-end/total header")
+    start, end, total = (int(value) for value in match.groups())
+    if total != upload.size or end < start or end >= total:
+        raise InvalidUpload("The Content-Range doesn't fit the upload")
+    if end - start + 1 > MAX_CHUNK_SIZE:
+        raise InvalidUpload("Chunk too large")
+    return start, end - start + 1
+
+
+def start_upload(author, classroom, filename: str, size: int, description=None):
+    if not filename or size <= 0 or size > MAX_UPLOAD_SIZE:
+        raise InvalidUpload("Invalid file name or size")
+    return Upload.objects.create(
+        author=author,
+        classroom=classroom,
+        description=description,
+        filename=filename,
+        file=_storage().create_incoming(),
+        size=size,
+    )
+
+
+def write_chunk(upload: Upload, offset: int, length: int, stream) -> int:
+    """
+    Append `length` bytes from `stream` at `offset` and return the new
+    offset. A connection that drops mid-chunk keeps what arrived, so the
+    client resumes from there.
+    """
+    with transaction.atomic():
+        # The row stays locked while the chunk is written, so a second
+        # request for the same offset waits, then finds the offset moved
+        # instead of truncating the file under this one. (SQLite has no row
+        # locks; there the update below still lets only one of them count.)
+        upload.received = (
+            Upload.objects.select_for_update()
+            .values_list("received", flat=True)
+            .get(pk=upload.pk)
+        )
+        if offset != upload.received:
+            raise UploadConflict(upload.received)
+
+        hasher = hashers.take(upload)
+        received = 0
+        with open(_storage().path(upload.file), "r+b") as f:
+            f.seek(offset)
+            f.truncate()
+            while received < length:
+                block = stream.read(min(STREAM_BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+                received += len(block)
+
+        end = offset + received
+        moved = Upload.objects.filter(pk=upload.pk, received=offset).update(
+            received=end, updated=timezone.now()
+        )
+        if not moved:
+            raise UploadConflict(Upload.objects.get(pk=upload.pk).received)
+    upload.received = end
+    hashers.put(upload, end, hasher)
+    return end
+
+
+def complete_upload(upload: Upload) -> Conspect:
+    """
+    Turn a fully received upload into a conspect. The file is moved to its
+    content address, so one with the same contents is stored only once.
+    Raises `Upload.DoesNotExist` if another request completed it first.
+    """
+    storage = _storage()
+    field = Conspect._meta.get_field("file")
+    with transaction.atomic():
+        # Held until the upload row is gone, so a second request to complete
+        # it waits and then finds nothing left to do.
+        upload = Upload.objects.select_for_update().get(pk=upload.pk)
+        if upload.received != upload.size:
+            raise UploadConflict(upload.received)
+        sha256 = hashers.take(upload).hexdigest()
+
+        name = storage.save_hashed(
+            field.generate_filename(None, upload.filename),
+            storage.path(upload.file),
+            sha256,
+        )
+        try:
+            with transaction.atomic():
+                conspect = Conspect.objects.create(
+                    author_id=upload.author_id,
+                    classroom_id=upload.classroom_id,
+                    description=upload.description,
+                    file=name,
+                    filename=upload.filename,
+                    size=upload.size,
+                    sha256=sha256,
+                )
+        except Exception:
+            # Drop the reference `save_hashed` took, and with the last one
+            # the file, rather than leave it to `rehash_media`.
+            storage.release(name)
+            raise
+        upload.delete()
+    return conspect
+
+
+def abandon_upload(upload: Upload) -> None:
+    _storage().delete(upload.file)
+    upload.delete()
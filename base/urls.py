@@ -1,6 +1,18 @@
+from django.conf import settings
 from django.urls import path
 
-from base import views
+from base import async_views, views
+
+if settings.ASYNC_VIEWS:
+    home = async_views.home
+    classroom = async_views.classroom
+    topics = async_views.topics
+    activities = async_views.activities
+else:
+    home = views.HomeView.as_view()
+    classroom = views.classroom
+    topics = views.TopicsPageView.as_view()
+    activities = views.ActivitiesPageView.as_view()
 
 urlpatterns = [
     # Authentication
@@ -8,14 +20,34 @@ urlpatterns = [
     path("login/", views.LoginPageView.as_view(), name="login"),
     path("logout/", views.LogoutRedirectView.as_view(), name="logout"),
     # Info
-    path("", views.HomeView.as_view(), name="home"),
-    path("classroom/<str:pk>/", views.classroom, name="classroom"),
+    path("", home, name="home"),
+    path("classroom/<str:pk>/", classroom, name="classroom"),
+    path(
+        "classroom/<str:pk>/messages/",
+        views.classroom_fragment,
+        {"kind": "messages"},
+        name="classroom-messages",
+    ),
+    path(
+        "classroom/<str:pk>/conspects/",
+        views.classroom_fragment,
+        {"kind": "conspects"},
+        name="classroom-conspects",
+    ),
+    path(
+        "classroom/<str:pk>/students/",
+        views.classroom_fragment,
+        {"kind": "students"},
+        name="classroom-students",
+    ),
     path(
         "u/<str:username>/", views.UserProfileDetailView.as_view(), name="user-profile"
     ),
+    path("u/<str:username>/messages/", views.user_messages, name="user-messages"),
     # Markdown-Rendering Pages
     path("about/", views.AboutPageView.as_view(), name="about"),
     path("donate/", views.DonatePageView.as_view(), name="donate"),
+    path("page/<slug:name>/", views.MarkdownPageView.as_view(), name="markdown-page"),
     # CRUD endpoints
     path("create-classroom/", views.create_classroom, name="create-classroom"),
     path("update-classroom/<str:pk>/", views.update_classroom, name="update-classroom"),
@@ -26,7 +58,15 @@ urlpatterns = [
     path("create-conspect/<str:pk>/", views.create_conspect, name="create-conspect"),
     path("delete-conspect/<str:pk>/", views.delete_conspect, name="delete-conspect"),
     path("confirm-payment/<str:pk>/", views.confirm_payment, name="confirm-payment"),
+    path("classroom/<str:pk>/uploads/", views.start_conspect_upload, name="uploads"),
+    path("uploads/<uuid:token>/", views.conspect_upload, name="upload"),
+    path(
+        "uploads/<uuid:token>/complete/",
+        views.complete_conspect_upload,
+        name="upload-complete",
+    ),
     # Mobile/Expanded page
-    path("topics/", views.TopicsPageView.as_view(), name="topics"),
-    path("activities/", views.ActivitiesPageView.as_view(), name="activities"),
+    path("topics/", topics, name="topics"),
+    path("activities/", activities, name="activities"),
+    path("activities/since/", views.activities_since, name="activities-since"),
 ]
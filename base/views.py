@@ -1,70 +1,217 @@
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.paginator import InvalidPage, Paginator
 from django.db.models import Q
-from django.http import FileResponse, HttpResponse
-from django.shortcuts import redirect, render
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.views import View
+from django.views.decorators.http import (
+    require_http_methods,
+    require_POST,
+    require_safe,
+)
 from django.views.generic.base import RedirectView, TemplateView
 from django.views.generic.detail import DetailView
-from django.views.generic.list import ListView
 
-from .forms import (ClassroomForm, ConspectForm, CustomUserCreationForm,
-                    UserForm)
-from .models import Classroom, Conspect, Message, Topic, User
+from .activity import InvalidSince, parse_since, recent_activity
+from .caching import (
+    cached_value,
+    fragment_key,
+    get_fragment,
+    render_fragment,
+    scope,
+    set_fragment,
+)
+from .concurrency import run_concurrently
+from .conditional import collection_validators, condition_on
+from .downloads import serve_blob, serve_file
+from .emails import send_welcome_email
+from .forms import ClassroomForm, ConspectForm, CustomUserCreationForm, UserForm
+from .ledger import InsufficientBalance, has_purchased, purchase_conspect
+from .metrics import registry
+from .models import Classroom, Conspect, Message, Topic, Upload, User
+from .pages import markdown_pages
+from .pagination import InvalidCursor, keyset_page
+from .realtime import message_payload
+from .search import search_classrooms
+from .thumbnails import schedule_thumbnails
+from .uploads import (
+    UPLOAD_CHUNK_SIZE,
+    InvalidUpload,
+    UploadConflict,
+    abandon_upload,
+    complete_upload,
+    parse_content_range,
+    process_conspect,
+    start_upload,
+    write_chunk,
+)
+
+
+def home_validators(request):
+    return collection_validators(
+        request,
+        [(Classroom.objects.all(), "updated"), (Message.objects.all(), "updated")],
+        [scope("feed"), scope("topics"), scope("activity")],
+        [request.GET.get("q", ""), request.GET.get("page", "")],
+    )
+
+
+HOME_PAGE_SIZE = 3
+
+
+def feed_page(paginator: Paginator, number: Optional[str]):
+    """
+    The requested page of `paginator`, with the same rules (and 404s) as
+    `ListView` pagination.
+    """
+    number = number or 1
+    try:
+        page_number = int(number)
+    except ValueError:
+        if number != "last":
+            raise Http404(_("Page is not “last”, nor can it be converted to an int."))
+        page_number = paginator.num_pages
+    try:
+        return paginator.page(page_number)
+    except InvalidPage as error:
+        raise Http404(
+            _("Invalid page (%(page_number)s): %(message)s")
+            % {"page_number": page_number, "message": str(error)}
+        )
 
 
-class HomeView(ListView):
-    template_name: str = "base/home.html"
-    model = Classroom
-    context_object_name: Optional[str] = "classrooms"
-    paginate_by: int = 3
-
-    def get_queryset(self):
-        q = self.request.GET.get("q") if self.request.GET.get("q") is not None else ""
-        user = User.objects.filter(username__icontains=q).first()
-        return Classroom.objects.filter(
-            Q(host=user)
-            | Q(topic__name__icontains=q)
-            | Q(name__icontains=q)
-            | Q(description__icontains=q)
+def home_feed(request, q: str, number: Optional[str]) -> str:
+    key = fragment_key("home-feed", [scope("feed")], [q, number or ""])
+    html = get_fragment("home-feed", key)
+    if html is None:
+        if not q.strip():
+            queryset = Classroom.objects.for_feed()
+        else:
+            queryset = search_classrooms(q).for_feed()
+        paginator = Paginator(queryset, HOME_PAGE_SIZE)
+        page_obj = feed_page(paginator, number)
+        context = {
+            "paginator": paginator,
+            "page_obj": page_obj,
+            "is_paginated": page_obj.has_other_pages(),
+            "classrooms": page_obj.object_list,
+        }
+        html = render_to_string(
+            "components/classroom_feed_component.html", context, request
         )
+        set_fragment(key, html)
+    return html
+
+
+def topics_sidebar(request, limit: Optional[int] = None) -> str:
+    return render_fragment(
+        request,
+        "topics-sidebar",
+        "components/topics_component.html",
+        lambda: {"topics": Topic.objects.all()[0:limit]},
+        [scope("topics")],
+        [limit],
+    )
+
+
+def home_activity(request, q: str) -> str:
+    return render_fragment(
+        request,
+        "activity-sidebar",
+        "components/activities_component.html",
+        lambda: {
+            "classroom_messages": Message.objects.for_activity().filter(
+                Q(classroom__topic__name__icontains=q)
+            )[0:5]
+        },
+        [scope("activity")],
+        [q],
+    )
+
+
+def home_context(request) -> Dict[str, Callable[[], Any]]:
+    """
+    The independent parts of the home page, each loaded by its callable,
+    so the views can load them all at once.
+    """
+    q = request.GET.get("q") or ""
+    number = request.GET.get("page")
+    return {
+        "feed_html": lambda: home_feed(request, q, number),
+        "topics_html": lambda: topics_sidebar(request, 5),
+        "classroom_count": lambda: cached_value(
+            "classroom-count", Classroom.objects.count, [scope("feed")]
+        ),
+        "activity_html": lambda: home_activity(request, q),
+    }
 
-    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
-        q = self.request.GET.get("q") if self.request.GET.get("q") is not None else ""
 
+@method_decorator(condition_on(home_validators), name="get")
+class HomeView(TemplateView):
+    template_name: str = "base/home.html"
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        context["topics"] = Topic.objects.all()[0:5]
-        context["classroom_count"] = Classroom.objects.count()
-        context["classroom_messages"] = Message.objects.filter(
-            Q(classroom__topic__name__icontains=q)
-        )[0:5]
+        # Load the user before the parts render in other threads.
+        self.request.user.is_authenticated
+        parts = home_context(self.request)
+        context.update(zip(parts, run_concurrently(*parts.values())))
         return context
 
 
-def read_markdown(filename: str):
-    with open(settings.BASE_DIR / f"static/markdown/{filename}.md", "r") as f:
-        context = {"markdown_content": f.read()}
-    return context
+class MarkdownPageView(TemplateView):
+    """
+    Serve a pre-rendered page from `static/markdown/`, answering conditional
+    GETs with 304 while the file and the visitor's navbar are unchanged.
+    """
 
+    template_name: str = "base/markdown_page.html"
+    page_name: Optional[str] = None
 
-class AboutPageView(TemplateView):
-    template_name: str = "base/about.html"
+    def get(self, request, *args, **kwargs):
+        page = markdown_pages.get(self.page_name or kwargs.get("name", ""))
+        if page is None:
+            raise Http404(_("Page not found"))
 
-    def get_context_data(self) -> Dict[str, Any]:
-        return read_markdown("about")
+        # The navbar differs per visitor and language, so both are part of
+        # the validator alongside the file contents. The file's mtime isn't:
+        # it would answer If-Modified-Since alike for every visitor.
+        etag = quote_etag(f"{page.etag}-{get_language()}-{request.user.pk or 0}")
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            context = self.get_context_data(markdown_html=page.html, **kwargs)
+            response = self.render_to_response(context)
+        response.headers["ETag"] = etag
+        patch_vary_headers(response, ["Cookie", "Accept-Language"])
+        return response
 
 
-class DonatePageView(TemplateView):
-    template_name: str = "base/donate.html"
+class AboutPageView(MarkdownPageView):
+    template_name: str = "base/about.html"
+    page_name: Optional[str] = "about"
 
-    def get_context_data(self) -> Dict[str, Any]:
-        return read_markdown("donate")
+
+class DonatePageView(MarkdownPageView):
+    template_name: str = "base/donate.html"
+    page_name: Optional[str] = "donate"
 
 
 class RegisterPageView(View):
@@ -79,6 +226,7 @@ class RegisterPageView(View):
             user = form.save(commit=False)
             user.username = user.username.lower()
             user.save()
+            send_welcome_email.enqueue(user_id=user.pk, language=get_language())
             # Login after registration
             login(request, user)
             return redirect("home")
@@ -120,12 +268,62 @@ class LogoutRedirectView(RedirectView):
         return super().get_redirect_url(*args, **kwargs)
 
 
+CLASSROOM_PAGE_SIZE = 20
+
+CLASSROOM_STREAMS = {
+    "messages": (
+        lambda classroom: classroom.message_set.select_related("author"),
+        ("-updated", "-created", "-id"),
+        "components/message_list_component.html",
+    ),
+    "conspects": (
+        lambda classroom: classroom.conspect_set.select_related("author"),
+        ("-created", "-id"),
+        "components/conspect_list_component.html",
+    ),
+    "students": (
+        lambda classroom: classroom.students.all(),
+        ("username",),
+        "components/student_list_component.html",
+    ),
+}
+
+
+def classroom_stream(classroom, kind: str, cursor: Optional[str] = None):
+    queryset, ordering, _template = CLASSROOM_STREAMS[kind]
+    return keyset_page(queryset(classroom), ordering, cursor, CLASSROOM_PAGE_SIZE)
+
+
+def classroom_context(classroom) -> Dict[str, Callable[[], Any]]:
+    """
+    The independent parts of a classroom page, as in `home_context`.
+    """
+    return {
+        "messages_page": lambda: classroom_stream(classroom, "messages"),
+        "conspects_page": lambda: classroom_stream(classroom, "conspects"),
+        "students_page": lambda: classroom_stream(classroom, "students"),
+        "conspect_count": classroom.conspect_set.count,
+    }
+
+
+def classroom_validators(request, pk):
+    return collection_validators(
+        request,
+        [
+            (Classroom.objects.filter(pk=pk), "updated"),
+            (Message.objects.filter(classroom_id=pk), "updated"),
+            (Conspect.objects.filter(classroom_id=pk), "created"),
+        ],
+        [scope("classroom", pk)],
+    )
+
+
+@condition_on(classroom_validators)
 def classroom(request, pk):
     author = request.user
-    classroom = Classroom.objects.get(id=pk)
-    classroom_messages = classroom.message_set.all()
-    classroom_conspects = classroom.conspect_set.all()
-    students = classroom.students.all()
+    classroom = get_object_or_404(
+        Classroom.objects.select_related("host", "topic"), id=pk
+    )
 
     if request.method == "POST":
         Message.objects.create(
@@ -136,39 +334,106 @@ def classroom(request, pk):
         classroom.students.add(author)
         return redirect("classroom", pk=classroom.id)
 
-    context = {
-        "classroom": classroom,
-        "classroom_messages": classroom_messages,
-        "classroom_conspects": classroom_conspects,
-        "students": students,
-    }
+    parts = classroom_context(classroom)
+    context = {"classroom": classroom}
+    context.update(zip(parts, run_concurrently(*parts.values())))
     return render(request, "base/classroom.html", context)
 
 
+def classroom_fragment(request, pk, kind):
+    """
+    The next page of a classroom stream, rendered as an HTML fragment.
+    """
+    classroom = get_object_or_404(Classroom, id=pk)
+    try:
+        page = classroom_stream(classroom, kind, request.GET.get("before"))
+    except InvalidCursor:
+        return HttpResponseBadRequest(_("Invalid cursor"))
+    context = {"classroom": classroom, "page": page}
+    return render(request, CLASSROOM_STREAMS[kind][2], context)
+
+
+PROFILE_MESSAGES_PAGE_SIZE = 10
+
+
+def user_message_page(user, cursor: Optional[str] = None):
+    return keyset_page(
+        user.message_set.for_activity(),
+        ("-updated", "-created", "-id"),
+        cursor,
+        PROFILE_MESSAGES_PAGE_SIZE,
+    )
+
+
+def profile_validators(request, username):
+    user = User.objects.with_username(username).only("pk").first()
+    if user is None:
+        return collection_validators(request, [], vary_on=[username])
+    return collection_validators(
+        request,
+        [
+            (user.classroom_set.all(), "updated"),
+            (user.message_set.all(), "updated"),
+        ],
+        [scope("user", user.pk), scope("topics"), scope("activity")],
+        [request.GET.get("page", "")],
+    )
+
+
+@method_decorator(condition_on(profile_validators), name="get")
 class UserProfileDetailView(DetailView):
     model = User
     template_name: str = "base/profile.html"
-    slug_field = "username"
-    slug_url_kwarg = "username"
 
-    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
-        user = User.objects.filter(
-            username__icontains=self.kwargs.get("username")
-        ).first()
-        classrooms = user.classroom_set.all()
+    def get_object(self, queryset=None):
+        return get_object_or_404(User.objects.with_username(self.kwargs["username"]))
 
-        paginator = Paginator(classrooms, 3)
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        user = self.object
         number = self.request.GET.get("page")
-        page_obj = paginator.get_page(number)
+        user_scope = scope("user", user.pk)
 
         context = super().get_context_data(**kwargs)
-        context["user"] = user
-        context["page_obj"] = page_obj
-        context["classroom_messages"] = user.message_set.all()
-        context["topics"] = Topic.objects.all()
+        context["feed_html"] = render_fragment(
+            self.request,
+            "profile-feed",
+            "components/classroom_feed_component.html",
+            lambda: {
+                "page_obj": Paginator(user.classroom_set.for_feed(), 3).get_page(number)
+            },
+            [user_scope, scope("topics")],
+            [number],
+        )
+        context["activity_html"] = render_fragment(
+            self.request,
+            "profile-activity",
+            "components/activities_component.html",
+            lambda: {
+                "classroom_messages": user_message_page(user),
+                "more_url": reverse("user-messages", args=[user.username]),
+            },
+            [user_scope, scope("activity")],
+        )
+        context["topics_html"] = topics_sidebar(self.request)
         return context
 
 
+def user_messages(request, username):
+    """
+    The next page of a user's message history, rendered as an HTML fragment.
+    """
+    user = get_object_or_404(User.objects.with_username(username))
+    try:
+        page = user_message_page(user, request.GET.get("before"))
+    except InvalidCursor:
+        return HttpResponseBadRequest(_("Invalid cursor"))
+    context = {
+        "page": page,
+        "more_url": reverse("user-messages", args=[user.username]),
+    }
+    return render(request, "components/activity_list_component.html", context)
+
+
 @login_required(login_url="login")
 def create_classroom(request):
     form = ClassroomForm()
@@ -201,13 +466,92 @@ def create_conspect(request, pk):
                 file=request.FILES["file"],
             )
             instance.save()
+            process_conspect.enqueue(conspect_id=instance.pk)
             return redirect("classroom", pk=classroom.id)
     else:
         form = ConspectForm()
-    context = {"form": form}
+    context = {"form": form, "upload_url": reverse("uploads", args=[pk])}
     return render(request, "base/conspect_form.html", context)
 
 
+def upload_status(upload: Upload) -> Dict[str, Any]:
+    return {
+        "url": reverse("upload", args=[upload.token]),
+        "complete_url": reverse("upload-complete", args=[upload.token]),
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "size": upload.size,
+        "received": upload.received,
+    }
+
+
+@login_required(login_url="login")
+@require_POST
+def start_conspect_upload(request, pk):
+    """
+    Begin a chunked upload; the client then PUTs the file to the returned
+    `url` in order, one `Content-Range` at a time.
+    """
+    classroom = get_object_or_404(Classroom, id=pk)
+    try:
+        upload = start_upload(
+            request.user,
+            classroom,
+            request.POST.get("filename", ""),
+            int(request.POST.get("size", 0)),
+            request.POST.get("description") or None,
+        )
+    except (InvalidUpload, ValueError):
+        return HttpResponseBadRequest(_("Invalid upload"))
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required(login_url="login")
+@require_http_methods(["GET", "PUT", "DELETE"])
+def conspect_upload(request, token):
+    """
+    GET tells how much arrived, so an interrupted client resumes from
+    there; PUT sends the next chunk; DELETE abandons the upload.
+    """
+    upload = get_object_or_404(Upload, token=token, author=request.user)
+    if request.method == "DELETE":
+        abandon_upload(upload)
+        return HttpResponse(status=204)
+    if request.method == "PUT":
+        try:
+            offset, length = parse_content_range(
+                request.headers.get("Content-Range"), upload
+            )
+            write_chunk(upload, offset, length, request)
+        except Upload.DoesNotExist:
+            raise Http404(_("Upload not found"))
+        except InvalidUpload as e:
+            return HttpResponseBadRequest(str(e))
+        except UploadConflict as e:
+            upload.received = e.offset
+            return JsonResponse(upload_status(upload), status=409)
+    return JsonResponse(upload_status(upload))
+
+
+@login_required(login_url="login")
+@require_POST
+def complete_conspect_upload(request, token):
+    upload = get_object_or_404(Upload, token=token, author=request.user)
+    try:
+        conspect = complete_upload(upload)
+    except Upload.DoesNotExist:
+        raise Http404(_("Upload not found"))
+    except UploadConflict as e:
+        upload.received = e.offset
+        return JsonResponse(upload_status(upload), status=409)
+    return JsonResponse(
+        {
+            "conspect": conspect.pk,
+            "redirect": reverse("classroom", args=[conspect.classroom_id]),
+        },
+        status=201,
+    )
+
+
 @login_required(login_url="login")
 def update_classroom(request, pk):
     classroom = Classroom.objects.get(id=pk)
@@ -233,21 +577,21 @@ def update_classroom(request, pk):
 @login_required(login_url="login")
 def confirm_payment(request, pk):
     user = request.user
-    conspect = Conspect.objects.get(id=pk)
-
-    def open_conspect(conspect):
-        return FileResponse(open(f"{settings.BASE_DIR}/static/{conspect}", "rb"))
+    conspect = get_object_or_404(Conspect, id=pk)
 
-    if user == conspect.author:
-        return open_conspect(conspect)
+    # Authors and past buyers download directly, which also lets clients
+    # resume an interrupted download with a Range request.
+    if user == conspect.author or has_purchased(user, conspect):
+        return serve_file(request, conspect.file, conspect.display_name)
 
     if request.method == "POST":
-        user.balance -= 100
-        conspect.author.balance += 100
-        user.save()
-        conspect.author.save()
+        try:
+            purchase_conspect(user, conspect)
+        except InsufficientBalance:
+            messages.error(request, _("Not enough balance to buy this conspect."))
+            return redirect("classroom", pk=conspect.classroom_id)
         messages.info(request, _("Purchase has been successfully done."))
-        return open_conspect(conspect)
+        return serve_file(request, conspect.file, conspect.display_name)
 
     context = {"obj": conspect}
     return render(request, "base/confirm.html", context)
@@ -307,12 +651,21 @@ def update_user(request):
         form = UserForm(request.POST, request.FILES, instance=user)
         if form.is_valid():
             form.save()
+            if "avatar" in form.changed_data and user.avatar:
+                schedule_thumbnails(user)
             return redirect("home")
 
     context = {"form": form}
     return render(request, "base/update_user.html", context)
 
 
+def topics_validators(request):
+    return collection_validators(
+        request, [], [scope("topics")], [request.GET.get("q", "")]
+    )
+
+
+@method_decorator(condition_on(topics_validators), name="get")
 class TopicsPageView(TemplateView):
     template_name: str = "base/topics.html"
 
@@ -323,10 +676,63 @@ class TopicsPageView(TemplateView):
         return context
 
 
+def activities_validators(request):
+    return collection_validators(
+        request, [(Message.objects.all(), "updated")], [scope("activity")]
+    )
+
+
+@method_decorator(condition_on(activities_validators), name="get")
 class ActivitiesPageView(TemplateView):
     template_name: str = "base/activities.html"
 
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        context["classroom_messages"] = Message.objects.all()
+        context["activity"] = recent_activity()
         return context
+
+
+def activities_since(request):
+    """
+    Messages posted after the `since` cursor, as JSON or an HTML fragment.
+    """
+    try:
+        activity = recent_activity(parse_since(request.GET.get("since")))
+    except InvalidSince:
+        return HttpResponseBadRequest(_("Invalid cursor"))
+
+    if request.GET.get("format") == "json":
+        response = JsonResponse(
+            {
+                "cursor": str(activity.cursor),
+                "reset": activity.reset,
+                "messages": [message_payload(message) for message in activity],
+            }
+        )
+    else:
+        response = render(
+            request,
+            "components/activity_feed_component.html",
+            {"classroom_messages": activity},
+        )
+    response["X-Activity-Cursor"] = str(activity.cursor)
+    response["X-Activity-Reset"] = "1" if activity.reset else "0"
+    return response
+
+
+def metrics(request):
+    """
+    Per-URL-name request metrics of this process, in the Prometheus text
+    format, for internal addresses and staff only.
+    """
+    internal = request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+    if not (internal or request.user.is_staff):
+        raise Http404
+    return HttpResponse(
+        registry.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@require_safe
+def blob(request, name):
+    return serve_blob(request, User._meta.get_field("avatar").storage, name)
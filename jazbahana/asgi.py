@@ -2,6 +2,13 @@
 ASGI config for jazbahana project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections go to the classroom chat.
+Set ASYNC_VIEWS=1 to serve the read-heavy pages from the coroutine views.
+
+The Procfile deploys the WSGI application; to serve the chat as well, run
+this one with uvicorn workers under gunicorn instead:
+
+    gunicorn jazbahana.asgi:application -k uvicorn.workers.UvicornWorker
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
@@ -13,4 +20,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "jazbahana.settings.dev")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from base.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
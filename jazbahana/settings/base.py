@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
+
 from pathlib import Path
 
 import dj_database_url
@@ -42,7 +43,8 @@ AUTH_USER_MODEL = "base.User"
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "base.middleware.WhiteNoiseMiddleware",
+    "base.middleware.PerformanceMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -56,7 +58,8 @@ ROOT_URLCONF = "jazbahana.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django's backend, with render times reported to the metrics.
+        "BACKEND": "base.metrics.InstrumentedDjangoTemplates",
         "DIRS": [
             BASE_DIR / "templates",
         ],
@@ -74,6 +77,35 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "jazbahana.wsgi.application"
 
+ASGI_APPLICATION = "jazbahana.asgi.application"
+
+# Route the read-heavy pages to the coroutine views in base.async_views.
+# Only worth it under an ASGI server with a database far enough away that
+# overlapping round-trips beats the cost of the thread hops (benchmark_async).
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
+
+# Background tasks (base.tasks) are run by `manage.py run_tasks` workers;
+# TASKS_RUN_INLINE runs them in the enqueuing request instead, for tests.
+TASKS_RUN_INLINE = config("TASKS_RUN_INLINE", default=False, cast=bool)
+
+EMAIL_BACKEND = config(
+    "EMAIL_BACKEND", default="django.core.mail.backends.smtp.EmailBackend"
+)
+DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+
+# Threads per process that run a page's independent queries at once (see
+# base.concurrency.run_concurrently); each holds a database connection.
+# 0 runs them one after the other.
+# Connections persist (conn_max_age below), so a sync worker process keeps
+# up to CONCURRENT_QUERIES + 1 of them open, and an ASGI one more, since
+# `gather` runs on asgiref's threads. PostgreSQL's max_connections must allow
+# for the web workers times that, plus the task workers.
+CONCURRENT_QUERIES = config("CONCURRENT_QUERIES", default=4, cast=int)
+
+# Fan-out for classroom WebSockets. The in-memory broker only reaches sockets
+# held by the same process; swap it for a shared backend when scaling out.
+REALTIME_BROKER = "base.realtime.InMemoryBroker"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
@@ -146,6 +178,37 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_ROOT = BASE_DIR / STATIC_URL / MEDIA_URL
 
+# Uploaded conspects and avatars are stored by content, outside the static
+# files (see `base.storage.BlobStorage`). Only the avatars are served from
+# BLOB_URL; conspects go through the purchase check.
+# The task workers read and write these files too, so they must run where
+# BLOB_ROOT is: on Heroku, inside the web dyno (see the Procfile).
+DEFAULT_FILE_STORAGE = "base.storage.BlobStorage"
+BLOB_ROOT = Path(config("BLOB_ROOT", default=str(BASE_DIR / "blobs")))
+BLOB_URL = "/blobs/"
+BLOB_PUBLIC_PREFIXES = ["avatars"]
+
+# Hand conspect downloads to the front proxy instead of streaming them from a
+# worker: "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd).
+FILE_DOWNLOAD_OFFLOAD = config("FILE_DOWNLOAD_OFFLOAD", default=None)
+# Internal nginx location that maps onto BLOB_ROOT.
+FILE_DOWNLOAD_ACCEL_PREFIX = "/protected/"
+
+
+# Performance metrics
+
+# Per-request instrumentation (see `base.middleware.PerformanceMiddleware`).
+# The Server-Timing header tells every visitor how long the database and
+# templates took, so it is off unless asked for (dev.py turns it on), and so
+# is tracing memory, which slows every request down.
+PERFORMANCE_SERVER_TIMING = config(
+    "PERFORMANCE_SERVER_TIMING", default=False, cast=bool
+)
+PERFORMANCE_TRACE_MEMORY = config("PERFORMANCE_TRACE_MEMORY", default=False, cast=bool)
+
+# Addresses allowed to scrape /metrics/ without a staff login.
+INTERNAL_IPS = ["127.0.0.1"]
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -163,7 +226,7 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.CursorPagination",
     "PAGE_SIZE": 10,
 }
 
@@ -7,3 +7,29 @@ from .base import *
 DEBUG = True
 
 ALLOWED_HOSTS = ["*"]
+
+# Local development and the test runner don't need a memcached daemon.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# The test runner turns DEBUG off, when the manifest storage would need a
+# collectstatic run first.
+STATICFILES_STORAGE = "django.contrib.staticfiles.storage.StaticFilesStorage"
+
+# Sent mail stays in memory (django.core.mail.outbox) of the task worker.
+EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+
+# Per-request timings in the browser's developer tools.
+PERFORMANCE_SERVER_TIMING = config("PERFORMANCE_SERVER_TIMING", default=True, cast=bool)
+
+# Log the repeated statement shapes (N+1) and slow queries of each request.
+MIDDLEWARE = MIDDLEWARE + ["base.middleware.QueryDebugMiddleware"]
+
+QUERY_DEBUG = {
+    "REPEAT_THRESHOLD": config("QUERY_DEBUG_REPEAT_THRESHOLD", default=5, cast=int),
+    "SLOW_QUERY_MS": config("QUERY_DEBUG_SLOW_QUERY_MS", default=100, cast=int),
+    "RAISE": config("QUERY_DEBUG_RAISE", default=False, cast=bool),
+}
@@ -13,13 +13,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+
 from django.conf import settings
 from django.conf.urls.i18n import i18n_patterns
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from base.views import blob, metrics
+
 urlpatterns = [
+    path("metrics/", metrics, name="metrics"),
+    path(f"{settings.BLOB_URL.strip('/')}/<path:name>", blob, name="blob"),
     path("admin/", admin.site.urls),
     path("api/v1/", include("api.urls")),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
@@ -24,6 +24,145 @@ const conversationThread = document.querySelector(".classroom__box");
 if (conversationThread)
   conversationThread.scrollTop = conversationThread.scrollHeight;
 
+// ===== Load Older Messages/Conspects/Students =====
+document.addEventListener("click", async (event) => {
+  const link = event.target.closest(".load-older");
+  if (!link) return;
+
+  event.preventDefault();
+  const response = await fetch(link.href);
+  if (response.ok) link.outerHTML = await response.text();
+});
+
+// ===== Live Classroom Chat =====
+const classroomThreads = document.getElementById("classroom-threads");
+const messageForm = document.getElementById("classroom-message-form");
+
+if (classroomThreads && "WebSocket" in window) {
+  const scheme = location.protocol === "https:" ? "wss://" : "ws://";
+  const socket = new WebSocket(scheme + location.host + classroomThreads.dataset.socket);
+
+  socket.addEventListener("message", (event) => {
+    const message = JSON.parse(event.data);
+    if (message.type !== "message") return;
+
+    const thread = document.createElement("div");
+    thread.className = "thread";
+    thread.innerHTML = `
+      <div class="thread__top">
+        <div class="thread__author">
+          <a class="thread__authorInfo">
+            <div class="avatar avatar--small"><img /></div>
+            <span></span>
+          </a>
+        </div>
+      </div>
+      <div class="thread__details"></div>`;
+    thread.querySelector("img").src = message.avatar;
+    thread.querySelector(".thread__authorInfo span").textContent = "@" + message.author;
+    thread.querySelector(".thread__details").innerHTML = message.body_html;
+    classroomThreads.prepend(thread);
+  });
+
+  if (messageForm) {
+    messageForm.addEventListener("submit", (event) => {
+      if (socket.readyState !== WebSocket.OPEN) return;
+
+      event.preventDefault();
+      const input = messageForm.querySelector("input[name=body]");
+      socket.send(JSON.stringify({ body: input.value }));
+      input.value = "";
+    });
+  }
+}
+
+// ===== Poll Recent Activities =====
+const activityFeed = document.getElementById("activity-feed");
+
+if (activityFeed) {
+  setInterval(async () => {
+    const url = `${activityFeed.dataset.since}?since=${activityFeed.dataset.cursor}`;
+    const response = await fetch(url);
+    if (!response.ok) return;
+
+    const html = await response.text();
+    if (response.headers.get("X-Activity-Reset") === "1") activityFeed.innerHTML = html;
+    else activityFeed.insertAdjacentHTML("afterbegin", html);
+    activityFeed.dataset.cursor = response.headers.get("X-Activity-Cursor");
+  }, 15000);
+}
+
+// ===== Chunked Conspect Upload =====
+const uploadForm = document.querySelector("form[data-upload-url]");
+
+async function uploadRequest(url, options) {
+  // Retry network errors and server hiccups with backoff; the server keeps
+  // what arrived, so a retried chunk resumes where it stopped.
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(url, options);
+      if (response.status < 500 || attempt >= 5) return response;
+    } catch (error) {
+      if (attempt >= 5) throw error;
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt));
+  }
+}
+
+if (uploadForm && "fetch" in window) {
+  uploadForm.addEventListener("submit", async (event) => {
+    const [file] = uploadForm.querySelector("input[type=file]").files;
+    if (!file) return;
+
+    event.preventDefault();
+    const csrf = uploadForm.querySelector("input[name=csrfmiddlewaretoken]").value;
+    const headers = { "X-CSRFToken": csrf };
+    const progress = uploadForm.querySelector(".upload-progress");
+    const key = `upload:${uploadForm.dataset.uploadUrl}:${file.name}:${file.size}:${file.lastModified}`;
+
+    // Resume an upload of the same file interrupted earlier, if any.
+    let upload = null;
+    const saved = localStorage.getItem(key);
+    if (saved) {
+      const response = await uploadRequest(saved, { headers });
+      if (response.ok) upload = await response.json();
+    }
+    if (!upload) {
+      const body = new FormData();
+      body.append("filename", file.name);
+      body.append("size", file.size);
+      const description = uploadForm.querySelector("[name=description]");
+      if (description) body.append("description", description.value);
+      const response = await uploadRequest(uploadForm.dataset.uploadUrl, {
+        method: "POST",
+        headers,
+        body,
+      });
+      if (!response.ok) return uploadForm.submit();
+      upload = await response.json();
+      localStorage.setItem(key, upload.url);
+    }
+
+    progress.hidden = false;
+    while (upload.received < upload.size) {
+      const end = Math.min(upload.received + upload.chunk_size, upload.size);
+      const response = await uploadRequest(upload.url, {
+        method: "PUT",
+        headers: { ...headers, "Content-Range": `bytes ${upload.received}-${end - 1}/${upload.size}` },
+        body: file.slice(upload.received, end),
+      });
+      if (!response.ok && response.status !== 409) return;
+      upload = await response.json();
+      progress.value = (100 * upload.received) / upload.size;
+    }
+
+    const response = await uploadRequest(upload.complete_url, { method: "POST", headers });
+    if (!response.ok) return;
+    localStorage.removeItem(key);
+    location.href = (await response.json()).redirect;
+  });
+}
+
 // ===== Toggle Light Theme =====
 const themeSwitcher = document.getElementById("theme-switch");
 